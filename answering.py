@@ -0,0 +1,140 @@
+# Файл answering.py
+import logging
+
+from inference_pool import InferenceOverloaded, InferenceTimeout
+from profiling import stage
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerPipeline:
+    """Решение по вопросу: поиск в разделе с расширением на всю базу, каскад
+    кросс-энкодера и повтор с исправленными раскладкой и опечатками.
+
+    Одно и то же решение у сервера, теневой проверки и replay.py --in-process;
+    индекс и словарь исправления - фонда запроса, поэтому передаются в вызов.
+    record=False - теневая проверка: без счетчиков и журнала, кросс-энкодер
+    вызывается мимо своего пула.
+    """
+
+    def __init__(self, threshold, reranker=None, rerank_band=None, rerank_top_k=5, scoped_fallback=True):
+        self.threshold = threshold
+        self.reranker = reranker
+        self.rerank_low, self.rerank_high = rerank_band or (threshold - 0.1, threshold + 0.05)
+        self.rerank_top_k = rerank_top_k
+        self.scoped_fallback = scoped_fallback
+
+    def rerank_ambiguous(self, index, result, embedding, question, group_id=None, intent=None, record=True):
+        """Второй этап каскада для запросов в полосе [rerank_low, rerank_high).
+
+        Вне полосы решает би-энкодер. Возвращает (результат, решение): решение True/False
+        принято кросс-энкодером, None - остается за порогом.
+        """
+        reranker = self.reranker
+        if record:
+            reranker.count('queries')
+        if not result or not self.rerank_low <= result['similarity'] < self.rerank_high:
+            return result, None
+        if record:
+            reranker.count('ambiguous')
+
+        # Несколько вариантов одного вопроса занимают одного кандидата
+        candidates, seen = [], set()
+        for candidate in index.search(embedding, text=question, top_k=self.rerank_top_k * 3,
+                                      group_id=group_id, intent=intent):
+            if candidate['std_question_id'] not in seen:
+                seen.add(candidate['std_question_id'])
+                candidates.append(candidate)
+        candidates = candidates[:self.rerank_top_k]
+
+        try:
+            best = reranker.rerank(question, candidates, record=record)
+        except (InferenceOverloaded, InferenceTimeout):
+            if record:
+                reranker.count('fallback')
+                logger.warning("Пул кросс-энкодера перегружен, решение по порогу би-энкодера")
+            return result, None
+        if best is None:
+            return result, False
+        if record and best['std_question_id'] != result['std_question_id']:
+            reranker.count('changed')
+        return best, True
+
+    def find(self, index, embedding, question, group_id=None, intent=None, record=True):
+        """Ближайший вопрос (с расширением поиска на всю базу и каскадом): (результат, решение)"""
+        with stage('search'):
+            result = index.find_closest(embedding, text=question, group_id=group_id, intent=intent)
+            scoped = group_id is not None or intent is not None
+            result_scope = (group_id, intent)
+            if (scoped and self.scoped_fallback and
+                    (not result or result['similarity'] < self.threshold)):
+                # В выбранном разделе уверенного ответа нет - ищем по всей базе
+                if record:
+                    logger.info("В разделе не найдено уверенного совпадения, поиск по всей базе")
+                unscoped = index.find_closest(embedding, text=question)
+                if unscoped and (not result or unscoped['similarity'] > result['similarity']):
+                    result = unscoped
+                    result_scope = (None, None)
+
+        # Каскад: в неоднозначной полосе ответ выбирает кросс-энкодер
+        decision = None
+        if self.reranker is not None:
+            with stage('rerank'):
+                result, decision = self.rerank_ambiguous(index, result, embedding, question, *result_scope,
+                                                         record=record)
+        if decision is None:
+            decision = bool(result) and result['similarity'] >= self.threshold
+        return result, decision
+
+    def answer(self, index, encode, embedding, question, group_id=None, intent=None, spelling=None, record=True):
+        """Решение по вопросу; если он не прошел порог - повтор с исправленным вопросом.
+
+        encode(text) кодирует исправленный вопрос. Возвращает (результат, решение,
+        вопрос, эмбеддинг) - исправленные вопрос и эмбеддинг, если ответ найден по ним.
+        """
+        result, decision = self.find(index, embedding, question, group_id, intent, record)
+        if decision or spelling is None:
+            return result, decision, question, embedding
+
+        with stage('spelling'):
+            corrected_question = spelling.correct(question, record=record)
+        if corrected_question == question:
+            return result, decision, question, embedding
+        corrected_embedding = encode(corrected_question)
+        corrected_result, corrected_decision = self.find(
+            index, corrected_embedding, corrected_question, group_id, intent, record
+        )
+        if not corrected_decision:
+            return result, decision, question, embedding
+        if record:
+            logger.info(f"Вопрос исправлен: '{question}' -> '{corrected_question}'")
+            spelling.stats['answered'] += 1
+        return corrected_result, corrected_decision, corrected_question, corrected_embedding
+
+
+def pipeline_from_settings(settings, reranker=None, threshold=None):
+    """AnswerPipeline с настройками из модуля config (settings); threshold переопределяет порог"""
+    return AnswerPipeline(
+        settings.SIMILARITY_THRESHOLD if threshold is None else threshold,
+        reranker=reranker,
+        rerank_band=(settings.RERANK_BAND_LOW, settings.RERANK_BAND_HIGH),
+        rerank_top_k=settings.RERANK_TOP_K,
+        scoped_fallback=settings.SCOPED_SEARCH_FALLBACK
+    )
+
+
+def reranker_from_settings(settings):
+    """Кросс-энкодер каскада по настройкам config или None, если RERANK_MODEL_PATH не задан"""
+    if not settings.RERANK_MODEL_PATH:
+        return None
+    from reranker import CrossEncoderReranker
+    return CrossEncoderReranker(
+        settings.RERANK_MODEL_PATH,
+        threshold=settings.RERANK_THRESHOLD,
+        workers=settings.RERANK_WORKERS,
+        threads_per_worker=settings.INFERENCE_THREADS_PER_WORKER,
+        queue_size=settings.RERANK_QUEUE_SIZE,
+        timeout_ms=settings.RERANK_TIMEOUT_MS,
+        max_batch=settings.RERANK_MAX_BATCH,
+        cache_size=settings.RERANK_CACHE_SIZE
+    )
@@ -2,12 +2,17 @@
 import os
 from dotenv import load_dotenv
 import time
-from flask import Flask, request, jsonify, session
+from flask import Flask, request, jsonify, session, g
 import secrets
+import hmac
+import threading
+import cProfile
+from functools import wraps
 import traceback  # Добавьте эту строку
 import logging
 import signal
 import sys
+import atexit
 
 # Загрузка переменных окружения ПЕРВЫМ делом
 load_dotenv()
@@ -17,9 +22,25 @@ import config
 
 # Остальные импорты
 os.environ["TOKENIZERS_PARALLELISM"] = "false" if not config.DEBUG else "true"
-from database import Database
+from storage import open_storage
 from embedding_model import EmbeddingModel
-from utils import array_to_blob
+from inference_pool import InferencePool, InferenceOverloaded, InferenceTimeout
+from search_index import index_from_settings
+from pending_dedup import PendingDeduplicator
+from question_log import QuestionLog, Spool
+from stats_rollup import read_stats
+from answering import pipeline_from_settings, reranker_from_settings
+from related_questions import RelatedQuestions
+from spelling import SpellCorrector, vocabulary_texts
+from tenants import Tenant, TenantRegistry, parse_mapping
+from sharding import ShardPool, ShardedIndex, ShardError, ShardsUnavailable, parse_address
+from shadow import ShadowEvaluator
+from profiling import (
+    SamplingProfiler, SlowRequestLog, start_request_timer, finish_request_timer, stage,
+    model_memory_bytes, process_rss_bytes
+)
+from utils import array_to_blob, query_embedding_to_blob
+import numpy as np
 import logging
 import signal
 import sys
@@ -31,19 +52,251 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'default-secret-key')
 
-# Инициализация базы данных и модели
-logger.info("Инициализация подключения к БД...")
-db = Database(
-    config.DB_HOST, 
-    config.DB_USER, 
-    config.DB_PASSWORD, 
-    config.DB_NAME
-)
+# Общая для всех фондов модель
 embedder = EmbeddingModel(config.MODEL_PATH)
 
+# Все обращения к модели из запросов идут через ограниченный пул
+inference_pool = InferencePool(
+    embedder,
+    workers=config.INFERENCE_WORKERS,
+    threads_per_worker=config.INFERENCE_THREADS_PER_WORKER,
+    queue_size=config.INFERENCE_QUEUE_SIZE,
+    timeout_ms=config.INFERENCE_TIMEOUT_MS,
+    max_batch=config.INFERENCE_MAX_BATCH
+)
+
+def create_search_index(mode=None, quantization=None, ann=None, compression=None, pca_path=None):
+    """Пустой индекс с настройками из config; аргументы переопределяют их для кандидата"""
+    return index_from_settings(config, mode=mode, quantization=quantization, ann=ann,
+                               compression=compression, pca_path=pca_path)
+
+def start_shards():
+    """Пул шардов индекса: удаленные по SHARD_ADDRESSES или SEARCH_SHARDS локальных процессов"""
+    options = dict(
+        timeout_ms=config.SHARD_TIMEOUT_MS,
+        min_responses=config.SHARD_MIN_RESPONSES,
+        load_timeout=config.SHARD_LOAD_TIMEOUT_S,
+        retry_seconds=config.SHARD_RETRY_SECONDS
+    )
+    if config.SHARD_ADDRESSES:
+        addresses = [parse_address(address) for address in config.SHARD_ADDRESSES.split(',') if address.strip()]
+        if len(addresses) != config.SEARCH_SHARDS:
+            raise ValueError(f"В SHARD_ADDRESSES {len(addresses)} адресов, а SEARCH_SHARDS={config.SEARCH_SHARDS}")
+        pool = ShardPool(addresses, config.SHARD_AUTHKEY.encode(), **options)
+    else:
+        # Локальным процессам ключ передается через окружение, можно сгенерировать
+        authkey = (config.SHARD_AUTHKEY or secrets.token_hex(16)).encode()
+        pool = ShardPool.start_local(config.SEARCH_SHARDS, authkey, base_port=config.SHARD_BASE_PORT, **options)
+        atexit.register(pool.close)
+    if not pool.wait_ready():
+        logger.warning("⚠️ Не все шарды отвечают: поиск будет собирать частичные результаты")
+    return pool
+
+# Шардированный индекс (SEARCH_SHARDS=0 - индекс в процессе сервера). Процесс-наблюдатель
+# перезагрузчика в режиме отладки запросы не обслуживает и шарды не запускает
+reloader_monitor = __name__ == '__main__' and config.DEBUG and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+shard_pool = start_shards() if config.SEARCH_SHARDS and not reloader_monitor else None
+
+storages = {}
+storages_lock = threading.RLock()
+
+def tenant_storage(name):
+    """Хранилище фонда, одно на процесс: повторная загрузка вытесненного фонда и
+    индекс кандидата используют то же (у SQLite - тот же поток записи)"""
+    with storages_lock:
+        if name not in storages:
+            storages[name] = open_storage(config, tenant_schemas[name])
+        return storages[name]
+
+question_logs = {}
+
+def tenant_question_log(name):
+    """Фоновая запись вопросов фонда со спулом SPOOL_DIR/<фонд>.jsonl, одна на процесс"""
+    with storages_lock:
+        if name not in question_logs:
+            question_logs[name] = QuestionLog(
+                tenant_storage(name),
+                pending_dedup=lambda: loaded_pending_dedup(name),
+                spool=Spool(os.path.join(config.SPOOL_DIR, f"{name}.jsonl"), max_mb=config.SPOOL_MAX_MB),
+                queue_size=config.QUESTION_LOG_QUEUE_SIZE,
+                replay_interval=config.SPOOL_REPLAY_INTERVAL,
+                name=name
+            )
+        return question_logs[name]
+
+def loaded_pending_dedup(name):
+    """Дедупликация очереди фонда, только если фонд в памяти: фоновая запись не должна
+    загружать вытесненный фонд в обход бюджета памяти"""
+    tenant = tenants.peek(name)
+    return tenant.pending_dedup if tenant is not None else None
+
+def create_tenant(name):
+    """Подключает схему фонда и строит по ней индекс, граф похожих вопросов и дедупликацию"""
+    logger.info(f"Инициализация фонда '{name}' (схема {tenant_schemas[name]})...")
+    tenant_db = tenant_storage(name)
+
+    # Индекс вариантов вопросов в памяти или в процессах шардов
+    if shard_pool is not None:
+        search_index = ShardedIndex(name, shard_pool)
+        search_index.load()
+    else:
+        search_index = create_search_index(pca_path=os.path.join(config.PCA_DIR, f"{name}.npz"))
+        search_index.load(tenant_db.get_all_variants())
+    # Ответы тоже в памяти: при недоступной базе сервер продолжает отвечать
+    answers = {row['id']: row['text'] for row in tenant_db.get_all_answers()}
+
+    # Похожие вопросы для followup считаются заранее и пересчитываются при изменении базы
+    related_questions = RelatedQuestions(
+        n_related=config.RELATED_QUESTIONS_COUNT,
+        method=config.RELATED_QUESTIONS_METHOD,
+        min_similarity=config.RELATED_QUESTIONS_MIN_SIMILARITY
+    )
+    related_questions.rebuild(search_index)
+
+    # Повторы недавних неотвеченных вопросов увеличивают счетчик вместо новой записи
+    pending_dedup = PendingDeduplicator(
+        tenant_db,
+        radius=config.PENDING_DEDUP_RADIUS,
+        capacity=config.PENDING_DEDUP_CAPACITY,
+        window_hours=config.PENDING_DEDUP_WINDOW_HOURS
+    )
+    pending_dedup.load()
+
+    # Словарь исправления раскладки и опечаток по текстам вариантов и заголовкам вопросов
+    spelling = None
+    if config.SPELL_CORRECTION:
+        spelling = SpellCorrector(
+            max_distance=config.SPELL_MAX_DISTANCE,
+            prefix_length=config.SPELL_PREFIX_LENGTH,
+            min_word_length=config.SPELL_MIN_WORD_LENGTH
+        )
+        spelling.build(vocabulary_texts(tenant_db.get_variant_texts()))
+    return Tenant(name, tenant_db, search_index, related_questions, pending_dedup,
+                  answers=answers, question_log=tenant_question_log(name), spelling=spelling)
+
+# Фонды: имя -> схема MySQL или файл SQLite. Без TENANTS работает один фонд default со схемой DB_NAME
+tenant_schemas = parse_mapping(config.TENANTS) or {'default': config.DB_NAME}
+tenant_api_keys = parse_mapping(config.TENANT_API_KEYS)
+default_tenant = config.DEFAULT_TENANT or ('default' if not config.TENANTS else None)
+def release_tenant(tenant):
+    """Вытесненный фонд: его части индекса в процессах шардов тоже освобождаются"""
+    if isinstance(tenant.search_index, ShardedIndex):
+        tenant.search_index.unload()
+
+tenants = TenantRegistry(create_tenant, tenant_schemas, memory_budget_mb=config.TENANT_MEMORY_BUDGET_MB,
+                         on_evict=release_tenant)
+if default_tenant:
+    tenants.get(default_tenant)
+
+# Кросс-энкодер для неоднозначных запросов (пустой RERANK_MODEL_PATH - каскад отключен)
+reranker = reranker_from_settings(config)
+# Решение по вопросу (поиск, каскад, исправление опечаток) - общее с replay.py
+answer_pipeline = pipeline_from_settings(config, reranker)
+
+def build_shadow_index(tenant_name, candidate_embedder):
+    """Индекс кандидата для теневой проверки по вариантам фонда"""
+    shadow_db = tenant_storage(tenant_name)
+    index = create_search_index(
+        mode=config.SHADOW_SEARCH_MODE,
+        quantization=config.SHADOW_INDEX_QUANTIZATION,
+        ann=config.SHADOW_INDEX_ANN,
+        compression=config.SHADOW_INDEX_COMPRESSION
+    )
+    rows = shadow_db.get_all_variants() or []
+    if candidate_embedder is None:
+        index.load(rows)
+    else:
+        # Другая модель - варианты перекодируются ею, эмбеддинги из базы не подходят
+        index.build(rows, candidate_embedder.get_embeddings([row['variant_text'] for row in rows]))
+    return index
+
+def shadow_decide(index, question, embedding, context, encode=None):
+    """Решение кандидата теневой проверки тем же путем, что и основное (AnswerPipeline).
+
+    encode - модель кандидата; без нее исправленный вопрос кодируется основной
+    моделью прямо в потоке проверки: пулы /api/ask (кодирование и кросс-энкодер)
+    теневая проверка не занимает. Счетчики основного пути не меняются.
+    """
+    if encode is None:
+        encode = lambda text: embedder.get_embeddings([text])[0]
+    result, decision, _, _ = shadow_pipeline.answer(
+        index, encode, embedding, question, context.get('group_id'), context.get('intent'),
+        spelling=context.get('spelling'), record=False
+    )
+    return result, decision
+
+# Теневая проверка кандидата на доле живых запросов (SHADOW_SAMPLE_RATE=0 - выключена)
+shadow = None
+if config.SHADOW_SAMPLE_RATE > 0:
+    shadow_tenant = config.SHADOW_TENANT or default_tenant
+    if shadow_tenant not in tenant_schemas:
+        raise ValueError(f"Неизвестный фонд для теневой проверки: {shadow_tenant}")
+    shadow_pipeline = pipeline_from_settings(config, reranker, threshold=config.SHADOW_SIMILARITY_THRESHOLD)
+    shadow = ShadowEvaluator(
+        shadow_tenant,
+        build_shadow_index,
+        threshold=config.SHADOW_SIMILARITY_THRESHOLD,
+        decide=shadow_decide,
+        embedder=EmbeddingModel(config.SHADOW_MODEL_PATH) if config.SHADOW_MODEL_PATH else None,
+        sample_rate=config.SHADOW_SAMPLE_RATE,
+        queue_size=config.SHADOW_QUEUE_SIZE,
+        log_path=config.SHADOW_LOG or None
+    )
+
+# Профилирование по запросу администратора и журнал медленных запросов
+sampling_profiler = SamplingProfiler()
+slow_requests = SlowRequestLog(config.SLOW_REQUEST_MS, path=config.SLOW_REQUEST_LOG or None)
+
+def resolve_tenant_name():
+    """Фонд запроса.
+
+    Если заданы TENANT_API_KEYS, фонд определяет только ключ X-API-Key: без
+    верного ключа запрос отклоняется, а X-Tenant-ID допускается лишь совпадающий
+    с фондом ключа. Без ключей - заголовок X-Tenant-ID или фонд по умолчанию.
+    """
+    requested = request.headers.get('X-Tenant-ID')
+    if not tenant_api_keys:
+        return requested or default_tenant
+    api_key = request.headers.get('X-API-Key')
+    if not api_key:
+        raise PermissionError("Missing API key")
+    for key, name in tenant_api_keys.items():
+        if hmac.compare_digest(api_key.encode(), key.encode()):
+            if requested and requested != name:
+                raise PermissionError("API key does not grant access to this tenant")
+            return name
+    raise PermissionError("Invalid API key")
+
+def log_question(session_id, client_id, original_question, normalized_question,
+                 embedding, embedding_blob, response_time_ms, confidence=None, result=None):
+    """Ставит вопрос в фоновую запись; без result - вопрос без ответа, он попадет и в очередь операторов"""
+    if g.get('replay'):
+        return
+    with stage('log_write'):
+        g.tenant.question_log.submit({
+            'session_id': session_id,
+            'client_id': client_id,
+            'raw_question': original_question,
+            'normalized_text': normalized_question,
+            'embedding': embedding if result is None else None,  # нужен только дедупликации очереди
+            'embedding_blob': embedding_blob,
+            'is_found': result is not None,
+            'standard_question_id': result['std_question_id'] if result is not None else None,
+            'answer_id': result['answer_id'] if result is not None else None,
+            'confidence': confidence,
+            'response_time_ms': response_time_ms,
+        })
+
 # Обработчики для корректного завершения работы
 def handle_exit(signum, frame):
     logger.info("\nСервер завершает работу...")
+    inference_pool.shutdown()
+    if reranker is not None:
+        reranker.shutdown()
+    for question_log in list(question_logs.values()):
+        question_log.close()
+    if shard_pool is not None:
+        shard_pool.close()
     sys.exit(0)
 
 signal.signal(signal.SIGINT, handle_exit)
@@ -54,10 +307,57 @@ signal.signal(signal.SIGTERM, handle_exit)
 def add_cors_headers(response):
     """Добавляет CORS заголовки ко всем ответам"""
     response.headers['Access-Control-Allow-Origin'] = '*'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization,X-Tenant-ID,X-API-Key'
     response.headers['Access-Control-Allow-Methods'] = 'GET,POST,PUT,DELETE,OPTIONS'
     return response
 
+@app.before_request
+def start_profiling():
+    """Замер этапов каждого запроса; сотрудники могут запросить профиль cProfile заголовком X-Profile"""
+    start_request_timer()
+    # Воспроизведение истории (scripts/replay.py) не должно снова попадать в user_questions
+    g.replay = bool(request.headers.get('X-Replay')) and is_admin_request()
+    if request.headers.get('X-Profile') and is_admin_request():
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def finish_profiling(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(config.PROFILE_DIR, exist_ok=True)
+        path = os.path.join(
+            config.PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint}-{secrets.token_hex(3)}.prof"
+        )
+        profiler.dump_stats(path)
+        response.headers['X-Profile-File'] = path
+    timer = finish_request_timer()
+    if timer is not None and request.endpoint not in (None, 'debug_profile'):
+        slow_requests.record(request.endpoint, timer, status=response.status_code,
+                             tenant=getattr(g.get('tenant'), 'name', None))
+    return response
+
+@app.before_request
+def bind_tenant():
+    """Определяет фонд запроса и загружает его данные, если они еще не в памяти"""
+    if request.method == 'OPTIONS' or request.endpoint in (None, 'home', 'static'):
+        return None
+    if request.endpoint.startswith('debug_'):
+        return None  # диагностика относится ко всему процессу
+    try:
+        name = resolve_tenant_name()
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 401
+    if not name:
+        return jsonify({"error": "Missing X-Tenant-ID or X-API-Key header"}), 400
+    try:
+        with stage('tenant_load'):
+            g.tenant = tenants.get(name)
+    except KeyError:
+        return jsonify({"error": f"Unknown tenant: {name}"}), 404
+    return None
+
 # Специальный обработчик для OPTIONS-запросов
 @app.route('/api/groups', methods=['OPTIONS'])
 @app.route('/api/questions', methods=['OPTIONS'])
@@ -68,7 +368,7 @@ def handle_options():
     """Обрабатывает OPTIONS-запросы для CORS"""
     response = jsonify({})
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Tenant-ID,X-API-Key')
     response.headers.add('Access-Control-Allow-Methods', 'GET,POST,PUT,DELETE,OPTIONS')
     return response
 
@@ -81,7 +381,7 @@ def home():
 def api_groups():
     """Возвращает список групп вопросов"""
     try:
-        groups = db.get_question_groups()
+        groups = g.tenant.db.get_question_groups()
         return jsonify(groups)
     except Exception as e:
         logger.exception("Ошибка при получении групп вопросов")
@@ -91,7 +391,7 @@ def api_groups():
 def api_questions():
     """Возвращает все стандартные вопросы"""
     try:
-        questions = db.get_all_standard_questions()
+        questions = g.tenant.db.get_all_standard_questions()
         return jsonify(questions)
     except Exception as e:
         logger.exception("Ошибка при получении стандартных вопросов")
@@ -101,12 +401,22 @@ def api_questions():
 def api_answers():
     """Возвращает все ответы"""
     try:
-        answers = db.get_all_answers()
+        answers = [{'id': answer_id, 'text': text} for answer_id, text in g.tenant.answers.items()]
         return jsonify(answers)
     except Exception as e:
         logger.exception("Ошибка при получении ответов")
         return jsonify({"error": str(e)}), 500
 
+def overloaded_response(status, retry_after):
+    """Быстрый отказ при перегрузке с подсказкой, когда повторить запрос"""
+    response = jsonify({
+        "error": "Server is overloaded, please retry later",
+        "retry_after": retry_after
+    })
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
 # Основной эндпоинт для обработки вопросов
 @app.route('/api/ask', methods=['POST', 'GET'])
 def handle_question():
@@ -142,35 +452,49 @@ def handle_question():
         if not original_question:
             return jsonify({"error": "Missing 'question' field"}), 400
         
+        # Необязательное ограничение поиска разделом или intent
+        group_id = data.get('group_id')
+        intent_filter = data.get('intent') or None
+        if group_id is not None:
+            try:
+                group_id = int(group_id)
+            except (TypeError, ValueError):
+                return jsonify({"error": "'group_id' must be an integer"}), 400
+        
         logger.info(f"Обработка вопроса: '{original_question}' от сессии {session_id}")
         
         # Нормализуем вопрос
-        normalized_question = embedder.normalize_text(original_question)
+        with stage('normalize'):
+            normalized_question = embedder.normalize_text(original_question)
         
-        # Рассчитываем эмбеддинг
-        embedding = embedder.get_embedding(normalized_question)
-        embedding_blob = array_to_blob(embedding)
+        # Рассчитываем эмбеддинг (этапы очереди и модели пишет сам пул)
+        embedding = inference_pool.encode(normalized_question)
+        
+        # Ищем ближайший вопрос в индексе; ниже порога - повтор с исправленным вопросом
+        asked_question, asked_embedding = normalized_question, embedding
+        result, decision, normalized_question, embedding = answer_pipeline.answer(
+            g.tenant.search_index, inference_pool.encode, embedding, normalized_question,
+            group_id, intent_filter, spelling=g.tenant.spelling
+        )
         
-        # Ищем ближайший вопрос в базе
-        result = db.find_closest_question(embedding)
+        # Формат хранения в user_questions: float32, int8 или без эмбеддинга
+        embedding_blob = query_embedding_to_blob(embedding, config.QUERY_EMBEDDING_STORAGE)
         response_time_ms = int((time.time() - start_time) * 1000)
+        if shadow is not None and g.tenant.name == shadow.tenant_name:
+            # Только постановка в очередь: кандидат считается в фоне после ответа тем же
+            # путем от исходного вопроса (раздел, каскад, исправление опечаток)
+            shadow.submit(asked_question, asked_embedding, result, decision, response_time_ms, context={
+                'group_id': group_id, 'intent': intent_filter, 'spelling': g.tenant.spelling
+            })
         
         # Если не найдено или низкая уверенность
-        if not result or result.get('similarity', 0) < config.SIMILARITY_THRESHOLD:
+        if not decision:
             # Логируем неотвеченный вопрос
-            # question_id = db.log_user_question(
-            #     session_id=session_id,
-            #     client_id=client_id,
-            #     raw_question=original_question,
-            #     normalized_text=normalized_question,
-            #     embedding=embedding_blob,
-            #     is_found=False,
-            #     response_time_ms=response_time_ms
-            # )
-            
-            # if question_id:
-            #     db.log_pending_question(question_id)
-            #     logger.info(f"Вопрос добавлен в ожидание обработки, ID: {question_id}")
+            log_question(
+                session_id, client_id, original_question, normalized_question,
+                embedding, embedding_blob, response_time_ms,
+                confidence=result.get('similarity') if result else None
+            )
             
             return jsonify({
                 "answer": "Извините, я не нашел ответ на ваш вопрос. Наш специалист свяжется с вами в ближайшее время.",
@@ -186,23 +510,16 @@ def handle_question():
         
         logger.info(f"Найден похожий вопрос: '{matched_question}' с уверенностью {similarity:.2f}")
         
-        # Получаем текст ответа
-        answer_text = db.get_answer_text(answer_id)
+        # Получаем текст ответа из памяти (в базу - только если ответа там нет)
+        with stage('answer_fetch'):
+            answer_text = g.tenant.answer_text(answer_id)
         if not answer_text:
             # Логируем как неотвеченный
-            question_id = db.log_user_question(
-                session_id=session_id,
-                client_id=client_id,
-                raw_question=original_question,
-                normalized_text=normalized_question,
-                embedding=embedding_blob,
-                is_found=False,
-                response_time_ms=response_time_ms
+            log_question(
+                session_id, client_id, original_question, normalized_question,
+                embedding, embedding_blob, response_time_ms, confidence=similarity
             )
             
-            # if question_id:
-            #     db.log_pending_question(question_id)
-            
             return jsonify({
                 "answer": "Извините, я не нашел ответ на ваш вопрос. Наш специалист свяжется с вами в ближайшее время.",
                 "intent": "unknown",
@@ -210,18 +527,10 @@ def handle_question():
             })
         
         # Логируем успешный ответ
-        # db.log_user_question(
-        #     session_id=session_id,
-        #     client_id=client_id,
-        #     raw_question=original_question,
-        #     normalized_text=normalized_question,
-        #     embedding=embedding_blob,
-        #     standard_question_id=result['standard_question_id'],
-        #     answer_id=answer_id,
-        #     is_found=True,
-        #     confidence=similarity,
-        #     response_time_ms=response_time_ms
-        # )
+        log_question(
+            session_id, client_id, original_question, normalized_question,
+            embedding, embedding_blob, response_time_ms, confidence=similarity, result=result
+        )
         
         logger.info(f"Вопрос успешно обработан, ответ ID: {answer_id}")
         
@@ -229,9 +538,19 @@ def handle_question():
             "answer": answer_text,
             "intent": intent,
             "confidence": similarity,
-            "followup": []  # Можно добавить уточняющие вопросы при необходимости
+            "std_question_id": result['std_question_id'],
+            "followup": g.tenant.related_questions.followups(result['std_question_id'])
         })
         
+    except InferenceOverloaded as ex:
+        logger.warning("Очередь кодирования переполнена, запрос отклонен")
+        return overloaded_response(429, ex.retry_after)
+    except InferenceTimeout as ex:
+        logger.warning("Запрос не дождался кодирования, запрос отклонен")
+        return overloaded_response(503, ex.retry_after)
+    except ShardsUnavailable as ex:
+        logger.warning(f"Поиск отклонен: {ex}")
+        return overloaded_response(503, ex.retry_after)
     except Exception as ex:
         logger.exception("Критическая ошибка при обработке вопроса")
         return jsonify({
@@ -239,6 +558,290 @@ def handle_question():
             "details": str(ex)
         }), 500
 
+@app.route('/api/metrics', methods=['GET'])
+def api_metrics():
+    """Счетчики процесса: пул кодирования, дедупликация очереди, каскад с кросс-энкодером"""
+    return jsonify({
+        "inference_pool": dict(inference_pool.stats),
+        "pending_dedup": dict(g.tenant.pending_dedup.stats),
+        "question_log": g.tenant.question_log.metrics(),
+        "storage": g.tenant.db.breaker.metrics() if getattr(g.tenant.db, 'breaker', None) else None,
+        "tenants": tenants.metrics(),
+        "shadow": shadow.metrics() if shadow is not None else None,
+        "shards": dict(shard_pool.metrics(), stale=g.tenant.search_index.stale_shards)
+                  if shard_pool is not None else None,
+        "reranker": reranker.metrics() if reranker is not None else None,
+        "spelling": dict(g.tenant.spelling.stats) if g.tenant.spelling is not None else None
+    })
+
+@app.route('/api/stats', methods=['GET'])
+def api_stats():
+    """Статистика запросов по часам или дням; читает только таблицы агрегатов"""
+    try:
+        stats = read_stats(
+            g.tenant.db,
+            granularity=request.args.get('granularity', 'hour'),
+            start=request.args.get('from'),
+            end=request.args.get('to'),
+            top=request.args.get('top', 10, type=int)
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("Ошибка при получении статистики")
+        return jsonify({"error": str(e)}), 500
+    if stats is None:
+        return jsonify({"error": "Database error"}), 500
+    return jsonify(stats)
+
+# -------------------- Администрирование базы знаний --------------------
+def is_admin_request():
+    """Передан ли в Authorization: Bearer верный ADMIN_TOKEN"""
+    if not config.ADMIN_TOKEN:
+        return False
+    header = request.headers.get('Authorization', '')
+    token = header[len('Bearer '):] if header.startswith('Bearer ') else ''
+    return hmac.compare_digest(token.encode(), config.ADMIN_TOKEN.encode())
+
+def require_admin(view):
+    """Пропускает запрос только с токеном ADMIN_TOKEN в Authorization: Bearer"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not config.ADMIN_TOKEN:
+            return jsonify({"error": "Admin API is disabled"}), 403
+        if not is_admin_request():
+            return jsonify({"error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+def admin_items(required_fields):
+    """Возвращает список объектов из тела запроса (один объект или массив)"""
+    data = request.get_json(silent=True)
+    items = data if isinstance(data, list) else [data]
+    if not items or not all(isinstance(item, dict) for item in items):
+        raise ValueError("Expected a JSON object or a non-empty array of objects")
+    for item in items:
+        missing = [field for field in required_fields if item.get(field) in (None, '')]
+        if missing:
+            raise ValueError(f"Missing fields: {', '.join(missing)}")
+    return items
+
+def encode_variants(texts):
+    """Кодирует формулировки пачками через пул и возвращает (эмбеддинги, BLOB-ы)"""
+    if not texts:
+        return [], []
+    normalized = [embedder.normalize_text(text) for text in texts]
+    embeddings = inference_pool.encode_batch(normalized, timeout_ms=config.ADMIN_ENCODE_TIMEOUT_MS)
+    return embeddings, [array_to_blob(np.asarray(e, dtype=np.float32)) for e in embeddings]
+
+def add_to_index(index_rows, embeddings):
+    """Добавляет записанные в базу варианты в индекс фонда.
+
+    Запись в базу к этому моменту зафиксирована, поэтому шард, не принявший
+    варианты, не делает запрос ошибочным: он перезагружается из базы в фоне, а
+    ответ получает предупреждение.
+    """
+    try:
+        g.tenant.search_index.add(index_rows, embeddings)
+    except ShardError as e:
+        logger.warning(f"Варианты записаны в базу, но не сразу доступны в поиске: {e}")
+        return f"Saved, but not yet searchable on all shards: {e}"
+    return None
+
+def with_warning(body, warning):
+    if warning:
+        body["warning"] = warning
+    return body
+
+def admin_write(handler):
+    """Общая обработка ошибок для эндпоинтов записи"""
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        try:
+            return handler(*args, **kwargs)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except InferenceOverloaded as ex:
+            return overloaded_response(429, ex.retry_after)
+        except InferenceTimeout as ex:
+            return overloaded_response(503, ex.retry_after)
+        except Exception as e:
+            logger.exception("Ошибка записи в базу знаний")
+            return jsonify({"error": str(e)}), 500
+    return wrapper
+
+@app.route('/api/admin/groups', methods=['POST'])
+@require_admin
+@admin_write
+def admin_create_groups():
+    """Создает одну или несколько групп вопросов"""
+    items = admin_items(['name'])
+    ids = g.tenant.db.insert_groups([(item['name'], item.get('description')) for item in items])
+    if ids is None:
+        return jsonify({"error": "Database error"}), 500
+    return jsonify({"ids": ids}), 201
+
+@app.route('/api/admin/answers', methods=['POST'])
+@require_admin
+@admin_write
+def admin_create_answers():
+    """Создает один или несколько ответов"""
+    items = admin_items(['text'])
+    ids = g.tenant.db.insert_answers([item['text'] for item in items])
+    if ids is None:
+        return jsonify({"error": "Database error"}), 500
+    g.tenant.answers.update(zip(ids, (item['text'] for item in items)))
+    return jsonify({"ids": ids}), 201
+
+@app.route('/api/admin/questions', methods=['POST'])
+@require_admin
+@admin_write
+def admin_create_questions():
+    """Создает стандартные вопросы с вариантами и сразу добавляет их в индекс"""
+    items = admin_items(['title', 'group_id', 'answer_id'])
+    texts = [text for item in items for text in item.get('variants', [])]
+    embeddings, blobs = encode_variants(texts)
+
+    questions = []
+    offset = 0
+    for item in items:
+        n_variants = len(item.get('variants', []))
+        questions.append({
+            'title': item['title'],
+            'group_id': int(item['group_id']),
+            'answer_id': int(item['answer_id']),
+            'intent': item.get('intent'),
+            'variants': list(zip(item.get('variants', []), blobs[offset:offset + n_variants]))
+        })
+        offset += n_variants
+
+    created = g.tenant.db.insert_standard_questions(questions)
+    if created is None:
+        return jsonify({"error": "Database error"}), 500
+
+    index_rows = []
+    for question, (std_question_id, variant_ids) in zip(questions, created):
+        for (variant_text, _), variant_id in zip(question['variants'], variant_ids):
+            index_rows.append({
+                'id': variant_id, 'variant_text': variant_text,
+                'std_question_id': std_question_id, 'answer_id': question['answer_id'],
+                'intent': question['intent'], 'title': question['title'],
+                'group_id': question['group_id']
+            })
+    warning = add_to_index(index_rows, embeddings)
+    g.tenant.related_questions.schedule_rebuild(g.tenant.search_index)
+    if g.tenant.spelling is not None:
+        g.tenant.spelling.add(vocabulary_texts(index_rows))
+    if shadow is not None and g.tenant.name == shadow.tenant_name:
+        shadow.schedule_build()
+
+    return jsonify(with_warning({
+        "questions": [
+            {"id": std_question_id, "variant_ids": variant_ids}
+            for std_question_id, variant_ids in created
+        ]
+    }, warning)), 201
+
+@app.route('/api/admin/variants', methods=['POST'])
+@require_admin
+@admin_write
+def admin_create_variants():
+    """Добавляет варианты к существующим стандартным вопросам и сразу в индекс"""
+    items = admin_items(['standard_question_id', 'text'])
+    std_question_ids = sorted({int(item['standard_question_id']) for item in items})
+    questions = {q['id']: q for q in g.tenant.db.get_standard_questions_by_ids(std_question_ids)}
+    unknown = [i for i in std_question_ids if i not in questions]
+    if unknown:
+        raise ValueError(f"Unknown standard_question_id: {', '.join(map(str, unknown))}")
+
+    embeddings, blobs = encode_variants([item['text'] for item in items])
+    ids = g.tenant.db.insert_question_variants([
+        (item['text'], blob, int(item['standard_question_id']))
+        for item, blob in zip(items, blobs)
+    ])
+    if ids is None:
+        return jsonify({"error": "Database error"}), 500
+
+    index_rows = []
+    for item, variant_id in zip(items, ids):
+        question = questions[int(item['standard_question_id'])]
+        index_rows.append({
+            'id': variant_id, 'variant_text': item['text'],
+            'std_question_id': question['id'], 'answer_id': question['answer_id'],
+            'intent': question['intent'], 'title': question['title'],
+            'group_id': question['group_id']
+        })
+    warning = add_to_index(index_rows, embeddings)
+    g.tenant.related_questions.schedule_rebuild(g.tenant.search_index)
+    if g.tenant.spelling is not None:
+        g.tenant.spelling.add(vocabulary_texts(index_rows))
+    if shadow is not None and g.tenant.name == shadow.tenant_name:
+        shadow.schedule_build()
+    return jsonify(with_warning({"ids": ids}, warning)), 201
+
+# -------------------- Диагностика --------------------
+@app.route('/debug/profile', methods=['POST'])
+@require_admin
+def debug_profile():
+    """Семплирующий профиль всего процесса за seconds секунд в формате flamegraph"""
+    seconds = min(request.args.get('seconds', 10, type=float), config.PROFILE_MAX_SECONDS)
+    interval_ms = max(request.args.get('interval_ms', 10, type=float), 1)
+    include_idle = request.args.get('idle', 'false').lower() == 'true'
+    try:
+        folded = sampling_profiler.capture(seconds, interval_ms, include_idle)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    response = app.response_class(folded, mimetype='text/plain')
+    response.headers['Content-Disposition'] = f"attachment; filename=profile-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+    return response
+
+@app.route('/debug/slow', methods=['GET'])
+@require_admin
+def debug_slow():
+    """Последние медленные запросы с разбивкой по этапам"""
+    return jsonify({
+        "threshold_ms": slow_requests.threshold_ms,
+        "requests": slow_requests.recent(request.args.get('limit', 50, type=int))
+    })
+
+@app.route('/debug/shadow', methods=['GET'])
+@require_admin
+def debug_shadow():
+    """Сводка теневой проверки и последние расхождения кандидата с основным решением"""
+    if shadow is None:
+        return jsonify({"error": "Shadow evaluation is disabled"}), 404
+    return jsonify({
+        "metrics": shadow.metrics(),
+        "disagreements": shadow.recent(request.args.get('limit', 50, type=int))
+    })
+
+@app.route('/debug/memory', methods=['GET'])
+@require_admin
+def debug_memory():
+    """Память процесса по частям: модели, индексы фондов и кэши, МБ"""
+    def mb(value):
+        return round(value / 2 ** 20, 2) if value is not None else None
+
+    tenant_memory = {}
+    for name, tenant in tenants.loaded().items():
+        index = {part: mb(value) for part, value in tenant.search_index.memory_breakdown().items()}
+        tenant_memory[name] = {
+            "index": index,
+            "related_questions": mb(tenant.related_questions.memory_bytes()),
+            "pending_dedup": mb(tenant.pending_dedup.memory_bytes()),
+            "spelling": mb(tenant.spelling.memory_bytes()) if tenant.spelling is not None else None,
+            "index_compression": tenant.search_index.compression_stats,
+            "total": mb(tenant.memory_bytes())
+        }
+    return jsonify({
+        "process_rss": mb(process_rss_bytes()),
+        "embedding_model": mb(model_memory_bytes(embedder.model)),
+        "reranker_model": mb(model_memory_bytes(reranker.model)) if reranker is not None else None,
+        "reranker_cache_entries": reranker.metrics()['cache_size'] if reranker is not None else None,
+        "tenants": tenant_memory,
+        "tenants_budget": mb(tenants.memory_budget)
+    })
+
 # Новый эндпоинт для тестирования схожести
 @app.route('/test_similarity', methods=['GET'])
 def test_similarity():
@@ -252,11 +855,11 @@ def test_similarity():
         logger.info(f"Нормализованный тестовый вопрос: '{normalized}'")
         
         # Рассчитываем эмбеддинг
-        embedding = embedder.get_embedding(normalized)
+        embedding = inference_pool.encode(normalized)
         logger.info(f"Эмбеддинг рассчитан, размер: {len(embedding)}")
         
-        # Ищем в базе
-        result = db.find_closest_question(embedding)
+        # Ищем в индексе
+        result = g.tenant.search_index.find_closest(embedding, text=normalized)
         
         if not result:
             return jsonify({"error": "Question not found in database"}), 404
@@ -276,7 +879,7 @@ def handle_preflight():
     if request.method == "OPTIONS":
         response = jsonify()
         response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Tenant-ID,X-API-Key')
         response.headers.add('Access-Control-Allow-Methods', 'GET,POST,PUT,DELETE,OPTIONS')
         return response
     
@@ -0,0 +1,84 @@
+# Файл circuit_breaker.py
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'        # вызовы проходят
+OPEN = 'open'            # вызовы сразу отклоняются
+HALF_OPEN = 'half_open'  # пропущен один пробный вызов
+
+
+class CircuitBreaker:
+    """Предохранитель для внешней зависимости (базы данных).
+
+    После failure_threshold ошибок подряд размыкается: вызовы отклоняются без
+    попытки соединения, поэтому запросы не копятся в ожидании таймаутов. Через
+    reset_seconds пропускается один пробный вызов: успех замыкает предохранитель,
+    ошибка снова размыкает его еще на reset_seconds.
+    """
+
+    def __init__(self, failure_threshold=3, reset_seconds=10, name='db'):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.name = name
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'failures': 0, 'rejected': 0, 'opened': 0}
+
+    def allow(self):
+        """Можно ли выполнить вызов; в разомкнутом состоянии раз в reset_seconds разрешает пробу"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+                self._probe_at = now
+                return True
+            if self.state == HALF_OPEN and now - self._probe_at >= self.reset_seconds:
+                # Проба не сообщила результат (например, вызов завершился исключением) - новая проба
+                self._probe_at = now
+                return True
+            self.stats['rejected'] += 1
+            return False
+
+    def is_open(self):
+        """True, пока вызовы отклоняются и время пробы еще не пришло"""
+        with self._lock:
+            if self.state == CLOSED:
+                return False
+            started = self._opened_at if self.state == OPEN else self._probe_at
+            return time.monotonic() - started < self.reset_seconds
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self.state != CLOSED:
+                self.state = CLOSED
+                logger.info(f"✅ Предохранитель {self.name} замкнут: зависимость снова отвечает")
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self.stats['failures'] += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self._failures >= self.failure_threshold):
+                if self.state == CLOSED:
+                    self.stats['opened'] += 1
+                    logger.error(
+                        f"❌ Предохранитель {self.name} разомкнут после {self._failures} ошибок подряд, "
+                        f"проба через {self.reset_seconds} с"
+                    )
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['state'] = self.state
+            stats['consecutive_failures'] = self._failures
+        return stats
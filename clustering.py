@@ -0,0 +1,101 @@
+# Файл clustering.py
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def leader_clustering(matrix, threshold, block_size=4096):
+    """Кластеризация «лидерами» для нормированных строк.
+
+    Строка присоединяется к самому похожему лидеру, если косинусная близость
+    не ниже threshold, иначе сама становится лидером. Строки обрабатываются
+    блоками: сравнение блока с уже известными лидерами - одно умножение матриц,
+    поэтому сложность O(n * число кластеров), а память - O(block_size * лидеры).
+    Возвращает (метки строк, номера строк-лидеров).
+    """
+    n = len(matrix)
+    labels = np.full(n, -1, dtype=np.int64)
+    leaders = []
+    leader_matrix = np.zeros((0, matrix.shape[1]), dtype=np.float32)
+
+    for start in range(0, n, block_size):
+        block = matrix[start:start + block_size]
+        if len(leader_matrix):
+            similarities = block @ leader_matrix.T
+            best = np.argmax(similarities, axis=1)
+            matched = similarities[np.arange(len(block)), best] >= threshold
+            labels[start:start + len(block)][matched] = best[matched]
+
+        # Оставшиеся строки блока сравниваем с лидерами, появившимися в этом же блоке
+        new_leaders = []
+        for offset in np.flatnonzero(labels[start:start + len(block)] < 0):
+            row = block[offset]
+            if new_leaders:
+                candidates = block[new_leaders] @ row
+                best = int(np.argmax(candidates))
+                if candidates[best] >= threshold:
+                    labels[start + offset] = len(leaders) - len(new_leaders) + best
+                    continue
+            new_leaders.append(offset)
+            leaders.append(start + offset)
+            labels[start + offset] = len(leaders) - 1
+        if new_leaders:
+            leader_matrix = np.vstack([leader_matrix, block[new_leaders]])
+
+    return labels, np.array(leaders, dtype=np.int64)
+
+
+def cluster_members(labels):
+    """Номера строк каждого кластера, кластеры по убыванию размера"""
+    order = np.argsort(labels, kind='stable')
+    bounds = np.flatnonzero(np.diff(labels[order])) + 1
+    clusters = np.split(order, bounds) if len(order) else []
+    return sorted(clusters, key=len, reverse=True)
+
+
+def representative(matrix, members):
+    """Строка кластера, ближайшая к его центроиду"""
+    centroid = matrix[members].mean(axis=0)
+    return int(members[np.argmax(matrix[members] @ centroid)])
+
+
+def tile_size(memory_mb, n):
+    """Сторона квадратного блока матрицы близостей, укладывающегося в memory_mb.
+
+    На элемент блока в худшем случае приходится float32 близости, float32 копии
+    строк с находками и bool маски порога - 9 байт.
+    """
+    side = int(np.sqrt(memory_mb * 1024 * 1024 / 9))
+    return max(1, min(n, side))
+
+
+def similar_pairs(matrix, threshold, memory_mb=512):
+    """Все пары строк (i < j) с косинусной близостью не ниже threshold.
+
+    Матрица близостей никогда не строится целиком: верхний треугольник
+    обходится квадратными блоками, размер которых ограничен memory_mb.
+    Генерирует для каждого блока (i, j, близость) массивами numpy.
+    """
+    n = len(matrix)
+    side = tile_size(memory_mb, n)
+    for row_start in range(0, n, side):
+        if row_start:
+            logger.info(f"Сравнение пар: обработано {row_start}/{n} строк")
+        rows = matrix[row_start:row_start + side]
+        for col_start in range(row_start, n, side):
+            similarities = rows @ matrix[col_start:col_start + side].T
+            if col_start == row_start:
+                np.fill_diagonal(similarities, -np.inf)
+            # Большинство строк блока не имеют пар выше порога - отсекаем их одним проходом max
+            hit_rows = np.flatnonzero(similarities.max(axis=1) >= threshold)
+            if not len(hit_rows):
+                continue
+            mask = similarities[hit_rows] >= threshold
+            if col_start == row_start:
+                # Диагональный блок: только пары выше диагонали
+                mask &= np.arange(mask.shape[1]) > hit_rows[:, None]
+            i, j = np.nonzero(mask)
+            if len(i):
+                i = hit_rows[i]
+                yield i + row_start, j + col_start, similarities[i, j]
@@ -15,8 +15,139 @@ DB_USER = os.getenv('DB_USER', '')
 DB_PASSWORD = os.getenv('DB_PASSWORD', '')
 DB_NAME = os.getenv('DB_NAME', 'charity_bot_db')
 
+# Хранилище: mysql - сервер MySQL (схема на фонд), sqlite - встроенная база, файл SQLITE_DIR/<схема>.db
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'mysql')
+SQLITE_DIR = os.getenv('SQLITE_DIR', 'data')
+# Записи SQLite фиксируются пачками: накопившиеся за время фиксации и за окно ожидания
+SQLITE_BATCH_WINDOW_MS = float(os.getenv('SQLITE_BATCH_WINDOW_MS', 0))
+SQLITE_BATCH_SIZE = int(os.getenv('SQLITE_BATCH_SIZE', 256))
+
+# Таймауты MySQL (секунды): недоступная база не держит потоки запросов
+DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', 3))
+DB_READ_TIMEOUT = int(os.getenv('DB_READ_TIMEOUT', 10))
+DB_WRITE_TIMEOUT = int(os.getenv('DB_WRITE_TIMEOUT', 10))
+# Предохранитель: после DB_BREAKER_FAILURES ошибок подряд обращения к базе сразу
+# завершаются ошибкой, раз в DB_BREAKER_RESET_SECONDS пропускается проба
+DB_BREAKER_FAILURES = int(os.getenv('DB_BREAKER_FAILURES', 3))
+DB_BREAKER_RESET_SECONDS = float(os.getenv('DB_BREAKER_RESET_SECONDS', 10))
+# Вопросы пользователей пишутся в фоне; пока база недоступна - в спул SPOOL_DIR/<фонд>.jsonl
+QUESTION_LOG_QUEUE_SIZE = int(os.getenv('QUESTION_LOG_QUEUE_SIZE', 1000))
+SPOOL_DIR = os.getenv('SPOOL_DIR', 'spool')
+SPOOL_MAX_MB = int(os.getenv('SPOOL_MAX_MB', 500))
+SPOOL_REPLAY_INTERVAL = float(os.getenv('SPOOL_REPLAY_INTERVAL', 5))
+
 # Настройки приложения
 PORT = int(os.getenv('PORT', 5050))
 MODEL_PATH = os.getenv('MODEL_PATH', 'models/all-MiniLM-L6-v2')
 SIMILARITY_THRESHOLD = float(os.getenv('SIMILARITY_THRESHOLD', 0.85))
-DEBUG = os.getenv('DEBUG', 'true').lower() == 'true'
\ No newline at end of file
+DEBUG = os.getenv('DEBUG', 'true').lower() == 'true'
+
+# Настройки поиска
+# dense - только эмбеддинги, prefilter - BM25 отбирает кандидатов для эмбеддингов,
+# fused - взвешенная сумма косинусной близости и BM25
+SEARCH_MODE = os.getenv('SEARCH_MODE', 'dense')
+LEXICAL_ANALYZER = os.getenv('LEXICAL_ANALYZER', 'char')  # char - символьные n-граммы, word - слова
+LEXICAL_NGRAM_SIZE = int(os.getenv('LEXICAL_NGRAM_SIZE', 3))
+LEXICAL_CANDIDATES = int(os.getenv('LEXICAL_CANDIDATES', 50))
+FUSION_WEIGHT = float(os.getenv('FUSION_WEIGHT', 0.3))
+# Если в разделе (group_id/intent из запроса) нет совпадения выше порога - искать по всей базе
+SCOPED_SEARCH_FALLBACK = os.getenv('SCOPED_SEARCH_FALLBACK', 'true').lower() == 'true'
+# Хранение матрицы: none - float32, int8 - квантование (в 4 раза меньше памяти)
+INDEX_QUANTIZATION = os.getenv('INDEX_QUANTIZATION', 'none')
+# Перебор: exact - полный, ivf - приближенный по инвертированным спискам k-means
+INDEX_ANN = os.getenv('INDEX_ANN', 'exact')
+IVF_LISTS = int(os.getenv('IVF_LISTS', 256))
+IVF_PROBE = int(os.getenv('IVF_PROBE', 16))
+# Сжатие: none - строка на вариант, medoids - центроид вопроса и медоиды далеких вариантов
+INDEX_COMPRESSION = os.getenv('INDEX_COMPRESSION', 'none')
+COMPRESSION_MAX_ERROR = float(os.getenv('COMPRESSION_MAX_ERROR', 0.05))  # допуск 1 - косинус до представителя
+COMPRESSION_MAX_MEDOIDS = int(os.getenv('COMPRESSION_MAX_MEDOIDS', 3))  # медоидов на вопрос сверх центроида
+# Проекция PCA для первого этапа плотного поиска (0 - выключена), полные векторы - для пересчета
+INDEX_PCA_DIM = int(os.getenv('INDEX_PCA_DIM', 0))
+PCA_CANDIDATES = int(os.getenv('PCA_CANDIDATES', 100))  # кандидатов первого этапа на запрос
+PCA_DIR = os.getenv('PCA_DIR', 'models/pca')  # проекции фондов: PCA_DIR/<фонд>.npz
+PCA_REFIT_CHANGE = float(os.getenv('PCA_REFIT_CHANGE', 0.2))  # пересчет при изменении числа строк на 20%
+PCA_REFIT_ENERGY_DROP = float(os.getenv('PCA_REFIT_ENERGY_DROP', 0.02))  # или падении доли энергии
+# Исправление раскладки и опечаток по словарю базы, только для вопросов ниже порога
+SPELL_CORRECTION = os.getenv('SPELL_CORRECTION', 'true').lower() == 'true'
+SPELL_MAX_DISTANCE = int(os.getenv('SPELL_MAX_DISTANCE', 2))  # правок на слово (в словах до 5 букв - 1)
+SPELL_PREFIX_LENGTH = int(os.getenv('SPELL_PREFIX_LENGTH', 7))  # букв слова в словаре удалений
+SPELL_MIN_WORD_LENGTH = int(os.getenv('SPELL_MIN_WORD_LENGTH', 4))  # более короткие слова не исправляются
+# Шарды индекса (0 - индекс в процессе сервера). Варианты делятся по хешу standard_question_id
+SEARCH_SHARDS = int(os.getenv('SEARCH_SHARDS', 0))
+SHARD_ADDRESSES = os.getenv('SHARD_ADDRESSES', '')  # host:port шардов 0..N-1; пусто - локальные процессы
+SHARD_BASE_PORT = int(os.getenv('SHARD_BASE_PORT', 5600))  # порты локальных процессов: база + номер шарда
+SHARD_AUTHKEY = os.getenv('SHARD_AUTHKEY', '')  # общий ключ сервера и шардов; для удаленных обязателен
+SHARD_TIMEOUT_MS = int(os.getenv('SHARD_TIMEOUT_MS', 300))  # ожидание ответа шарда на поиск
+SHARD_MIN_RESPONSES = int(os.getenv('SHARD_MIN_RESPONSES', 1))  # меньше ответов - 503; 0 - нужны все шарды
+SHARD_LOAD_TIMEOUT_S = int(os.getenv('SHARD_LOAD_TIMEOUT_S', 600))  # загрузка индекса фонда шардом
+SHARD_RETRY_SECONDS = int(os.getenv('SHARD_RETRY_SECONDS', 5))  # пауза перед новой попыткой к упавшему шарду
+
+# Пул кодирования запросов
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', 2))
+INFERENCE_THREADS_PER_WORKER = int(os.getenv('INFERENCE_THREADS_PER_WORKER', 1))  # потоки torch на поток пула
+INFERENCE_QUEUE_SIZE = int(os.getenv('INFERENCE_QUEUE_SIZE', 32))  # сверх этого - сразу 429
+INFERENCE_TIMEOUT_MS = int(os.getenv('INFERENCE_TIMEOUT_MS', 2000))  # дедлайн запроса, затем 503
+INFERENCE_MAX_BATCH = int(os.getenv('INFERENCE_MAX_BATCH', 16))
+
+# API администрирования базы знаний (пустой токен - API отключен)
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+ADMIN_ENCODE_TIMEOUT_MS = int(os.getenv('ADMIN_ENCODE_TIMEOUT_MS', 60000))
+
+# Дедупликация неотвеченных вопросов: повтор в радиусе увеличивает hit_count вместо новой записи
+PENDING_DEDUP_RADIUS = float(os.getenv('PENDING_DEDUP_RADIUS', 0.9))
+PENDING_DEDUP_CAPACITY = int(os.getenv('PENDING_DEDUP_CAPACITY', 10000))
+PENDING_DEDUP_WINDOW_HOURS = int(os.getenv('PENDING_DEDUP_WINDOW_HOURS', 72))
+
+# Агрегаты статистики (scripts/rollup_stats.py)
+STATS_ROLLUP_BATCH = int(os.getenv('STATS_ROLLUP_BATCH', 5000))
+STATS_ROLLUP_LAG_SECONDS = int(os.getenv('STATS_ROLLUP_LAG_SECONDS', 10))
+
+# Хранение вопросов пользователей (user_questions секционирована по месяцам created_at)
+QUERY_EMBEDDING_STORAGE = os.getenv('QUERY_EMBEDDING_STORAGE', 'float32')  # float32, int8 или none
+USER_QUESTIONS_RETENTION_MONTHS = int(os.getenv('USER_QUESTIONS_RETENTION_MONTHS', 12))
+PARTITIONS_AHEAD_MONTHS = int(os.getenv('PARTITIONS_AHEAD_MONTHS', 3))
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+
+# Каскад с кросс-энкодером: только запросы с близостью в [RERANK_BAND_LOW, RERANK_BAND_HIGH)
+# переоцениваются; пустой RERANK_MODEL_PATH отключает каскад
+RERANK_MODEL_PATH = os.getenv('RERANK_MODEL_PATH', '')
+RERANK_BAND_LOW = float(os.getenv('RERANK_BAND_LOW', SIMILARITY_THRESHOLD - 0.1))
+RERANK_BAND_HIGH = float(os.getenv('RERANK_BAND_HIGH', SIMILARITY_THRESHOLD + 0.05))
+RERANK_THRESHOLD = float(os.getenv('RERANK_THRESHOLD', 0.0))  # в единицах оценки кросс-энкодера
+RERANK_TOP_K = int(os.getenv('RERANK_TOP_K', 5))
+RERANK_WORKERS = int(os.getenv('RERANK_WORKERS', 1))
+RERANK_QUEUE_SIZE = int(os.getenv('RERANK_QUEUE_SIZE', 16))
+RERANK_TIMEOUT_MS = int(os.getenv('RERANK_TIMEOUT_MS', 1000))
+RERANK_MAX_BATCH = int(os.getenv('RERANK_MAX_BATCH', 64))
+RERANK_CACHE_SIZE = int(os.getenv('RERANK_CACHE_SIZE', 10000))
+
+# Похожие вопросы в поле followup ответа (0 - не показывать)
+RELATED_QUESTIONS_COUNT = int(os.getenv('RELATED_QUESTIONS_COUNT', 3))
+RELATED_QUESTIONS_METHOD = os.getenv('RELATED_QUESTIONS_METHOD', 'centroid')  # centroid или max
+RELATED_QUESTIONS_MIN_SIMILARITY = float(os.getenv('RELATED_QUESTIONS_MIN_SIMILARITY', 0.5))
+
+# Несколько фондов в одном процессе: TENANTS=fund_a:charity_fund_a,fund_b:charity_fund_b
+# (имя фонда -> схема MySQL или файл SQLite). Пусто - один фонд со схемой DB_NAME
+TENANTS = os.getenv('TENANTS', '')
+TENANT_API_KEYS = os.getenv('TENANT_API_KEYS', '')  # ключ:фонд через запятую, заголовок X-API-Key
+DEFAULT_TENANT = os.getenv('DEFAULT_TENANT', '')    # фонд для запросов без заголовков
+TENANT_MEMORY_BUDGET_MB = int(os.getenv('TENANT_MEMORY_BUDGET_MB', 1024))  # индексы всех фондов в памяти
+
+# Диагностика: запросы дольше SLOW_REQUEST_MS пишутся с разбивкой по этапам
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+SLOW_REQUEST_LOG = os.getenv('SLOW_REQUEST_LOG', 'logs/slow_requests.jsonl')  # пусто - только в памяти
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')  # профили запросов с заголовком X-Profile
+PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', 60))
+
+# Теневая проверка: доля запросов, которая дополнительно в фоне прогоняется через кандидата
+SHADOW_SAMPLE_RATE = float(os.getenv('SHADOW_SAMPLE_RATE', 0.0))  # 0 - выключена
+SHADOW_TENANT = os.getenv('SHADOW_TENANT', '')  # пусто - фонд по умолчанию
+SHADOW_MODEL_PATH = os.getenv('SHADOW_MODEL_PATH', '')  # пусто - эмбеддинги основной модели
+SHADOW_SEARCH_MODE = os.getenv('SHADOW_SEARCH_MODE', SEARCH_MODE)
+SHADOW_INDEX_QUANTIZATION = os.getenv('SHADOW_INDEX_QUANTIZATION', INDEX_QUANTIZATION)
+SHADOW_INDEX_ANN = os.getenv('SHADOW_INDEX_ANN', INDEX_ANN)
+SHADOW_INDEX_COMPRESSION = os.getenv('SHADOW_INDEX_COMPRESSION', INDEX_COMPRESSION)
+SHADOW_SIMILARITY_THRESHOLD = float(os.getenv('SHADOW_SIMILARITY_THRESHOLD', SIMILARITY_THRESHOLD))
+SHADOW_QUEUE_SIZE = int(os.getenv('SHADOW_QUEUE_SIZE', 100))  # сверх этого образцы отбрасываются
+SHADOW_LOG = os.getenv('SHADOW_LOG', 'logs/shadow.jsonl')  # расхождения, JSONL
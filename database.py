@@ -3,21 +3,64 @@ import pymysql
 import logging
 import numpy as np
 from datetime import datetime
+import time
 import traceback 
 from sklearn.metrics.pairwise import cosine_similarity
+from profiling import record_stage
+from storage import Storage, STORAGE_MYSQL, ready_prefix
 
 logger = logging.getLogger(__name__)
 
-class Database:
-    def __init__(self, host, user, password, database):
+# Ошибки клиента MySQL, означающие недоступность сервера: нет соединения, сервер
+# закрыл соединение, соединение потеряно (в том числе по read_timeout/write_timeout)
+CONNECTION_ERRORS = (2003, 2006, 2013, 2055)
+
+
+class GuardedCursor(pymysql.cursors.DictCursor):
+    """Курсор, сообщающий предохранителю соединения, отвечает ли сервер"""
+
+    def execute(self, query, args=None):
+        breaker = getattr(self.connection, 'breaker', None)
+        try:
+            result = super().execute(query, args)
+        except pymysql.err.Error as e:
+            if breaker is not None:
+                lost = isinstance(e, pymysql.err.InterfaceError) or (
+                    isinstance(e, pymysql.err.OperationalError) and e.args and e.args[0] in CONNECTION_ERRORS
+                )
+                # Ошибка SQL или блокировки - сервер жив
+                breaker.record_failure() if lost else breaker.record_success()
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+class Database(Storage):
+    """Хранилище в MySQL: соединение открывается на каждый запрос"""
+
+    backend = STORAGE_MYSQL
+
+    def __init__(self, host, user, password, database, connect_timeout=10, read_timeout=None,
+                 write_timeout=None, breaker=None):
         self.host = host
         self.user = user
         self.password = password
         self.database = database
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.breaker = breaker
         self.connection = None
 
+    def available(self):
+        return self.breaker is None or not self.breaker.is_open()
+
     def _get_connection(self):
-        """Создает и возвращает новое соединение с базой данных"""
+        """Создает и возвращает новое соединение с базой данных (None, если предохранитель разомкнут)"""
+        if self.breaker is not None and not self.breaker.allow():
+            return None
+        started = time.perf_counter()
         try:
             conn = pymysql.connect(
                 host=self.host,
@@ -25,14 +68,23 @@ class Database:
                 password=self.password,
                 database=self.database,
                 charset='utf8mb4',
-                cursorclass=pymysql.cursors.DictCursor,
-                autocommit=True
+                cursorclass=GuardedCursor,
+                autocommit=True,
+                connect_timeout=self.connect_timeout,
+                read_timeout=self.read_timeout,
+                write_timeout=self.write_timeout
             )
+            conn.breaker = self.breaker
             self.connection = conn
             return conn
         except Exception as e:
+            if self.breaker is not None:
+                self.breaker.record_failure()
             logger.error(f"❌ Ошибка подключения к БД: {e}")
             return None
+        finally:
+            # Соединение открывается на каждый запрос - время ожидания БД видно в журнале медленных запросов
+            record_stage('db_connect', (time.perf_counter() - started) * 1000)
 
     def execute_query(self, query, params=None):
         conn = self._get_connection()
@@ -48,6 +100,22 @@ class Database:
         finally:
             conn.close()
 
+    def iter_query(self, query, params=None, batch_size=1000):
+        """Потоково отдает строки большого SELECT, не загружая результат в память целиком"""
+        conn = self._get_connection()
+        if not conn:
+            raise ConnectionError("Нет подключения к базе данных")
+        try:
+            with conn.cursor(pymysql.cursors.SSDictCursor) as cursor:
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield from rows
+        finally:
+            conn.close()
+
     def execute_update(self, query, params=None):
         conn = self._get_connection()
         if not conn:
@@ -78,6 +146,41 @@ class Database:
             return []
         return [{'id': row['id'], 'text': row['answer_text']} for row in results]
 
+    def get_all_variants(self):
+        """Возвращает все варианты вопросов с эмбеддингами для индекса поиска"""
+        results = self.execute_query("""
+            SELECT qv.id, qv.variant_text, qv.embedding,
+                   sq.id AS std_question_id, sq.answer_id, sq.intent, sq.title, sq.group_id
+            FROM question_variants qv
+            JOIN standard_questions sq ON qv.standard_question_id = sq.id
+        """)
+        return results or []
+
+    def get_variant_texts(self):
+        """Возвращает тексты вариантов и заголовки их вопросов без эмбеддингов"""
+        results = self.execute_query("""
+            SELECT qv.variant_text, sq.title
+            FROM question_variants qv
+            JOIN standard_questions sq ON qv.standard_question_id = sq.id
+        """)
+        return results or []
+
+    def get_labeled_user_questions(self, limit):
+        """Возвращает последние вопросы, которые оператор привязал к стандартному вопросу.
+
+        Берутся только обработанные неотвеченные вопросы: у вопросов с ответом
+        standard_question_id - решение самого бота, а не разметка.
+        """
+        results = self.execute_query("""
+            SELECT DISTINCT uq.id, uq.raw_question, uq.normalized_text, uq.standard_question_id
+            FROM pending_questions pq
+            JOIN user_questions uq ON pq.user_question_id = uq.id
+            WHERE pq.processed = TRUE AND uq.standard_question_id IS NOT NULL
+            ORDER BY uq.id DESC
+            LIMIT %s
+        """, (limit,))
+        return results or []
+
     # -------------------- РАБОЧАЯ ВЕРСИЯ поиска ближайшего вопроса --------------------
     def find_closest_question(self, embedding):
         """Находит ближайший вопрос по эмбеддингу"""
@@ -223,9 +326,368 @@ class Database:
         finally:
             conn.close()
 
+    def _insert_many(self, query, rows, what):
+        """Вставляет строки в одной транзакции и возвращает список их ID"""
+        conn = self._get_connection()
+        if not conn:
+            return None
+        try:
+            conn.begin()
+            ids = []
+            with conn.cursor() as cursor:
+                for params in rows:
+                    cursor.execute(query, params)
+                    ids.append(cursor.lastrowid)
+            conn.commit()
+            return ids
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"❌ Ошибка пакетного создания ({what}): {e}")
+            return None
+        finally:
+            conn.close()
+
+    def insert_groups(self, groups):
+        """Создает группы [(name, description), ...] одной транзакцией"""
+        return self._insert_many(
+            "INSERT INTO questions_groups (name, description) VALUES (%s, %s)",
+            groups, "группы"
+        )
+
+    def insert_answers(self, answer_texts):
+        """Создает ответы одной транзакцией"""
+        return self._insert_many(
+            "INSERT INTO answers (answer_text) VALUES (%s)",
+            [(text,) for text in answer_texts], "ответы"
+        )
+
+    def insert_question_variants(self, variants):
+        """Создает варианты [(variant_text, embedding, standard_question_id), ...] одной транзакцией"""
+        return self._insert_many("""
+            INSERT INTO question_variants (variant_text, embedding, standard_question_id)
+            VALUES (%s, %s, %s)
+        """, variants, "варианты вопросов")
+
+    def insert_standard_questions(self, questions):
+        """Создает стандартные вопросы вместе с их вариантами одной транзакцией.
+
+        questions - список словарей с ключами title, group_id, answer_id, intent
+        и variants: [(variant_text, embedding), ...]. Возвращает список
+        (id стандартного вопроса, [id вариантов]) или None при ошибке.
+        """
+        conn = self._get_connection()
+        if not conn:
+            return None
+        try:
+            conn.begin()
+            created = []
+            with conn.cursor() as cursor:
+                for question in questions:
+                    cursor.execute("""
+                        INSERT INTO standard_questions (title, group_id, answer_id, intent)
+                        VALUES (%s, %s, %s, %s)
+                    """, (question['title'], question['group_id'], question['answer_id'], question['intent']))
+                    std_question_id = cursor.lastrowid
+                    variant_ids = []
+                    for variant_text, embedding in question['variants']:
+                        cursor.execute("""
+                            INSERT INTO question_variants (variant_text, embedding, standard_question_id)
+                            VALUES (%s, %s, %s)
+                        """, (variant_text, embedding, std_question_id))
+                        variant_ids.append(cursor.lastrowid)
+                    created.append((std_question_id, variant_ids))
+            conn.commit()
+            return created
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"❌ Ошибка пакетного создания стандартных вопросов: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def bulk_load(self, tables, chunk_size=10000, replace=False):
+        """Массово загружает таблицы с явными ID: [(table, columns, rows), ...].
+
+        Строки вставляются многострочными INSERT пачками по chunk_size, вся
+        загрузка вместе с очисткой при replace=True - одна транзакция: при ошибке
+        на середине база остается прежней, как и у SQLite. Проверки внешних ключей
+        на время загрузки отключаются в сессии. Возвращает число вставленных строк
+        по таблицам или None при ошибке.
+        """
+        conn = self._get_connection()
+        if not conn:
+            return None
+        try:
+            conn.autocommit(False)
+            loaded = {}
+            with conn.cursor() as cursor:
+                cursor.execute("SET SESSION foreign_key_checks = 0")
+                cursor.execute("SET SESSION unique_checks = 0")
+                if replace:
+                    # DELETE, а не TRUNCATE: TRUNCATE неявно фиксирует транзакцию
+                    for table, _, _ in reversed(tables):
+                        cursor.execute(f"DELETE FROM {table}")
+                for table, columns, rows in tables:
+                    query = (
+                        f"INSERT INTO {table} ({', '.join(columns)}) "
+                        f"VALUES ({', '.join(['%s'] * len(columns))})"
+                    )
+                    for start in range(0, len(rows), chunk_size):
+                        cursor.executemany(query, rows[start:start + chunk_size])
+                    loaded[table] = len(rows)
+                    logger.info(f"✅ {table}: подготовлено {len(rows)} строк")
+                conn.commit()
+                cursor.execute("SET SESSION foreign_key_checks = 1")
+                cursor.execute("SET SESSION unique_checks = 1")
+            return loaded
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"❌ Ошибка массовой загрузки: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def get_standard_questions_by_ids(self, ids):
+        """Возвращает стандартные вопросы с указанными ID"""
+        if not ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(ids))
+        results = self.execute_query(f"""
+            SELECT id, group_id, title, answer_id, intent
+            FROM standard_questions
+            WHERE id IN ({placeholders})
+        """, tuple(ids))
+        return results or []
+
+    def get_pending_with_embeddings(self, limit=None, newest_first=False):
+        """Возвращает необработанные вопросы вместе с эмбеддингами одним запросом"""
+        order = "pq.last_seen_at DESC" if newest_first else "pq.id"
+        query = f"""
+            SELECT pq.id AS pending_id, uq.id AS user_question_id,
+                   uq.raw_question, uq.embedding, uq.created_at,
+                   pq.hit_count, pq.last_seen_at
+            FROM pending_questions pq
+            JOIN user_questions uq ON pq.user_question_id = uq.id
+            WHERE pq.processed = FALSE
+            ORDER BY {order}
+        """
+        params = None
+        if limit:
+            query += " LIMIT %s"
+            params = (limit,)
+        return self.execute_query(query, params) or []
+
+    def get_pending_page(self, after=None, limit=20, order='recent', only_unprocessed=True, pending_ids=None):
+        """Страница очереди неотвеченных вопросов с keyset-пагинацией.
+
+        order='recent' - новые первыми, курсор (created_at, id);
+        order='frequent' - частые первыми, курсор (hit_count, id).
+        after - курсор последней строки предыдущей страницы.
+        """
+        sort_column = 'pq.hit_count' if order == 'frequent' else 'pq.created_at'
+        conditions, params = [], []
+        if only_unprocessed:
+            conditions.append("pq.processed = FALSE")
+        if pending_ids:
+            conditions.append(f"pq.id IN ({', '.join(['%s'] * len(pending_ids))})")
+            params.extend(pending_ids)
+        if after is not None:
+            conditions.append(f"({sort_column} < %s OR ({sort_column} = %s AND pq.id < %s))")
+            params.extend([after[0], after[0], after[1]])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(limit)
+        return self.execute_query(f"""
+            SELECT pq.id AS pending_id, pq.processed, pq.hit_count, pq.last_seen_at,
+                   pq.created_at, uq.id AS user_question_id, uq.raw_question, uq.embedding,
+                   sq.title AS matched_question
+            FROM pending_questions pq
+            JOIN user_questions uq ON pq.user_question_id = uq.id
+            LEFT JOIN standard_questions sq ON uq.standard_question_id = sq.id
+            {where}
+            ORDER BY {sort_column} DESC, pq.id DESC
+            LIMIT %s
+        """, tuple(params))
+
+    def touch_pending(self, pending_id):
+        """Засчитывает повтор неотвеченного вопроса: hit_count + 1 и время последнего появления.
+
+        Возвращает False, если вопрос уже обработан (или удален), None при ошибке.
+        """
+        conn = self._get_connection()
+        if not conn:
+            return None
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE pending_questions
+                    SET hit_count = hit_count + 1, last_seen_at = CURRENT_TIMESTAMP
+                    WHERE id = %s AND processed = FALSE
+                """, (pending_id,))
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления счетчика вопроса {pending_id}: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def resolve_pending(self, pending_ids, standard_question_id=None, operator_notes=None):
+        """Помечает группу неотвеченных вопросов обработанными одним UPDATE.
+
+        Если передан standard_question_id, вопросы пользователей привязываются к нему.
+        """
+        if not pending_ids:
+            return True
+        placeholders = ", ".join(["%s"] * len(pending_ids))
+        return self.execute_update(f"""
+            UPDATE pending_questions pq
+            JOIN user_questions uq ON pq.user_question_id = uq.id
+            SET pq.processed = TRUE,
+                pq.operator_notes = COALESCE(%s, pq.operator_notes),
+                uq.standard_question_id = COALESCE(%s, uq.standard_question_id)
+            WHERE pq.id IN ({placeholders})
+        """, (operator_notes, standard_question_id, *pending_ids))
+
+    def get_stats_watermark(self, name='rollup_last_id'):
+        """Последний user_questions.id, уже учтенный в агрегатах статистики"""
+        results = self.execute_query("SELECT value FROM stats_state WHERE name = %s", (name,))
+        if results is None:
+            return None
+        return int(results[0]['value']) if results else 0
+
+    def get_user_questions_after(self, last_id, limit, lag_seconds=10):
+        """Вопросы пользователей с id > last_id по первичному ключу.
+
+        Пачка обрывается на первой строке моложе lag_seconds: вставка с меньшим id
+        может зафиксироваться позже соседней, а строки из спула получают больший id
+        при более раннем created_at - водяной знак не должен обогнать ни те, ни другие.
+        """
+        return ready_prefix(self.execute_query("""
+            SELECT id, created_at, is_found, confidence, response_time_ms, standard_question_id,
+                   created_at < NOW() - INTERVAL %s SECOND AS ready
+            FROM user_questions
+            WHERE id > %s
+            ORDER BY id
+            LIMIT %s
+        """, (lag_seconds, last_id, limit)))
+
+    def get_user_questions_page(self, after_id, limit, start=None, end=None):
+        """Страница истории вопросов по первичному ключу (keyset), для воспроизведения нагрузки"""
+        conditions = ["id > %s"]
+        params = [after_id]
+        if start is not None:
+            conditions.append("created_at >= %s")
+            params.append(start)
+        if end is not None:
+            conditions.append("created_at < %s")
+            params.append(end)
+        params.append(limit)
+        return self.execute_query(f"""
+            SELECT id, created_at, raw_question, is_found, standard_question_id, confidence, response_time_ms
+            FROM user_questions
+            WHERE {' AND '.join(conditions)}
+            ORDER BY id
+            LIMIT %s
+        """, tuple(params))
+
+    def apply_stats_rollup(self, previous_id, last_id, rollups, latency_bins, question_hits,
+                           name='rollup_last_id'):
+        """Прибавляет пачку к агрегатам и сдвигает водяной знак одной транзакцией.
+
+        rollups: [(granularity, bucket_start, queries, found, confidence_sum, confidence_count)],
+        latency_bins: [(granularity, bucket_start, bin, count)],
+        question_hits: [(granularity, bucket_start, standard_question_id, hits)].
+        Водяной знак меняется только если он все еще равен previous_id, поэтому
+        параллельный запуск не учтет ту же пачку дважды. Возвращает False, если
+        пачку уже учли, None при ошибке.
+        """
+        conn = self._get_connection()
+        if not conn:
+            return None
+        try:
+            conn.begin()
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE stats_state SET value = %s WHERE name = %s AND value = %s",
+                    (last_id, name, previous_id)
+                )
+                if cursor.rowcount == 0:
+                    conn.rollback()
+                    return False
+                cursor.executemany("""
+                    INSERT INTO stats_rollups
+                    (granularity, bucket_start, queries, found, confidence_sum, confidence_count)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        queries = queries + VALUES(queries),
+                        found = found + VALUES(found),
+                        confidence_sum = confidence_sum + VALUES(confidence_sum),
+                        confidence_count = confidence_count + VALUES(confidence_count)
+                """, rollups)
+                if latency_bins:
+                    cursor.executemany("""
+                        INSERT INTO stats_latency_bins (granularity, bucket_start, bin, count)
+                        VALUES (%s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE count = count + VALUES(count)
+                    """, latency_bins)
+                if question_hits:
+                    cursor.executemany("""
+                        INSERT INTO stats_question_hits (granularity, bucket_start, standard_question_id, hits)
+                        VALUES (%s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE hits = hits + VALUES(hits)
+                    """, question_hits)
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"❌ Ошибка обновления агрегатов статистики: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def get_stats_rollups(self, granularity, start, end):
+        """Агрегаты за период [start, end) по корзинам"""
+        return self.execute_query("""
+            SELECT bucket_start, queries, found, confidence_sum, confidence_count
+            FROM stats_rollups
+            WHERE granularity = %s AND bucket_start >= %s AND bucket_start < %s
+            ORDER BY bucket_start
+        """, (granularity, start, end))
+
+    def get_stats_latency_bins(self, granularity, start, end):
+        return self.execute_query("""
+            SELECT bucket_start, bin, count
+            FROM stats_latency_bins
+            WHERE granularity = %s AND bucket_start >= %s AND bucket_start < %s
+        """, (granularity, start, end))
+
+    def get_stats_top_questions(self, granularity, start, end, limit):
+        """Самые частые стандартные вопросы за период"""
+        return self.execute_query("""
+            SELECT h.standard_question_id, sq.title, sq.intent, SUM(h.hits) AS hits
+            FROM stats_question_hits h
+            LEFT JOIN standard_questions sq ON sq.id = h.standard_question_id
+            WHERE h.granularity = %s AND h.bucket_start >= %s AND h.bucket_start < %s
+            GROUP BY h.standard_question_id, sq.title, sq.intent
+            ORDER BY hits DESC
+            LIMIT %s
+        """, (granularity, start, end, limit))
+
+    def get_stats_top_intents(self, granularity, start, end, limit):
+        return self.execute_query("""
+            SELECT sq.intent, SUM(h.hits) AS hits
+            FROM stats_question_hits h
+            JOIN standard_questions sq ON sq.id = h.standard_question_id
+            WHERE h.granularity = %s AND h.bucket_start >= %s AND h.bucket_start < %s
+              AND sq.intent IS NOT NULL AND sq.intent <> ''
+            GROUP BY sq.intent
+            ORDER BY hits DESC
+            LIMIT %s
+        """, (granularity, start, end, limit))
+
     def log_user_question(self, session_id, client_id, raw_question, normalized_text, 
                         embedding, is_found, response_time_ms, standard_question_id=None, 
-                        answer_id=None, confidence=None):
+                        answer_id=None, confidence=None, created_at=None):
         """Логирует вопрос пользователя в базу данных"""
         conn = self._get_connection()
         if not conn:
@@ -236,12 +698,12 @@ class Database:
                 query = """
                     INSERT INTO user_questions 
                     (session_id, client_id, raw_question, normalized_text, embedding, 
-                    standard_question_id, answer_id, is_found, confidence, response_time_ms)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    standard_question_id, answer_id, is_found, confidence, response_time_ms, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))
                 """
                 cursor.execute(query, (
                     session_id, client_id, raw_question, normalized_text, embedding,
-                    standard_question_id, answer_id, is_found, confidence, response_time_ms
+                    standard_question_id, answer_id, is_found, confidence, response_time_ms, created_at
                 ))
                 conn.commit()
                 return cursor.lastrowid
@@ -252,33 +714,21 @@ class Database:
             conn.close()
 
     def log_pending_question(self, question_id):
-        """Добавляет вопрос в таблицу pending_questions для последующей обработки"""
+        """Добавляет вопрос в таблицу pending_questions, возвращает ID записи"""
         conn = self._get_connection()
         if not conn:
-            return False
+            return None
         
         try:
             with conn.cursor() as cursor:
-                # Получаем данные вопроса из user_questions
-                cursor.execute("""
-                    SELECT original_text, normalized_text, embedding 
-                    FROM user_questions WHERE id = %s
-                """, (question_id,))
-                question_data = cursor.fetchone()
-                
-                if not question_data:
-                    return False
-                
-                # Вставляем в pending_questions
-                cursor.execute("""
-                    INSERT INTO pending_questions (original_text, normalized_text, embedding)
-                    VALUES (%s, %s, %s)
-                """, (question_data['raw_question'], question_data['normalized_text'], question_data['embedding']))
-                
+                cursor.execute(
+                    "INSERT INTO pending_questions (user_question_id) VALUES (%s)",
+                    (question_id,)
+                )
                 conn.commit()
-                return True
+                return cursor.lastrowid
         except Exception as e:
             logger.error(f"❌ Ошибка добавления вопроса в ожидание: {e}")
-            return False
+            return None
         finally:
             conn.close()
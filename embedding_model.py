@@ -21,4 +21,13 @@ class EmbeddingModel:
     
     def get_embedding(self, text: str) -> np.ndarray:
         """Возвращает эмбеддинг для текста"""
-        return self.model.encode([text])[0]
\ No newline at end of file
+        return self.model.encode([text])[0]
+    
+    def get_embeddings(self, texts, batch_size: int = 64) -> np.ndarray:
+        """Возвращает матрицу эмбеддингов для списка текстов, кодируя их пачками"""
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return np.asarray(
+            self.model.encode(list(texts), batch_size=batch_size),
+            dtype=np.float32
+        )
\ No newline at end of file
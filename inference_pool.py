@@ -0,0 +1,173 @@
+# Файл inference_pool.py
+import math
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from profiling import record_stage
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceOverloaded(Exception):
+    """Очередь на кодирование переполнена - запрос отклоняется сразу"""
+
+    def __init__(self, retry_after):
+        super().__init__("Очередь кодирования переполнена")
+        self.retry_after = retry_after
+
+
+class InferenceTimeout(Exception):
+    """Запрос не успел закодироваться до своего дедлайна"""
+
+    def __init__(self, retry_after):
+        super().__init__("Истек срок ожидания кодирования")
+        self.retry_after = retry_after
+
+
+class _Job:
+    __slots__ = ('texts', 'deadline', 'future', 'submitted', 'started', 'finished')
+
+    def __init__(self, texts, deadline):
+        self.texts = texts
+        self.deadline = deadline
+        self.future = Future()
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.finished = None
+
+
+class InferencePool:
+    """Ограниченный пул потоков для кодирования запросов моделью.
+
+    Все обращения к SentenceTransformer идут через фиксированное число
+    рабочих потоков, каждому из которых выделено threads_per_worker потоков
+    torch. Очередь ограничена: при переполнении запрос отклоняется сразу,
+    а не ждет вместе со всеми.
+    """
+
+    def __init__(self, embedder, workers=2, threads_per_worker=1, queue_size=32,
+                 timeout_ms=2000, max_batch=16, batch_fn=None, name='inference'):
+        self.embedder = embedder
+        # batch_fn заменяет embedder.get_embeddings, например для оценки пар кросс-энкодером
+        self._batch_fn = batch_fn or embedder.get_embeddings
+        self.name = name
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.timeout = timeout_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._service_time = 0.05  # скользящая оценка времени на один запрос, с
+        self._stats_lock = threading.Lock()
+        self.stats = {'accepted': 0, 'rejected': 0, 'expired': 0, 'completed': 0}
+        self._stopped = threading.Event()
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(
+            f"Пул {name} запущен: {workers} потоков x {threads_per_worker} потоков torch, "
+            f"очередь {queue_size}, таймаут {timeout_ms} мс"
+        )
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def retry_after(self):
+        """Оценка в секундах, через сколько очередь успеет разгрузиться"""
+        backlog = self._queue.qsize() + self.workers
+        return max(1, math.ceil(backlog * self._service_time / self.workers))
+
+    def encode(self, text, timeout_ms=None):
+        """Кодирует текст в пуле; бросает InferenceOverloaded или InferenceTimeout"""
+        return self.encode_batch([text], timeout_ms=timeout_ms)[0]
+
+    def encode_batch(self, texts, timeout_ms=None):
+        """Кодирует список текстов одной задачей пула, возвращает матрицу эмбеддингов"""
+        timeout = self.timeout if timeout_ms is None else timeout_ms / 1000.0
+        job = _Job(list(texts), time.monotonic() + timeout)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._count('rejected')
+            raise InferenceOverloaded(self.retry_after())
+        self._count('accepted')
+
+        try:
+            result = job.future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Если кодирование еще не началось, рабочий поток пропустит задачу
+            job.future.cancel()
+            self._count('expired')
+            raise InferenceTimeout(self.retry_after())
+        # Ожидание в очереди и работа модели - отдельные этапы в журнале медленных запросов
+        record_stage(f"{self.name}_queue", (job.started - job.submitted) * 1000)
+        record_stage(f"{self.name}_model", (job.finished - job.started) * 1000)
+        return result
+
+    def _set_torch_threads(self):
+        try:
+            import torch
+            torch.set_num_threads(self.threads_per_worker)
+        except ImportError:
+            pass
+
+    def _next_batch(self):
+        """Забирает из очереди до max_batch задач, ожидая только первую"""
+        jobs = [self._queue.get()]
+        while len(jobs) < self.max_batch:
+            try:
+                jobs.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return jobs
+
+    def _run(self):
+        self._set_torch_threads()
+        while not self._stopped.is_set():
+            jobs = self._next_batch()
+            now = time.monotonic()
+            live = []
+            for job in jobs:
+                if job is None:
+                    continue
+                # Просроченные и отмененные задачи не кодируем
+                if job.deadline < now or not job.future.set_running_or_notify_cancel():
+                    continue
+                live.append(job)
+            if not live:
+                continue
+
+            texts = [text for job in live for text in job.texts]
+            started = time.perf_counter()
+            for job in live:
+                job.started = started
+            try:
+                embeddings = self._batch_fn(texts)
+            except Exception as e:
+                logger.exception(f"Ошибка обработки пачки в пуле {self.name}")
+                for job in live:
+                    job.future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+            elapsed = (finished - started) / len(texts)
+            self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+
+            offset = 0
+            for job in live:
+                job.finished = finished
+                job.future.set_result(embeddings[offset:offset + len(job.texts)])
+                offset += len(job.texts)
+            with self._stats_lock:
+                self.stats['completed'] += len(live)
+
+    def shutdown(self):
+        self._stopped.set()
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
@@ -0,0 +1,127 @@
+# Файл lexical_index.py
+import re
+import math
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text, analyzer='char', ngram_size=3):
+    """Разбивает текст на токены: слова или символьные n-граммы слов"""
+    words = WORD_RE.findall(text.lower().replace('ё', 'е'))
+    if analyzer == 'word':
+        return words
+
+    tokens = []
+    for word in words:
+        padded = f" {word} "
+        if len(padded) <= ngram_size:
+            tokens.append(padded)
+            continue
+        for i in range(len(padded) - ngram_size + 1):
+            tokens.append(padded[i:i + ngram_size])
+    return tokens
+
+
+class LexicalIndex:
+    """Инвертированный индекс BM25 по текстам вариантов вопросов.
+
+    Индекс неизменяемый: добавление документов возвращает новый экземпляр,
+    который разделяет с исходным все нетронутые списки вхождений.
+    """
+
+    def __init__(self, analyzer='char', ngram_size=3, k1=1.5, b=0.75):
+        self.analyzer = analyzer
+        self.ngram_size = ngram_size
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # токен -> (np.int32 номера документов, np.float32 частоты)
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+        self.length_norm = np.zeros(0, dtype=np.float32)
+
+    @property
+    def size(self):
+        return len(self.doc_lengths)
+
+    def build(self, texts):
+        """Строит индекс с нуля по списку текстов"""
+        index = LexicalIndex(self.analyzer, self.ngram_size, self.k1, self.b)
+        return index._with_documents(texts)
+
+    def add_documents(self, texts):
+        """Возвращает новый индекс с добавленными в конец документами"""
+        index = LexicalIndex(self.analyzer, self.ngram_size, self.k1, self.b)
+        index.postings = dict(self.postings)
+        index.doc_lengths = self.doc_lengths
+        return index._with_documents(texts)
+
+    def _with_documents(self, texts):
+        start = self.size
+        new_postings = {}
+        lengths = []
+        for offset, text in enumerate(texts):
+            tokens = tokenize(text, self.analyzer, self.ngram_size)
+            lengths.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            doc_id = start + offset
+            for token, count in counts.items():
+                new_postings.setdefault(token, []).append((doc_id, count))
+
+        for token, items in new_postings.items():
+            doc_ids = np.fromiter((d for d, _ in items), dtype=np.int32, count=len(items))
+            freqs = np.fromiter((c for _, c in items), dtype=np.float32, count=len(items))
+            if token in self.postings:
+                old_ids, old_freqs = self.postings[token]
+                doc_ids = np.concatenate([old_ids, doc_ids])
+                freqs = np.concatenate([old_freqs, freqs])
+            self.postings[token] = (doc_ids, freqs)
+
+        self.doc_lengths = np.concatenate([
+            self.doc_lengths, np.asarray(lengths, dtype=np.float32)
+        ])
+        self._update_length_norm()
+        return self
+
+    def _update_length_norm(self):
+        # Знаменатель BM25 зависит только от длины документа - считаем его один раз
+        avg_length = float(self.doc_lengths.mean()) if self.size else 1.0
+        self.length_norm = self.k1 * (
+            1 - self.b + self.b * self.doc_lengths / (avg_length or 1.0)
+        )
+
+    def memory_bytes(self):
+        """Оценка занимаемой памяти: массивы вхождений плюс накладные расходы словаря"""
+        total = self.doc_lengths.nbytes + self.length_norm.nbytes
+        for doc_ids, freqs in self.postings.values():
+            total += doc_ids.nbytes + freqs.nbytes + 200
+        return total
+
+    def score(self, text):
+        """Возвращает массив BM25-оценок запроса для всех документов"""
+        scores = np.zeros(self.size, dtype=np.float32)
+        if not self.size:
+            return scores
+
+        n_docs = self.size
+        for token in set(tokenize(text, self.analyzer, self.ngram_size)):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            doc_ids, freqs = posting
+            df = len(doc_ids)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            scores[doc_ids] += idf * freqs * (self.k1 + 1) / (freqs + self.length_norm[doc_ids])
+        return scores
+
+    def top_candidates(self, scores, limit):
+        """Возвращает номера документов с наибольшей ненулевой оценкой"""
+        nonzero = np.flatnonzero(scores)
+        if len(nonzero) > limit:
+            part = np.argpartition(scores[nonzero], -limit)[-limit:]
+            nonzero = nonzero[part]
+        return nonzero
@@ -0,0 +1,66 @@
+# Файл partitioning.py
+from datetime import datetime
+
+# user_questions секционируется по месяцам: секция pYYYYMM хранит строки этого месяца,
+# pmax - страховочная секция для строк после последней месячной
+PARTITIONED_TABLE = 'user_questions'
+MAXVALUE_PARTITION = 'pmax'
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(moment, months):
+    index = moment.year * 12 + moment.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"p{month:%Y%m}"
+
+
+def partition_month(name):
+    """Месяц секции по ее имени или None для pmax и чужих имен"""
+    try:
+        return datetime.strptime(name, "p%Y%m")
+    except (TypeError, ValueError):
+        return None
+
+
+def month_partitions(first_month, last_month):
+    """Определения месячных секций с first_month по last_month включительно"""
+    definitions = []
+    month = month_start(first_month)
+    while month <= last_month:
+        upper = add_months(month, 1)
+        definitions.append(
+            f"PARTITION {partition_name(month)} VALUES LESS THAN (UNIX_TIMESTAMP('{upper:%Y-%m-%d}'))"
+        )
+        month = upper
+    return definitions
+
+
+def partition_by_clause(first_month, last_month):
+    """PARTITION BY для CREATE/ALTER TABLE user_questions"""
+    definitions = month_partitions(first_month, last_month)
+    definitions.append(f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN MAXVALUE")
+    return f"PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) ({', '.join(definitions)})"
+
+
+def extend_partitions_sql(existing_names, until_month):
+    """ALTER TABLE, добавляющий месячные секции до until_month, или None, если они уже есть.
+
+    Новые секции выделяются из pmax: если в pmax нет строк, операция мгновенная.
+    """
+    months = [partition_month(name) for name in existing_names]
+    months = [month for month in months if month]
+    first = add_months(max(months), 1) if months else month_start(datetime.now())
+    definitions = month_partitions(first, until_month)
+    if not definitions:
+        return None
+    definitions.append(f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN MAXVALUE")
+    return (
+        f"ALTER TABLE {PARTITIONED_TABLE} REORGANIZE PARTITION {MAXVALUE_PARTITION} "
+        f"INTO ({', '.join(definitions)})"
+    )
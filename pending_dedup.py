@@ -0,0 +1,88 @@
+# Файл pending_dedup.py
+import threading
+import time
+import logging
+import numpy as np
+from search_index import EMBEDDING_DIM, normalize_rows
+from utils import query_blobs_to_matrix
+
+logger = logging.getLogger(__name__)
+
+
+class PendingDeduplicator:
+    """Скользящий индекс эмбеддингов недавних неотвеченных вопросов.
+
+    Новый промах, близкий к уже ожидающему вопросу (косинус не ниже radius),
+    увеличивает его hit_count вместо новой строки в pending_questions.
+    В памяти держится не больше capacity вопросов, увиденных за последние
+    window_hours часов; при переполнении вытесняется давно не повторявшийся.
+    """
+
+    def __init__(self, db, radius=0.9, capacity=10000, window_hours=72):
+        self.db = db
+        self.radius = radius
+        self.capacity = capacity
+        self.window = window_hours * 3600
+        self._lock = threading.Lock()
+        self._matrix = np.zeros((capacity, EMBEDDING_DIM), dtype=np.float32)
+        self._pending_ids = np.zeros(capacity, dtype=np.int64)
+        self._last_seen = np.full(capacity, -np.inf)
+        self.stats = {'inserted': 0, 'merged': 0}
+
+    def memory_bytes(self):
+        return self._matrix.nbytes + self._pending_ids.nbytes + self._last_seen.nbytes
+
+    def load(self):
+        """Заполняет индекс недавними необработанными вопросами из базы"""
+        rows = self.db.get_pending_with_embeddings(self.capacity, newest_first=True)
+        matrix, valid = query_blobs_to_matrix([row['embedding'] for row in rows], EMBEDDING_DIM)
+        rows = [rows[i] for i in valid]
+        now = time.time()
+        with self._lock:
+            if rows:
+                self._matrix[:len(rows)] = normalize_rows(matrix)
+            for i, row in enumerate(rows):
+                self._pending_ids[i] = row['pending_id']
+                last_seen = row.get('last_seen_at')
+                self._last_seen[i] = last_seen.timestamp() if last_seen else now
+        logger.info(f"Индекс неотвеченных вопросов загружен: {len(rows)} вопросов")
+        return len(rows)
+
+    def _find(self, vector, now):
+        """Слот ближайшего живого вопроса в радиусе или None"""
+        similarities = self._matrix @ vector
+        similarities[self._last_seen < now - self.window] = -np.inf
+        best = int(np.argmax(similarities))
+        return best if similarities[best] >= self.radius else None
+
+    def _remember(self, pending_id, vector, now):
+        slot = int(np.argmin(self._last_seen))
+        self._matrix[slot] = vector
+        self._pending_ids[slot] = pending_id
+        self._last_seen[slot] = now
+
+    def record_miss(self, user_question_id, embedding):
+        """Регистрирует неотвеченный вопрос; возвращает (pending_id, создана ли новая запись)"""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        vector = normalize_rows(vector)[0]
+        now = time.time()
+
+        # Запись в базу под блокировкой: одновременные одинаковые промахи не создадут дублей
+        with self._lock:
+            slot = self._find(vector, now)
+            if slot is not None:
+                pending_id = int(self._pending_ids[slot])
+                touched = self.db.touch_pending(pending_id)
+                if touched:
+                    self._last_seen[slot] = now
+                    self.stats['merged'] += 1
+                    return pending_id, False
+                if touched is False:
+                    # Оператор уже обработал вопрос - забываем его
+                    self._last_seen[slot] = -np.inf
+
+            pending_id = self.db.log_pending_question(user_question_id)
+            if pending_id:
+                self._remember(pending_id, vector, now)
+                self.stats['inserted'] += 1
+            return pending_id, True
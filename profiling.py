@@ -0,0 +1,166 @@
+# Файл profiling.py
+import os
+import sys
+import json
+import time
+import threading
+import logging
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+# Кадры из этих модулей на вершине стека - ожидание, а не работа
+IDLE_MODULES = ('threading.py', 'selectors.py', 'socket.py', 'socketserver.py', 'queue.py', 'ssl.py')
+
+
+class StageTimer:
+    """Времена этапов одного запроса в миллисекундах"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, name, ms):
+        self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+def start_request_timer():
+    _local.timer = StageTimer()
+    return _local.timer
+
+
+def finish_request_timer():
+    timer = getattr(_local, 'timer', None)
+    _local.timer = None
+    return timer
+
+
+def record_stage(name, ms):
+    """Добавляет время этапа к запросу текущего потока (вне запроса ничего не делает)"""
+    timer = getattr(_local, 'timer', None)
+    if timer is not None:
+        timer.add(name, ms)
+
+
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, (time.perf_counter() - started) * 1000)
+
+
+class SlowRequestLog:
+    """Медленные запросы с разбивкой по этапам: последние capacity в памяти и JSONL-файл"""
+
+    def __init__(self, threshold_ms=500, path=None, capacity=200):
+        self.threshold_ms = threshold_ms
+        self.path = path
+        self._entries = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def record(self, endpoint, timer, **extra):
+        """Сохраняет запрос, если он дольше порога; возвращает запись или None"""
+        total_ms = timer.total_ms
+        if total_ms < self.threshold_ms:
+            return None
+        entry = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'endpoint': endpoint,
+            'total_ms': round(total_ms, 1),
+            'stages': {name: round(ms, 1) for name, ms in timer.stages.items()},
+        }
+        entry.update(extra)
+        with self._lock:
+            self._entries.append(entry)
+            if self.path:
+                try:
+                    with open(self.path, 'a', encoding='utf-8') as file:
+                        file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                except OSError as e:
+                    logger.error(f"❌ Не удалось записать журнал медленных запросов: {e}")
+        logger.warning(f"Медленный запрос {endpoint}: {entry['total_ms']} мс, этапы {entry['stages']}")
+        return entry
+
+    def recent(self, limit=50):
+        with self._lock:
+            return list(self._entries)[-limit:][::-1]
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Семплирующий профилировщик всех потоков процесса.
+
+    Раз в interval_ms снимает стеки через sys._current_frames() и копит их в
+    свернутом формате flamegraph ("поток;кадр;кадр N"), который понимают
+    flamegraph.pl и speedscope. Одновременно идет только один сбор.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def capture(self, seconds, interval_ms=10, include_idle=False):
+        """Собирает профиль за seconds секунд; RuntimeError, если сбор уже идет"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Профилирование уже выполняется")
+        try:
+            own_thread = threading.get_ident()
+            stacks = Counter()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    if not include_idle and os.path.basename(frame.f_code.co_filename) in IDLE_MODULES:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame))
+                        frame = frame.f_back
+                    labels.append(names.get(thread_id, str(thread_id)))
+                    stacks[';'.join(reversed(labels))] += 1
+                samples += 1
+                time.sleep(interval_ms / 1000.0)
+        finally:
+            self._lock.release()
+        logger.info(f"Профиль собран: {samples} срезов, {len(stacks)} уникальных стеков")
+        return '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common()) + '\n'
+
+
+def model_memory_bytes(model):
+    """Память весов и буферов модели torch или None, если ее не удалось оценить"""
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except Exception:
+        return None
+
+
+def process_rss_bytes():
+    """Текущий RSS процесса (Linux) или пиковый, если /proc недоступен"""
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
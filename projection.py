@@ -0,0 +1,89 @@
+# Файл projection.py
+import os
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PCAProjection:
+    """Проекция эмбеддингов на главные компоненты матрицы вариантов базы знаний.
+
+    Компоненты считаются SVD нецентрированной матрицы: для нормированных строк
+    это лучшее приближение скалярных произведений заданной размерности, поэтому
+    близость проекций можно использовать для первого этапа поиска без
+    пересчета центра. energy - доля квадрата нормы матрицы, которую сохраняет
+    проекция; по ее падению на текущей базе видно, что проекцию пора пересчитать.
+    """
+
+    def __init__(self, components, fitted_rows, energy):
+        self.components = np.ascontiguousarray(components, dtype=np.float32)  # (dim, исходная размерность)
+        self.fitted_rows = int(fitted_rows)
+        self.energy = float(energy)
+
+    @property
+    def dim(self):
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, matrix, dim):
+        """Первые dim правых сингулярных векторов матрицы"""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        dim = min(dim, matrix.shape[1], len(matrix))
+        # Разложение матрицы Грама (d x d) дешевле SVD всей матрицы при n >> d
+        gram = matrix.T.astype(np.float64) @ matrix
+        eigenvalues, eigenvectors = np.linalg.eigh(gram)
+        top = np.argsort(eigenvalues)[::-1][:dim]
+        components = eigenvectors[:, top].T
+        total = float(np.trace(gram))
+        energy = float(eigenvalues[top].sum()) / total if total else 1.0
+        return cls(components, len(matrix), energy)
+
+    def project(self, matrix):
+        """Проекция строк (или одного вектора) в пространство компонент"""
+        return np.asarray(matrix, dtype=np.float32) @ self.components.T
+
+    def retained_energy(self, matrix):
+        """Доля квадрата нормы строк matrix, сохраняемая проекцией"""
+        total = float(np.square(matrix, dtype=np.float64).sum())
+        if not total:
+            return 1.0
+        return float(np.square(self.project(matrix), dtype=np.float64).sum()) / total
+
+    def needs_refit(self, matrix, max_change=0.2, max_energy_drop=0.02):
+        """True, если база заметно изменилась с момента расчета проекции"""
+        if self.components.shape[1] != matrix.shape[1]:
+            return True
+        change = abs(len(matrix) - self.fitted_rows) / max(self.fitted_rows, 1)
+        if change > max_change:
+            return True
+        return self.energy - self.retained_energy(matrix) > max_energy_drop
+
+    def memory_bytes(self):
+        return self.components.nbytes
+
+    def save(self, path):
+        """Сохраняет проекцию в npz (через временный файл, чтобы не оставить битый)"""
+        try:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = path + '.tmp.npz'
+            np.savez(temporary, components=self.components,
+                     fitted_rows=self.fitted_rows, energy=self.energy)
+            os.replace(temporary, path)
+            return True
+        except OSError as e:
+            logger.error(f"Ошибка сохранения проекции {path}: {e}")
+            return False
+
+    @classmethod
+    def load(cls, path):
+        """Загружает проекцию или возвращает None, если файла нет или он поврежден"""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                return cls(data['components'], data['fitted_rows'], data['energy'])
+        except (OSError, KeyError, ValueError) as e:
+            logger.error(f"Ошибка загрузки проекции {path}: {e}")
+            return None
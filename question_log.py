@@ -0,0 +1,262 @@
+# Файл question_log.py
+import os
+import json
+import base64
+import queue
+import threading
+import time
+import logging
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUESTION = 'question'  # вопрос пользователя; без ответа - еще и в очередь операторов
+PENDING = 'pending'    # уже записанный вопрос, который осталось поставить в очередь операторов
+
+
+def encode_record(record):
+    """Запись в строку JSONL: байты и эмбеддинги - base64, время - ISO"""
+    data = dict(record)
+    if data.get('embedding') is not None:
+        data['embedding'] = base64.b64encode(np.asarray(data['embedding'], dtype=np.float32).tobytes()).decode()
+    if data.get('embedding_blob') is not None:
+        data['embedding_blob'] = base64.b64encode(data['embedding_blob']).decode()
+    data['created_at'] = data['created_at'].isoformat(sep=' ', timespec='seconds')
+    return json.dumps(data, ensure_ascii=False)
+
+
+def decode_record(line):
+    data = json.loads(line)
+    if data.get('embedding') is not None:
+        data['embedding'] = np.frombuffer(base64.b64decode(data['embedding']), dtype=np.float32)
+    if data.get('embedding_blob') is not None:
+        data['embedding_blob'] = base64.b64decode(data['embedding_blob'])
+    data['created_at'] = datetime.fromisoformat(data['created_at'])
+    return data
+
+
+class Spool:
+    """Локальный журнал записей, которые не удалось отправить в базу (JSONL).
+
+    Записи дописываются в path; take() забирает накопленное целиком, переименовав
+    файл в path.replaying, и done() удаляет его после повторной записи или
+    оставляет в нем не записанный остаток. Если процесс упал посередине, остаток
+    будет взят повторно (возможен дубль).
+    """
+
+    def __init__(self, path, max_mb=100):
+        self.path = path
+        self.taking_path = path + '.replaying'
+        self.max_bytes = max_mb * 2 ** 20
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def size_bytes(self):
+        return sum(os.path.getsize(p) for p in (self.path, self.taking_path) if os.path.exists(p))
+
+    def append(self, record):
+        """Дописывает запись; False, если спул переполнен и запись отброшена"""
+        line = encode_record(record) + '\n'
+        with self._lock:
+            if self.size_bytes() + len(line) > self.max_bytes:
+                return False
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(line)
+        return True
+
+    def take(self):
+        """Все записи спула, включая не дописанные при прошлой попытке"""
+        with self._lock:
+            if os.path.exists(self.path):
+                if os.path.exists(self.taking_path):
+                    with open(self.path, encoding='utf-8') as source, \
+                            open(self.taking_path, 'a', encoding='utf-8') as target:
+                        target.write(source.read())
+                    os.remove(self.path)
+                else:
+                    os.replace(self.path, self.taking_path)
+        if not os.path.exists(self.taking_path):
+            return []
+        records = []
+        with open(self.taking_path, encoding='utf-8') as file:
+            for number, line in enumerate(file, 1):
+                try:
+                    records.append(decode_record(line))
+                except (ValueError, KeyError) as e:
+                    logger.error(f"❌ Поврежденная строка {number} спула {self.taking_path}: {e}")
+        return records
+
+    def done(self, remaining=()):
+        """Завершает повторную запись: remaining - не записанные записи, они
+        остаются в path.replaying до следующей попытки"""
+        with self._lock:
+            if remaining:
+                temporary = self.taking_path + '.tmp'
+                with open(temporary, 'w', encoding='utf-8') as file:
+                    file.writelines(encode_record(record) + '\n' for record in remaining)
+                os.replace(temporary, self.taking_path)
+            elif os.path.exists(self.taking_path):
+                os.remove(self.taking_path)
+
+
+class QuestionLog:
+    """Запись вопросов пользователей вне пути ответа.
+
+    Запрос только ставит запись в очередь; фоновый поток пишет ее в базу и
+    ставит вопрос без ответа в очередь операторов через pending_dedup() (None -
+    фонд выгружен из памяти, вопрос ставится в очередь без слияния повторов). Пока
+    база недоступна (db.available() ложно или запись не удалась), записи идут
+    в локальный спул и дописываются в базу, когда она снова отвечает, с
+    исходным временем вопроса. При переполнении очереди запись сразу уходит в спул.
+    """
+
+    def __init__(self, db, pending_dedup, spool, queue_size=1000, replay_interval=5.0, name=''):
+        self.db = db
+        self.pending_dedup = pending_dedup
+        self.spool = spool
+        self.replay_interval = replay_interval
+        self.name = name
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._next_replay = 0.0
+        self._has_spool = self.spool.size_bytes() > 0
+        self.stats = {'submitted': 0, 'written': 0, 'pending_written': 0, 'spooled': 0,
+                      'replayed': 0, 'dropped': 0}
+        self._thread = threading.Thread(target=self._run, name=f'question-log-{name}', daemon=True)
+        self._thread.start()
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def submit(self, record):
+        """Ставит запись в очередь, не блокируя запрос"""
+        record.setdefault('kind', QUESTION)
+        record.setdefault('created_at', datetime.now())
+        self._count('submitted')
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._spool(record)
+
+    def _spool(self, record):
+        if self.spool.append(record):
+            self._has_spool = True
+            self._count('spooled')
+            return False
+        self._count('dropped')
+        logger.error(f"❌ Спул {self.spool.path} переполнен, запись вопроса потеряна")
+        return False
+
+    def _run(self):
+        while True:
+            try:
+                record = self._queue.get(timeout=self.replay_interval)
+            except queue.Empty:
+                record = None
+            if record is not None:
+                try:
+                    self.store(record)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка записи вопроса: {e}")
+                    self._spool(record)
+            if self._has_spool and time.monotonic() >= self._next_replay and self.db.available():
+                self._next_replay = time.monotonic() + self.replay_interval
+                try:
+                    self.replay_spool()
+                except Exception as e:
+                    logger.error(f"❌ Ошибка повторной записи спула: {e}")
+
+    def store(self, record, spool=True):
+        """Пишет запись в базу; при недоступности базы - в спул. True, если запись в базе.
+
+        spool=False - не записанная запись не уходит в спул (она уже в нем: повторная запись)
+        """
+        failed = self._spool if spool else lambda record: False
+        if not self.db.available():
+            return failed(record)
+
+        if record['kind'] == PENDING:
+            pending_dedup = self.pending_dedup()
+            if pending_dedup is not None:
+                pending_id, created = pending_dedup.record_miss(record['user_question_id'], record['embedding'])
+            else:
+                pending_id, created = self.db.log_pending_question(record['user_question_id']), True
+            if not pending_id:
+                return failed(record)
+            self._count('pending_written')
+            if created:
+                logger.info(f"Вопрос добавлен в ожидание обработки, ID: {pending_id}")
+            else:
+                logger.info(f"Повтор неотвеченного вопроса, счетчик увеличен у ID: {pending_id}")
+            return True
+
+        question_id = self.db.log_user_question(
+            session_id=record['session_id'],
+            client_id=record['client_id'],
+            raw_question=record['raw_question'],
+            normalized_text=record['normalized_text'],
+            embedding=record['embedding_blob'],
+            is_found=record['is_found'],
+            response_time_ms=record['response_time_ms'],
+            standard_question_id=record.get('standard_question_id'),
+            answer_id=record.get('answer_id'),
+            confidence=record.get('confidence'),
+            created_at=record['created_at']
+        )
+        if not question_id:
+            return failed(record)
+        self._count('written')
+        if not record['is_found']:
+            # Вопрос уже в базе - в спул при ошибке попадет только постановка в очередь
+            pending = {'kind': PENDING, 'user_question_id': question_id,
+                       'embedding': record['embedding'], 'created_at': record['created_at']}
+            if not self.store(pending, spool) and not spool:
+                # При повторной записи в спуле остается только постановка в очередь
+                record.clear()
+                record.update(pending)
+                return False
+        return True
+
+    def replay_spool(self):
+        """Дописывает в базу накопленное в спуле; возвращает число записанных"""
+        self._has_spool = False
+        records = self.spool.take()
+        if not records:
+            self.spool.done()
+            return 0
+        logger.info(f"📤 Дописываем в базу {len(records)} записей из спула {self.spool.path}")
+        # До первой ошибки: не записанный остаток остается в файле спула, а не
+        # дописывается в него заново (заново он мог бы не пройти проверку размера)
+        written = 0
+        for record in records:
+            if not self.store(record, spool=False):
+                break
+            written += 1
+        self.spool.done(records[written:])
+        self._count('replayed', written)
+        if written < len(records):
+            self._has_spool = True
+            logger.warning(f"⚠️ База снова недоступна: {len(records) - written} записей остались в спуле")
+        return written
+
+    def close(self, timeout=5.0):
+        """Переносит еще не записанные записи очереди в спул (при остановке сервера)"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._spool(record)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['queue'] = self._queue.qsize()
+        stats['spool_bytes'] = self.spool.size_bytes()
+        stats['db_available'] = self.db.available()
+        return stats
@@ -0,0 +1,161 @@
+# Файл related_questions.py
+import logging
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Близость двух стандартных вопросов
+RELATED_CENTROID = 'centroid'  # косинус между средними эмбеддингами вариантов
+RELATED_MAX = 'max'            # максимум косинуса по всем парам их вариантов
+RELATED_METHODS = (RELATED_CENTROID, RELATED_MAX)
+
+
+def _question_blocks(std_question_ids):
+    """Порядок строк по вопросу, уникальные id и начала блоков каждого вопроса"""
+    order = np.argsort(std_question_ids, kind='stable')
+    ids, starts = np.unique(std_question_ids[order], return_index=True)
+    return order, ids, starts
+
+
+def question_similarity_rows(matrix, order, starts, method, memory_mb=256):
+    """Генератор (первый вопрос, блок близостей вопросов с остальными вопросами).
+
+    matrix - нормированные строки вариантов, order и starts - из _question_blocks.
+    Память на блок ограничена memory_mb.
+    """
+    n_questions = len(starts)
+    sorted_matrix = matrix[order]
+    bounds = np.append(starts, len(order))
+
+    if method == RELATED_CENTROID:
+        centroids = np.add.reduceat(sorted_matrix, starts, axis=0)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (centroids / norms).astype(np.float32)
+        block = max(1, int(memory_mb * 2 ** 20 // (4 * max(n_questions, 1))))
+        for first in range(0, n_questions, block):
+            yield first, centroids[first:first + block] @ centroids.T
+        return
+
+    # max: близость вариантов блока со всеми вариантами сворачивается максимумом
+    # сначала по столбцам (вопросы-кандидаты), затем по строкам (вопросы блока)
+    max_rows = max(1, int(memory_mb * 2 ** 20 // (4 * max(len(order), 1))))
+    first = 0
+    while first < n_questions:
+        last = first + 1
+        while last < n_questions and bounds[last + 1] - bounds[first] <= max_rows:
+            last += 1
+        rows = sorted_matrix[bounds[first]:bounds[last]]
+        by_column = np.maximum.reduceat(rows @ sorted_matrix.T, starts, axis=1)
+        yield first, np.maximum.reduceat(by_column, bounds[first:last] - bounds[first], axis=0)
+        first = last
+
+
+def build_related(std_question_ids, matrix, n_related=3, method=RELATED_CENTROID,
+                  min_similarity=0.0, memory_mb=256):
+    """Граф похожих вопросов: для каждого вопроса - до n_related ближайших других.
+
+    Возвращает (ids вопросов по возрастанию, матрица соседей int32 n x n_related).
+    Соседи заданы номерами строк в ids по убыванию близости, пустые места - -1.
+    """
+    if method not in RELATED_METHODS:
+        raise ValueError(f"Неизвестный метод близости вопросов: {method}")
+    order, ids, starts = _question_blocks(np.asarray(std_question_ids))
+    neighbors = np.full((len(ids), n_related), -1, dtype=np.int32)
+    k = min(n_related, len(ids) - 1)
+    if k <= 0:
+        return ids, neighbors
+
+    for first, similarities in question_similarity_rows(matrix, order, starts, method, memory_mb):
+        rows = np.arange(len(similarities))
+        similarities[rows, first + rows] = -np.inf  # сам вопрос не считается похожим
+        top = np.argpartition(similarities, -k, axis=1)[:, -k:]
+        top_similarities = similarities[rows[:, None], top]
+        ranking = np.argsort(-top_similarities, axis=1)
+        top = np.take_along_axis(top, ranking, axis=1)
+        top[np.take_along_axis(top_similarities, ranking, axis=1) < min_similarity] = -1
+        neighbors[first:first + len(similarities), :k] = top
+    return ids, neighbors
+
+
+class RelatedQuestions:
+    """Предрассчитанные похожие вопросы для поля followup ответа.
+
+    Граф строится по снимку индекса поиска и подменяется целиком, поэтому
+    чтение - поиск строки вопроса и одна строка массива соседей - без блокировок.
+    """
+
+    def __init__(self, n_related=3, method=RELATED_CENTROID, min_similarity=0.5, memory_mb=256):
+        if method not in RELATED_METHODS:
+            raise ValueError(f"Неизвестный метод близости вопросов: {method}")
+        self.n_related = n_related
+        self.method = method
+        self.min_similarity = min_similarity
+        self.memory_mb = memory_mb
+        self._graph = ({}, np.zeros((0, n_related), dtype=np.int32), np.zeros(0, dtype=np.int64), [])
+        self._lock = threading.Lock()
+        self._building = False
+        self._dirty = False
+
+    def rebuild(self, search_index):
+        """Пересчитывает граф по текущему содержимому индекса поиска"""
+        if self.n_related <= 0:
+            return 0
+        started = time.perf_counter()
+        # Для близости центроидов достаточно строки на вопрос - у шардированного индекса
+        # по сети передаются только они
+        std_question_ids, titles, matrix = search_index.variant_vectors(
+            per_question=self.method == RELATED_CENTROID
+        )
+        ids, neighbors = build_related(
+            std_question_ids, matrix, self.n_related, self.method, self.min_similarity, self.memory_mb
+        )
+        title_by_id = dict(zip(std_question_ids.tolist(), titles))
+        row_of = {question_id: row for row, question_id in enumerate(ids.tolist())}
+        self._graph = (row_of, neighbors, ids, [title_by_id[i] for i in ids.tolist()])
+        logger.info(
+            f"Граф похожих вопросов построен: {len(ids)} вопросов, "
+            f"метод '{self.method}', {time.perf_counter() - started:.2f} с"
+        )
+        return len(ids)
+
+    def schedule_rebuild(self, search_index):
+        """Пересчет в фоновом потоке; изменения во время расчета дают еще один проход"""
+        if self.n_related <= 0:
+            return
+        with self._lock:
+            if self._building:
+                self._dirty = True
+                return
+            self._building = True
+        threading.Thread(target=self._rebuild_loop, args=(search_index,),
+                         name='related-rebuild', daemon=True).start()
+
+    def _rebuild_loop(self, search_index):
+        while True:
+            try:
+                self.rebuild(search_index)
+            except Exception as e:
+                logger.error(f"❌ Ошибка построения графа похожих вопросов: {e}")
+            with self._lock:
+                if not self._dirty:
+                    self._building = False
+                    return
+                self._dirty = False
+
+    def memory_bytes(self):
+        row_of, neighbors, ids, titles = self._graph
+        return neighbors.nbytes + ids.nbytes + len(row_of) * 100 + sum(len(title) * 2 + 60 for title in titles)
+
+    def followups(self, std_question_id):
+        """Похожие вопросы для ответа: [{'std_question_id', 'title'}]"""
+        row_of, neighbors, ids, titles = self._graph
+        row = row_of.get(std_question_id)
+        if row is None:
+            return []
+        return [
+            {'std_question_id': int(ids[i]), 'title': titles[i]}
+            for i in neighbors[row] if i >= 0
+        ]
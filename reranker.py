@@ -0,0 +1,126 @@
+# Файл reranker.py
+import threading
+import time
+import logging
+from collections import OrderedDict
+import numpy as np
+from inference_pool import InferencePool
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """Второй этап каскада: кросс-энкодер переоценивает кандидатов би-энкодера.
+
+    Вызывается только для запросов в неоднозначной полосе близости. Пары
+    (запрос, вариант) оцениваются в собственном ограниченном пуле с
+    микро-пакетированием; оценки кэшируются (LRU) по (запрос, текст варианта),
+    поэтому кэш общий для всех фондов.
+    """
+
+    def __init__(self, model_path, threshold=0.0, workers=1, threads_per_worker=1,
+                 queue_size=16, timeout_ms=1000, max_batch=64, cache_size=10000):
+        from sentence_transformers import CrossEncoder
+
+        logger.info(f"Загрузка кросс-энкодера из {model_path}")
+        self.model = CrossEncoder(model_path)
+        self.threshold = threshold
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'queries': 0,         # всего решений каскада
+            'ambiguous': 0,       # запросов в неоднозначной полосе
+            'reranked': 0,        # из них оценено кросс-энкодером
+            'accepted': 0,        # кросс-энкодер подтвердил ответ
+            'rejected': 0,        # кросс-энкодер отклонил все кандидаты
+            'changed': 0,         # выбран другой стандартный вопрос, чем у би-энкодера
+            'fallback': 0,        # пул перегружен - решение осталось за би-энкодером
+            'pairs_scored': 0,
+            'cache_hits': 0,
+            'rerank_ms_total': 0.0,
+        }
+        self.pool = InferencePool(
+            None, workers=workers, threads_per_worker=threads_per_worker,
+            queue_size=queue_size, timeout_ms=timeout_ms, max_batch=max_batch,
+            batch_fn=self._predict, name='rerank'
+        )
+
+    def _predict(self, pairs):
+        return np.asarray(self.model.predict(pairs, batch_size=self.max_batch), dtype=np.float32)
+
+    def count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def score(self, query, candidates, record=True):
+        """Оценки кросс-энкодера для кандидатов; бросает InferenceOverloaded/InferenceTimeout.
+
+        record=False - теневая проверка: недостающие пары оцениваются в вызывающем
+        потоке мимо пула (не занимают его очередь), без счетчиков и записи в кэш.
+        """
+        scores = np.zeros(len(candidates), dtype=np.float32)
+        missing = []
+        if not record:
+            with self._lock:
+                cached = [self._cache.get((query, candidate['variant_text'])) for candidate in candidates]
+            missing = [i for i, value in enumerate(cached) if value is None]
+            for i, value in enumerate(cached):
+                if value is not None:
+                    scores[i] = value
+            if missing:
+                scores[missing] = self._predict([(query, candidates[i]['variant_text']) for i in missing])
+            return scores
+
+        with self._lock:
+            for i, candidate in enumerate(candidates):
+                key = (query, candidate['variant_text'])
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[i] = self._cache[key]
+                else:
+                    missing.append(i)
+            self.stats['cache_hits'] += len(candidates) - len(missing)
+
+        if missing:
+            pairs = [(query, candidates[i]['variant_text']) for i in missing]
+            predicted = self.pool.encode_batch(pairs)
+            with self._lock:
+                self.stats['pairs_scored'] += len(pairs)
+                for i, value in zip(missing, predicted):
+                    scores[i] = value
+                    self._cache[(query, candidates[i]['variant_text'])] = float(value)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, query, candidates, record=True):
+        """Лучший кандидат по кросс-энкодеру или None, если оценка ниже порога.
+        record=False - теневая проверка: без счетчиков и мимо пула (см. score)"""
+        started = time.perf_counter()
+        scores = self.score(query, candidates, record)
+        best = int(np.argmax(scores))
+        if record:
+            with self._lock:
+                self.stats['reranked'] += 1
+                self.stats['rerank_ms_total'] += (time.perf_counter() - started) * 1000
+        if scores[best] < self.threshold:
+            if record:
+                self.count('rejected')
+            return None
+        if record:
+            self.count('accepted')
+        return dict(candidates[best], rerank_score=float(scores[best]))
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['cache_size'] = len(self._cache)
+        stats['rerank_rate'] = round(stats['reranked'] / stats['queries'], 4) if stats['queries'] else None
+        stats['avg_rerank_ms'] = round(stats['rerank_ms_total'] / stats['reranked'], 2) if stats['reranked'] else None
+        stats['pool'] = dict(self.pool.stats)
+        return stats
+
+    def shutdown(self):
+        self.pool.shutdown()
@@ -0,0 +1,283 @@
+# scripts/batch_answer.py
+import sys
+import os
+import argparse
+import csv
+import gzip
+import json
+import logging
+import multiprocessing
+import time
+from collections import deque
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+from storage import open_storage
+from search_index import index_from_settings
+from tenants import parse_mapping
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+RESULT_FIELDS = ['found', 'answer', 'intent', 'confidence', 'std_question_id', 'matched_question', 'alternatives']
+
+# Модель процесса кодирования (в пуле - своя у каждого процесса)
+_embedder = None
+
+
+def detect_format(path, explicit=None):
+    """Формат файла: явно заданный или по расширению (.csv, .jsonl/.ndjson, в том числе .gz)"""
+    if explicit:
+        return explicit
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return FORMAT_CSV
+    if name.endswith(('.jsonl', '.ndjson')):
+        return FORMAT_JSONL
+    raise ValueError(f"Не удалось определить формат файла {path}: укажите --input-format/--output-format")
+
+
+def open_text(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def read_records(path, fmt, column):
+    """Потоково отдает (исходная запись, вопрос) из CSV с заголовком или JSONL"""
+    with open_text(path, 'r') as file:
+        if fmt == FORMAT_CSV:
+            reader = csv.DictReader(file)
+            if column not in (reader.fieldnames or []):
+                raise ValueError(f"В CSV нет столбца '{column}' (есть: {', '.join(reader.fieldnames or [])})")
+            for row in reader:
+                yield row, (row.get(column) or '').strip()
+            return
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                logger.warning(f"⚠️ Строка {number} пропущена: {e}")
+                continue
+            yield record, str(record.get(column) or '').strip()
+
+
+def chunks(records, size, limit=None):
+    """Пачки по size записей; limit ограничивает общее число записей"""
+    chunk = []
+    for served, record in enumerate(records):
+        if limit is not None and served >= limit:
+            break
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def init_encoder(model_path, torch_threads):
+    global _embedder
+    from embedding_model import EmbeddingModel
+    if torch_threads:
+        try:
+            import torch
+            torch.set_num_threads(torch_threads)
+        except ImportError:
+            pass
+    _embedder = EmbeddingModel(model_path)
+
+
+def encode_questions(questions, batch_size):
+    """Нормализует и кодирует вопросы пачки, возвращает (нормализованные тексты, матрица)"""
+    normalized = [_embedder.normalize_text(question) for question in questions]
+    return normalized, _embedder.get_embeddings(normalized, batch_size=batch_size)
+
+
+def encoded_chunks(chunk_iter, workers, batch_size, prefetch, torch_threads):
+    """Отдает (пачка, нормализованные тексты, эмбеддинги) по порядку пачек.
+
+    С workers > 1 пачки кодируются пулом процессов; одновременно в работе не
+    больше prefetch пачек, поэтому память не зависит от размера входа.
+    """
+    if workers <= 1:
+        init_encoder(config.MODEL_PATH, torch_threads)
+        for chunk in chunk_iter:
+            yield (chunk,) + encode_questions([question for _, question in chunk], batch_size)
+        return
+
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers, initializer=init_encoder, initargs=(config.MODEL_PATH, torch_threads)) as pool:
+        in_flight = deque()
+        for chunk in chunk_iter:
+            questions = [question for _, question in chunk]
+            in_flight.append((chunk, pool.apply_async(encode_questions, (questions, batch_size))))
+            if len(in_flight) >= prefetch:
+                chunk, result = in_flight.popleft()
+                yield (chunk,) + result.get()
+        while in_flight:
+            chunk, result = in_flight.popleft()
+            yield (chunk,) + result.get()
+
+
+def answer_chunk(index, answers, questions, normalized, embeddings, top_k, threshold):
+    """Ответы на пачку: один поиск по всей пачке, лучший вопрос и top_k различных вопросов"""
+    # Берем с запасом вариантов, чтобы получить top_k различных стандартных вопросов
+    batch = index.search_batch(embeddings, texts=normalized, top_k=top_k * 5)
+    results = []
+    for question, candidates in zip(questions, batch):
+        distinct = {}
+        for candidate in candidates:
+            distinct.setdefault(candidate['std_question_id'], candidate)
+        ranked = list(distinct.values())[:top_k]
+        best = ranked[0] if ranked and question else None
+        found = best is not None and best['similarity'] >= threshold
+        results.append({
+            'found': found,
+            'answer': answers.get(best['answer_id'], '') if found else '',
+            'intent': best['intent'] if found else '',
+            'confidence': round(best['similarity'], 4) if best else 0.0,
+            'std_question_id': best['std_question_id'] if found else None,
+            'matched_question': best['title'] if best else '',
+            'alternatives': [
+                {'std_question_id': r['std_question_id'], 'title': r['title'],
+                 'similarity': round(r['similarity'], 4)}
+                for r in ranked[1:]
+            ] if best else []
+        })
+    return results
+
+
+class ResultWriter:
+    """Пишет результаты по мере готовности: исходные поля записи плюс RESULT_FIELDS"""
+
+    def __init__(self, path, fmt):
+        self.fmt = fmt
+        self.file = open_text(path, 'w')
+        self.writer = None
+
+    def write(self, chunk, results):
+        for (record, _), result in zip(chunk, results):
+            if self.fmt == FORMAT_JSONL:
+                self.file.write(json.dumps({**record, **result}, ensure_ascii=False) + '\n')
+                continue
+            if self.writer is None:
+                fields = list(record) + [field for field in RESULT_FIELDS if field not in record]
+                self.writer = csv.DictWriter(self.file, fieldnames=fields, extrasaction='ignore')
+                self.writer.writeheader()
+            row = {**record, **result}
+            row['alternatives'] = json.dumps(result['alternatives'], ensure_ascii=False)
+            self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def batch_answer(args):
+    schemas = parse_mapping(config.TENANTS) or {'default': config.DB_NAME}
+    if args.tenant not in schemas:
+        logger.error(f"❌ Неизвестный фонд: {args.tenant}")
+        return False
+    db = open_storage(config, schemas[args.tenant])
+    index = index_from_settings(config)
+    if not index.load(db.get_all_variants() or []):
+        logger.error("❌ Индекс пуст - загрузите данные через load_data.py")
+        return False
+    answers = {row['id']: row['text'] for row in db.get_all_answers() or []}
+    threshold = args.threshold if args.threshold is not None else config.SIMILARITY_THRESHOLD
+
+    input_format = detect_format(args.input, args.input_format)
+    output_format = detect_format(args.output, args.output_format)
+    records = read_records(args.input, input_format, args.column)
+    writer = ResultWriter(args.output, output_format)
+    logger.info(f"📥 {args.input} -> {args.output}: пачки по {args.chunk_size}, "
+                f"процессов кодирования: {max(args.workers, 1)}, порог {threshold}")
+
+    totals = {'questions': 0, 'found': 0, 'wait_encode': 0.0, 'search': 0.0, 'write': 0.0}
+    started = last_report = time.perf_counter()
+    try:
+        stream = encoded_chunks(chunks(records, args.chunk_size, args.limit), args.workers,
+                                args.batch_size, args.prefetch, args.torch_threads)
+        while True:
+            waited = time.perf_counter()
+            item = next(stream, None)
+            totals['wait_encode'] += time.perf_counter() - waited
+            if item is None:
+                break
+            chunk, normalized, embeddings = item
+
+            moment = time.perf_counter()
+            results = answer_chunk(index, answers, [question for _, question in chunk], normalized,
+                                   embeddings, args.top_k, threshold)
+            totals['search'] += time.perf_counter() - moment
+
+            moment = time.perf_counter()
+            writer.write(chunk, results)
+            totals['write'] += time.perf_counter() - moment
+
+            totals['questions'] += len(chunk)
+            totals['found'] += sum(1 for result in results if result['found'])
+            now = time.perf_counter()
+            if now - last_report >= args.report_every:
+                last_report = now
+                logger.info(f"⏱️ Обработано {totals['questions']} вопросов, "
+                            f"{totals['questions'] / (now - started):.1f} вопросов/с")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    questions = totals['questions']
+    print("\n" + "=" * 60)
+    print(f"Вопросов:                 {questions}")
+    print(f"Найден ответ:             {totals['found']} ({totals['found'] / questions:.1%})" if questions else
+          "Найден ответ:             0")
+    print(f"Всего, с:                 {elapsed:.2f}")
+    print(f"Ожидание кодирования, с:  {totals['wait_encode']:.2f}")
+    print(f"Поиск, с:                 {totals['search']:.2f}")
+    print(f"Запись, с:                {totals['write']:.2f}")
+    print(f"Пропускная способность:   {questions / elapsed if elapsed else 0.0:.1f} вопросов/с")
+    print("=" * 60)
+    logger.info(f"💾 Результаты сохранены в {args.output}")
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Пакетные ответы на вопросы из CSV/JSONL без сервера')
+    parser.add_argument('--input', required=True, help='Входной CSV с заголовком или JSONL (можно .gz)')
+    parser.add_argument('--output', required=True, help='Выходной CSV или JSONL (можно .gz)')
+    parser.add_argument('--input-format', choices=[FORMAT_CSV, FORMAT_JSONL], help='По умолчанию - по расширению')
+    parser.add_argument('--output-format', choices=[FORMAT_CSV, FORMAT_JSONL], help='По умолчанию - по расширению')
+    parser.add_argument('--column', default='question', help='Столбец CSV или поле JSONL с вопросом')
+    parser.add_argument('--tenant', default='default', help='Фонд, по базе которого отвечать')
+    parser.add_argument('--top-k', type=int, default=3, help='Лучший вопрос и альтернативы: всего различных вопросов')
+    parser.add_argument('--threshold', type=float, help='Порог ответа (по умолчанию SIMILARITY_THRESHOLD)')
+    parser.add_argument('--chunk-size', type=int, default=2048, help='Вопросов в пачке поиска и записи')
+    parser.add_argument('--batch-size', type=int, default=128, help='Размер пачки модели')
+    parser.add_argument('--workers', type=int, default=1, help='Процессов кодирования (1 - в этом процессе)')
+    parser.add_argument('--torch-threads', type=int, default=0, help='Потоков torch на процесс (0 - по умолчанию)')
+    parser.add_argument('--prefetch', type=int, default=0,
+                        help='Пачек в работе у пула одновременно (0 - 2 x workers)')
+    parser.add_argument('--limit', type=int, help='Обработать не больше N вопросов')
+    parser.add_argument('--report-every', type=float, default=10.0, help='Интервал отчета о скорости, с')
+    args = parser.parse_args()
+    args.prefetch = args.prefetch or 2 * max(args.workers, 1)
+
+    try:
+        success = batch_answer(args)
+    except (OSError, ValueError) as e:
+        logger.error(f"❌ {e}")
+        success = False
+    if not success:
+        sys.exit(1)
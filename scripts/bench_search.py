@@ -0,0 +1,96 @@
+# scripts/bench_search.py
+import sys
+import os
+import argparse
+import csv
+import logging
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+from storage import open_storage
+from embedding_model import EmbeddingModel
+from search_index import SearchIndex, SEARCH_MODES
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def read_queries(csv_file, limit):
+    """Читает из CSV пары (вариант вопроса, intent) для замера"""
+    queries = []
+    with open(csv_file, 'r', encoding='utf-8') as file:
+        for row in csv.reader(file, delimiter=',', quotechar='"'):
+            if len(row) < 5 or row[2].strip() == 'intent':
+                continue
+            variant_text = row[3].strip()
+            if variant_text:
+                queries.append((variant_text, row[2].strip()))
+            if len(queries) >= limit:
+                break
+    return queries
+
+
+def bench_search(csv_file, limit, repeat):
+    """Замеряет задержку и точность intent для каждого режима поиска"""
+    db = open_storage(config)
+    embedder = EmbeddingModel(config.MODEL_PATH)
+
+    index = SearchIndex(
+        lexical_analyzer=config.LEXICAL_ANALYZER,
+        ngram_size=config.LEXICAL_NGRAM_SIZE,
+        lexical_candidates=config.LEXICAL_CANDIDATES,
+        fusion_weight=config.FUSION_WEIGHT
+    )
+    if not index.load(db.get_all_variants()):
+        logger.error("❌ Индекс пуст - загрузите данные через load_data.py")
+        return False
+
+    queries = read_queries(csv_file, limit)
+    if not queries:
+        logger.error("❌ В файле нет вопросов для замера")
+        return False
+
+    texts = [embedder.normalize_text(text) for text, _ in queries]
+    embeddings = embedder.get_embeddings(texts)
+    logger.info(f"📐 Индекс: {index.size} вариантов, запросов: {len(queries)}, повторов: {repeat}")
+
+    print("\n" + "=" * 80)
+    print(f"{'Режим':<12} | {'mean, мс':>9} | {'p50, мс':>9} | {'p95, мс':>9} | {'p99, мс':>9} | {'Точность intent':>15}")
+    print("-" * 80)
+    for mode in SEARCH_MODES:
+        timings = []
+        correct = 0
+        for _ in range(repeat):
+            for (_, intent), text, embedding in zip(queries, texts, embeddings):
+                started = time.perf_counter()
+                result = index.find_closest(embedding, text=text, mode=mode)
+                timings.append((time.perf_counter() - started) * 1000)
+                if result and result['intent'] == intent:
+                    correct += 1
+        timings = np.array(timings)
+        accuracy = correct / (len(queries) * repeat)
+        print(f"{mode:<12} | {timings.mean():>9.3f} | {np.percentile(timings, 50):>9.3f} | "
+              f"{np.percentile(timings, 95):>9.3f} | {np.percentile(timings, 99):>9.3f} | {accuracy:>15.2%}")
+    print("=" * 80)
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сравнение задержки режимов поиска')
+    parser.add_argument('--file', type=str, default='base_qu_an/qu_ans_1.csv',
+                        help='CSV файл с вариантами вопросов для замера')
+    parser.add_argument('--limit', type=int, default=500, help='Максимум запросов из файла')
+    parser.add_argument('--repeat', type=int, default=3, help='Сколько раз повторить набор запросов')
+    args = parser.parse_args()
+
+    if not bench_search(args.file, args.limit, args.repeat):
+        sys.exit(1)
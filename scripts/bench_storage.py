@@ -0,0 +1,155 @@
+# scripts/bench_storage.py
+import sys
+import os
+import argparse
+import logging
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+from storage import STORAGE_MYSQL, STORAGE_SQLITE
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def open_backend(backend, workdir, mysql_database):
+    if backend == STORAGE_SQLITE:
+        from sqlite_storage import SQLiteDatabase
+        return SQLiteDatabase(
+            os.path.join(workdir, 'bench.db'),
+            batch_window_ms=config.SQLITE_BATCH_WINDOW_MS,
+            batch_size=config.SQLITE_BATCH_SIZE
+        )
+    from database import Database
+    return Database(config.DB_HOST, config.DB_USER, config.DB_PASSWORD, mysql_database)
+
+
+def run_threads(threads, operations, operation):
+    """Выполняет operations вызовов operation(i) в threads потоках, возвращает операций в секунду"""
+    per_thread = operations // threads
+    errors = []
+
+    def worker(n):
+        for i in range(n * per_thread, (n + 1) * per_thread):
+            if operation(i) is None:
+                errors.append(i)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        logger.warning(f"⚠️ Ошибок: {len(errors)}")
+    return per_thread * threads / elapsed
+
+
+def bench_backend(db, variants, operations, threads):
+    """Замеры одного хранилища: {название: операций в секунду}"""
+    rng = np.random.default_rng(0)
+    results = {}
+
+    group_id = db.insert_group(f"bench-{time.time_ns()}")
+    answer_ids = db.insert_answers([f"Ответ {i}" for i in range(10)])
+    if group_id is None or answer_ids is None:
+        raise ConnectionError("Не удалось создать данные для замера")
+    started = time.perf_counter()
+    db.insert_standard_questions([
+        {'title': f"Вопрос {i}", 'group_id': group_id, 'answer_id': answer_ids[i % 10], 'intent': f"intent_{i}",
+         'variants': [(f"вариант {i}", rng.standard_normal(384).astype(np.float32).tobytes())]}
+        for i in range(variants)
+    ])
+    results['insert_standard_questions (вариантов/с)'] = variants / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    loaded = len(db.get_all_variants())
+    results['get_all_variants (строк/с)'] = loaded / (time.perf_counter() - started)
+
+    blob = rng.standard_normal(384).astype(np.float32).tobytes()
+
+    def log_question(i):
+        return db.log_user_question(
+            session_id=f"s{i}", client_id=None, raw_question=f"вопрос {i}", normalized_text=f"вопрос {i}",
+            embedding=blob, is_found=bool(i % 2), response_time_ms=20, confidence=0.5
+        )
+
+    results['log_user_question, 1 поток'] = run_threads(1, operations // 4, log_question)
+    results[f'log_user_question, {threads} потоков'] = run_threads(threads, operations, log_question)
+
+    first_question = db.log_user_question('s', None, 'q', 'q', blob, False, 1)
+    pending_ids = [db.log_pending_question(first_question) for _ in range(100)]
+    results[f'touch_pending, {threads} потоков'] = run_threads(
+        threads, operations, lambda i: db.touch_pending(pending_ids[i % len(pending_ids)])
+    )
+    results[f'get_answer_text, {threads} потоков'] = run_threads(
+        threads, operations, lambda i: db.get_answer_text(answer_ids[i % 10])
+    )
+    results[f'get_pending_page, {threads} потоков'] = run_threads(
+        threads, operations // 10, lambda i: db.get_pending_page(order='frequent', limit=20)
+    )
+    stats = getattr(db, 'stats', None)
+    if stats and stats.get('batches'):
+        results['записей на фиксацию (SQLite)'] = stats['writes'] / stats['batches']
+    return results
+
+
+def print_report(report):
+    backends = list(report)
+    names = list(dict.fromkeys(name for results in report.values() for name in results))
+    print("\n" + "=" * 80)
+    print(f"{'Операция':<44}" + "".join(f"{backend:>18}" for backend in backends))
+    print("-" * 80)
+    for name in names:
+        print(f"{name:<44}" + "".join(
+            f"{report[backend][name]:>18,.1f}" if name in report[backend] else f"{'-':>18}"
+            for backend in backends
+        ))
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сравнение пропускной способности хранилищ')
+    parser.add_argument('--backends', default=STORAGE_SQLITE,
+                        help=f'Через запятую: {STORAGE_SQLITE}, {STORAGE_MYSQL}')
+    parser.add_argument('--mysql-database',
+                        help='Отдельная схема MySQL, созданная init_db.py (замер пишет в нее тестовые данные)')
+    parser.add_argument('--variants', type=int, default=5000, help='Вариантов в базе знаний')
+    parser.add_argument('--operations', type=int, default=4000, help='Операций в каждом замере')
+    parser.add_argument('--threads', type=int, default=8, help='Параллельных потоков')
+    args = parser.parse_args()
+
+    backends = [name.strip() for name in args.backends.split(',') if name.strip()]
+    if STORAGE_MYSQL in backends and not args.mysql_database:
+        logger.error("❌ Для MySQL укажите --mysql-database: замер записывает тестовые данные")
+        sys.exit(1)
+
+    report = {}
+    workdir = tempfile.mkdtemp(prefix='bench_storage_')
+    try:
+        for backend in backends:
+            logger.info(f"⏱️ Замер хранилища {backend}...")
+            db = open_backend(backend, workdir, args.mysql_database)
+            try:
+                report[backend] = bench_backend(db, args.variants, args.operations, args.threads)
+            except ConnectionError as e:
+                logger.error(f"❌ {backend}: {e}")
+            finally:
+                db.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if report:
+        print_report(report)
@@ -0,0 +1,153 @@
+# scripts/cluster_pending.py
+import sys
+import os
+import argparse
+import logging
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+from storage import open_storage
+from clustering import leader_clustering, cluster_members, representative
+from search_index import EMBEDDING_DIM, normalize_rows
+from utils import array_to_blob, query_blobs_to_matrix
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def load_backlog(db, limit):
+    """Загружает очередь необработанных вопросов и собирает эмбеддинги в одну матрицу"""
+    rows = db.get_pending_with_embeddings(limit)
+    matrix, valid = query_blobs_to_matrix([row['embedding'] for row in rows], EMBEDDING_DIM)
+    if len(valid) < len(rows):
+        logger.warning(f"⚠️ Пропущено {len(rows) - len(valid)} вопросов без сохраненного эмбеддинга")
+    return [rows[i] for i in valid], normalize_rows(matrix)
+
+
+def get_or_create_group(db, group_name):
+    for group in db.get_question_groups() or []:
+        if group['name'] == group_name:
+            return group['id']
+    return db.insert_group(group_name)
+
+
+def create_question_from_cluster(db, rows, matrix, members, rep):
+    """Создает новый стандартный вопрос, вариантами которого становятся формулировки кластера"""
+    title = input(f"Формулировка стандартного вопроса [{rows[rep]['raw_question']}]: ").strip() \
+        or rows[rep]['raw_question']
+    answer = input("Текст ответа: ").strip()
+    intent = input("Служебное название вопроса (intent): ").strip()
+    group_name = input("Название группы [Общие вопросы]: ").strip() or "Общие вопросы"
+    if not answer:
+        logger.error("⚠️ Ответ не может быть пустым")
+        return None
+
+    group_id = get_or_create_group(db, group_name)
+    answer_id = db.insert_answer(answer) if group_id else None
+    if not answer_id:
+        logger.error("❌ Не удалось создать группу или ответ")
+        return None
+
+    # Уникальные формулировки кластера с уже сохраненными эмбеддингами - без повторного кодирования
+    variants = {}
+    for i in [rep, *members]:
+        text = rows[i]['raw_question'].strip()
+        if text and text not in variants:
+            variants[text] = array_to_blob(matrix[i])
+    created = db.insert_standard_questions([{
+        'title': title, 'group_id': group_id, 'answer_id': answer_id,
+        'intent': intent or None, 'variants': list(variants.items())
+    }])
+    if not created:
+        return None
+    std_question_id, variant_ids = created[0]
+    logger.info(f"✅ Создан стандартный вопрос {std_question_id} с {len(variant_ids)} вариантами")
+    return std_question_id
+
+
+def cluster_pending(threshold, limit, min_size, examples, report_only):
+    db = open_storage(config)
+    started = time.perf_counter()
+    rows, matrix = load_backlog(db, limit)
+    if not rows:
+        logger.info("ℹ️ Нет необработанных вопросов")
+        return True
+
+    labels, _ = leader_clustering(matrix, threshold)
+    clusters = [members for members in cluster_members(labels) if len(members) >= min_size]
+    # Очередь по частоте: кластеры с наибольшим числом обращений первыми
+    hits = np.array([row['hit_count'] or 1 for row in rows], dtype=np.int64)
+    clusters.sort(key=lambda members: int(hits[members].sum()), reverse=True)
+    logger.info(
+        f"🧩 {len(rows)} вопросов сгруппированы в {len(set(labels.tolist()))} кластеров "
+        f"за {time.perf_counter() - started:.2f} с (порог {threshold})"
+    )
+
+    for number, members in enumerate(clusters, 1):
+        rep = representative(matrix, members)
+        print("\n" + "=" * 100)
+        print(f"Кластер {number}/{len(clusters)} | вопросов: {len(members)} | обращений: {int(hits[members].sum())} | представитель: {rows[rep]['raw_question']}")
+        for i in members[:examples]:
+            print(f"  {rows[i]['pending_id']:<8} | x{rows[i]['hit_count']:<4} | {rows[i]['created_at']} | {rows[i]['raw_question']}")
+        if len(members) > examples:
+            print(f"  ... и еще {len(members) - examples}")
+        if report_only:
+            continue
+
+        print("\nДействие для всего кластера:")
+        print("1 - Привязать к существующему стандартному вопросу")
+        print("2 - Создать новый вопрос-ответ из кластера")
+        print("3 - Отметить обработанными без ответа")
+        print("4 - Пропустить")
+        print("q - Выйти")
+        choice = input("Ваш выбор: ").strip().lower()
+
+        pending_ids = [rows[i]['pending_id'] for i in members]
+        if choice == "1":
+            std_question_id = input("Введите ID стандартного вопроса: ").strip()
+            if not std_question_id.isdigit():
+                logger.error("⚠️ Некорректный ID вопроса")
+                continue
+            std_question_id = int(std_question_id)
+        elif choice == "2":
+            std_question_id = create_question_from_cluster(db, rows, matrix, members, rep)
+            if not std_question_id:
+                logger.error("❌ Ошибка создания вопроса, кластер не обработан")
+                continue
+        elif choice == "3":
+            std_question_id = None
+        elif choice == "q":
+            break
+        else:
+            logger.info("⏭️ Кластер пропущен")
+            continue
+
+        if db.resolve_pending(pending_ids, standard_question_id=std_question_id,
+                              operator_notes=f"Обработан кластером из {len(pending_ids)} вопросов"):
+            logger.info(f"🆗 Обработано вопросов: {len(pending_ids)}")
+        else:
+            logger.error("❌ Не удалось обновить вопросы кластера")
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Кластеризация неотвеченных вопросов')
+    parser.add_argument('--threshold', type=float, default=0.8,
+                        help='Минимальная косинусная близость к представителю кластера')
+    parser.add_argument('--limit', type=int, help='Максимум вопросов из очереди')
+    parser.add_argument('--min-size', type=int, default=1, help='Показывать кластеры не меньше этого размера')
+    parser.add_argument('--examples', type=int, default=5, help='Сколько вопросов кластера показывать')
+    parser.add_argument('--report', action='store_true', help='Только показать кластеры, без действий')
+    args = parser.parse_args()
+
+    if not cluster_pending(args.threshold, args.limit, args.min_size, args.examples, args.report):
+        sys.exit(1)
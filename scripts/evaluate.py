@@ -0,0 +1,306 @@
+# scripts/evaluate.py
+import sys
+import os
+import argparse
+import csv
+import json
+import logging
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+from storage import open_storage
+from embedding_model import EmbeddingModel
+from search_index import SearchIndex, EMBEDDING_DIM
+from utils import blob_to_array
+from scripts.load_data import normalize_field, is_header_row
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Сравниваемые конфигурации поиска: имя -> параметры SearchIndex
+CONFIGURATIONS = {
+    'exact': {},
+    'exact-int8': {'quantization': 'int8'},
+    'ivf': {'ann': 'ivf'},
+    'ivf-int8': {'ann': 'ivf', 'quantization': 'int8'},
+    'prefilter': {'mode': 'prefilter'},
+    'fused': {'mode': 'fused'},
+    'medoids': {'compression': 'medoids'},
+    'medoids-int8': {'compression': 'medoids', 'quantization': 'int8'},
+    'pca-128': {'pca_dim': 128},
+    'pca-64': {'pca_dim': 64},
+}
+# Эталон для совпадения top-1: полный перебор всех вариантов
+REFERENCE_CONFIGURATION = 'exact'
+
+THRESHOLDS = np.round(np.arange(0.0, 1.0001, 0.01), 2)
+
+
+def load_csv_dataset(csv_file, holdout, holdout_questions, seed):
+    """Делит CSV на базу знаний и отложенные запросы.
+
+    Из каждого стандартного вопроса откладывается доля holdout вариантов
+    (минимум один вариант остается в базе). Доля holdout_questions стандартных
+    вопросов убирается из базы целиком: их варианты - запросы без правильного
+    ответа, на которых проверяется порог.
+    """
+    rng = np.random.default_rng(seed)
+    groups, questions, variants = {}, {}, {}
+    with open(csv_file, 'r', encoding='utf-8') as file:
+        for row in csv.reader(file, delimiter=',', quotechar='"'):
+            if len(row) < 5 or is_header_row(row):
+                continue
+            group_name, std_question, intent, variant_text, answer_text = (
+                normalize_field(value) for value in row[:5]
+            )
+            if not group_name or not std_question or not variant_text:
+                continue
+            group_id = groups.setdefault(group_name, len(groups) + 1)
+            key = (group_id, std_question)
+            if key not in questions:
+                questions[key] = {
+                    'std_question_id': len(questions) + 1, 'group_id': group_id,
+                    'intent': intent, 'title': std_question
+                }
+            texts = variants.setdefault(key, [])
+            if variant_text not in texts:
+                texts.append(variant_text)
+
+    kb_rows, queries = [], []
+    keys = list(questions)
+    unseen = set(rng.choice(len(keys), int(len(keys) * holdout_questions), replace=False).tolist())
+    for i, key in enumerate(keys):
+        question = questions[key]
+        texts = variants[key]
+        if i in unseen:
+            queries.extend((text, None) for text in texts)
+            continue
+        n_held = min(len(texts) - 1, int(round(len(texts) * holdout)))
+        held = set(rng.choice(len(texts), n_held, replace=False).tolist()) if n_held > 0 else set()
+        for j, text in enumerate(texts):
+            if j in held:
+                queries.append((text, question['std_question_id']))
+            else:
+                kb_rows.append(dict(question, id=len(kb_rows) + 1, variant_text=text,
+                                    answer_id=question['std_question_id']))
+    return kb_rows, None, queries
+
+
+def load_log_dataset(db, limit):
+    """База знаний из БД, запросы - вопросы, размеченные операторами при обработке очереди"""
+    kb_rows, embeddings = [], []
+    for row in db.get_all_variants():
+        array = blob_to_array(row['embedding']) if row['embedding'] else None
+        if array is None or array.shape[0] != EMBEDDING_DIM:
+            continue
+        kb_rows.append(row)
+        embeddings.append(array)
+    queries = [
+        (row['raw_question'], row['standard_question_id'])
+        for row in db.get_labeled_user_questions(limit)
+    ]
+    matrix = np.vstack(embeddings) if embeddings else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    return kb_rows, matrix, queries
+
+
+def encode(embedder, texts, batch_size):
+    """Нормализует и кодирует тексты пачками, возвращает (матрица, тексты, сек)"""
+    started = time.perf_counter()
+    normalized = [embedder.normalize_text(text) for text in texts]
+    embeddings = embedder.get_embeddings(normalized, batch_size=batch_size)
+    return embeddings, normalized, time.perf_counter() - started
+
+
+def evaluate_config(name, params, kb_rows, kb_matrix, query_matrix, query_texts, labels,
+                    top_k, batch_size):
+    """Строит индекс в конфигурации name и считает метрики на запросах"""
+    params = dict(params)
+    mode = params.pop('mode', 'dense')
+    index = SearchIndex(
+        mode=mode,
+        lexical_analyzer=config.LEXICAL_ANALYZER,
+        ngram_size=config.LEXICAL_NGRAM_SIZE,
+        lexical_candidates=config.LEXICAL_CANDIDATES,
+        fusion_weight=config.FUSION_WEIGHT,
+        ivf_lists=config.IVF_LISTS,
+        ivf_probe=config.IVF_PROBE,
+        compression_max_error=config.COMPRESSION_MAX_ERROR,
+        compression_max_medoids=config.COMPRESSION_MAX_MEDOIDS,
+        pca_candidates=config.PCA_CANDIDATES,
+        **params
+    )
+    started = time.perf_counter()
+    index.build(kb_rows, kb_matrix)
+    build_seconds = time.perf_counter() - started
+
+    # Берем с запасом вариантов, чтобы получить top_k различных стандартных вопросов
+    top1_similarity = np.zeros(len(labels), dtype=np.float32)
+    top1_ids = np.zeros(len(labels), dtype=np.int64)
+    top1_correct = np.zeros(len(labels), dtype=bool)
+    topk_correct = np.zeros(len(labels), dtype=bool)
+    started = time.perf_counter()
+    for start in range(0, len(labels), batch_size):
+        batch = index.search_batch(
+            query_matrix[start:start + batch_size],
+            texts=query_texts[start:start + batch_size],
+            top_k=top_k * 5
+        )
+        for offset, results in enumerate(batch):
+            i = start + offset
+            if not results:
+                continue
+            top1_similarity[i] = results[0]['similarity']
+            top1_ids[i] = results[0]['std_question_id']
+            distinct = list(dict.fromkeys(r['std_question_id'] for r in results))[:top_k]
+            top1_correct[i] = labels[i] is not None and distinct[0] == labels[i]
+            topk_correct[i] = labels[i] is not None and labels[i] in distinct
+    search_seconds = time.perf_counter() - started
+
+    positives = np.array([label is not None for label in labels])
+    n_positives = int(positives.sum()) or 1
+    curve = []
+    for threshold in THRESHOLDS:
+        answered = top1_similarity >= threshold
+        true_positive = int((answered & top1_correct).sum())
+        precision = true_positive / int(answered.sum()) if answered.any() else 1.0
+        recall = true_positive / n_positives
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        curve.append({
+            'threshold': float(threshold), 'precision': precision, 'recall': recall, 'f1': f1
+        })
+    best = max(curve, key=lambda point: (point['f1'], point['threshold']))
+
+    return {
+        'name': name,
+        'top1_accuracy': float(top1_correct[positives].mean()) if positives.any() else 0.0,
+        f'top{top_k}_accuracy': float(topk_correct[positives].mean()) if positives.any() else 0.0,
+        'recommended_threshold': best['threshold'],
+        'precision_at_recommended': best['precision'],
+        'recall_at_recommended': best['recall'],
+        'f1_at_recommended': best['f1'],
+        'queries_per_second': len(labels) / search_seconds if search_seconds else 0.0,
+        'mean_latency_ms': search_seconds / len(labels) * 1000 if labels else 0.0,
+        'build_seconds': build_seconds,
+        'index_rows': index.size,
+        'top1_ids': top1_ids,
+        'curve': curve
+    }
+
+
+def print_report(reports, top_k, n_kb, n_queries, n_negatives, encode_qps):
+    """Печатает сравнение конфигураций и кривые точность/полнота"""
+    print("\n" + "=" * 134)
+    print(f"База знаний: {n_kb} вариантов | Запросов: {n_queries} (без ответа в базе: {n_negatives}) | "
+          f"Кодирование: {encode_qps:.1f} запросов/с")
+    print("-" * 134)
+    print(f"{'Конфигурация':<14} | {'top-1':>7} | {f'top-{top_k}':>7} | {'Порог':>6} | {'Precision':>9} | "
+          f"{'Recall':>7} | {'F1':>6} | {'Запросов/с':>11} | {'мс/запрос':>9} | {'Сборка, с':>9} | "
+          f"{'Строк':>7} | {'Совпад.':>7}")
+    print("-" * 134)
+    for r in reports:
+        print(f"{r['name']:<14} | {r['top1_accuracy']:>7.2%} | {r[f'top{top_k}_accuracy']:>7.2%} | "
+              f"{r['recommended_threshold']:>6.2f} | {r['precision_at_recommended']:>9.2%} | "
+              f"{r['recall_at_recommended']:>7.2%} | {r['f1_at_recommended']:>6.3f} | "
+              f"{r['queries_per_second']:>11.1f} | {r['mean_latency_ms']:>9.3f} | {r['build_seconds']:>9.2f} | "
+              f"{r['index_rows']:>7} | {r['top1_agreement']:>7.2%}")
+
+    print("\nТочность / полнота по порогам (precision/recall):")
+    shown = [t for t in THRESHOLDS if round(t * 100) % 5 == 0 and t >= 0.5]
+    print(f"{'Порог':<14} | " + " | ".join(f"{r['name']:>14}" for r in reports))
+    for threshold in shown:
+        cells = []
+        for r in reports:
+            point = next(p for p in r['curve'] if p['threshold'] == float(threshold))
+            cells.append(f"{point['precision']:>6.1%}/{point['recall']:<7.1%}")
+        print(f"{threshold:<14.2f} | " + " | ".join(f"{cell:>14}" for cell in cells))
+    print("=" * 134)
+    print(f"Совпад. - доля запросов с тем же top-1 вопросом, что у {REFERENCE_CONFIGURATION} (все варианты)")
+    print(f"Текущий SIMILARITY_THRESHOLD = {config.SIMILARITY_THRESHOLD}")
+
+
+def run_evaluation(args):
+    embedder = EmbeddingModel(config.MODEL_PATH)
+
+    if args.source == 'csv':
+        kb_rows, kb_matrix, queries = load_csv_dataset(
+            args.file, args.holdout, args.holdout_questions, args.seed
+        )
+        kb_matrix, _, _ = encode(embedder, [r['variant_text'] for r in kb_rows], args.batch_size)
+    else:
+        db = open_storage(config)
+        kb_rows, kb_matrix, queries = load_log_dataset(db, args.limit)
+
+    if not kb_rows or not queries:
+        logger.error("❌ Недостаточно данных для оценки")
+        return False
+
+    query_matrix, query_texts, encode_seconds = encode(
+        embedder, [text for text, _ in queries], args.batch_size
+    )
+    labels = [label for _, label in queries]
+    logger.info(f"🧮 Закодировано {len(queries)} запросов за {encode_seconds:.2f} с")
+
+    names = [name.strip() for name in args.configs.split(',') if name.strip()]
+    unknown = [name for name in names if name not in CONFIGURATIONS]
+    if unknown:
+        logger.error(f"⚠️ Неизвестная конфигурация: {', '.join(unknown)}")
+        return False
+
+    reports = []
+    reference = None
+    for name in [REFERENCE_CONFIGURATION] + [name for name in names if name != REFERENCE_CONFIGURATION]:
+        logger.info(f"▶️ Оценка конфигурации {name}")
+        report = evaluate_config(
+            name, CONFIGURATIONS[name], kb_rows, kb_matrix, query_matrix, query_texts,
+            labels, args.top_k, args.batch_size
+        )
+        top1_ids = report.pop('top1_ids')
+        if reference is None:
+            reference = top1_ids
+        report['top1_agreement'] = float((top1_ids == reference).mean())
+        if name in names:
+            reports.append(report)
+    reports.sort(key=lambda report: names.index(report['name']))
+
+    n_negatives = sum(1 for label in labels if label is None)
+    if not n_negatives:
+        logger.warning("⚠️ В запросах нет вопросов без ответа: рекомендуемый порог не проверен на отказах")
+    print_report(reports, args.top_k, len(kb_rows), len(queries), n_negatives,
+                 len(queries) / encode_seconds if encode_seconds else 0.0)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(reports, file, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Отчет сохранен в {args.output}")
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Оценка точности, порога и скорости поиска')
+    parser.add_argument('--source', choices=['csv', 'log'], default='csv',
+                        help='csv - отложенные варианты из CSV, log - вопросы, размеченные операторами')
+    parser.add_argument('--file', type=str, default='base_qu_an/qu_ans_1.csv', help='CSV файл базы знаний')
+    parser.add_argument('--holdout', type=float, default=0.2,
+                        help='Доля вариантов каждого вопроса, откладываемая в запросы')
+    parser.add_argument('--holdout-questions', type=float, default=0.1,
+                        help='Доля стандартных вопросов, целиком убираемых из базы (запросы без ответа)')
+    parser.add_argument('--limit', type=int, default=5000, help='Максимум вопросов из user_questions')
+    parser.add_argument('--configs', type=str, default=','.join(CONFIGURATIONS),
+                        help=f"Конфигурации через запятую: {', '.join(CONFIGURATIONS)}")
+    parser.add_argument('--top-k', type=int, default=3, help='k для метрики top-k')
+    parser.add_argument('--batch-size', type=int, default=64, help='Размер пачки кодирования и поиска')
+    parser.add_argument('--seed', type=int, default=42, help='Seed случайного разбиения')
+    parser.add_argument('--output', type=str, help='Сохранить полный отчет в JSON')
+    args = parser.parse_args()
+
+    if not run_evaluation(args):
+        sys.exit(1)
@@ -12,10 +12,85 @@ load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import config
+from datetime import datetime
+from partitioning import PARTITIONED_TABLE, add_months, partition_by_clause, extend_partitions_sql
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+def index_exists(cursor, table, index):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index))
+    return cursor.fetchone()[0] > 0
+
+def add_column(cursor, table, column, definition):
+    """Миграция: добавляет столбец в уже существующую таблицу"""
+    if not column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        logger.info(f"Столбец {table}.{column} добавлен")
+
+def create_index(cursor, name, table, columns):
+    if not index_exists(cursor, table, name):
+        cursor.execute(f"CREATE INDEX {name} ON {table}({columns})")
+
+def foreign_keys(cursor, table, referenced_table=None):
+    query = """
+        SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+        WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """
+    params = [table]
+    if referenced_table:
+        query += " AND REFERENCED_TABLE_NAME = %s"
+        params.append(referenced_table)
+    cursor.execute(query, params)
+    return [row[0] for row in cursor.fetchall()]
+
+def partition_names(cursor, table):
+    cursor.execute("""
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """, (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+def partition_user_questions(cursor):
+    """Миграция: секционирует существующую user_questions по месяцам created_at.
+
+    Секционированные таблицы InnoDB не поддерживают внешние ключи, а первичный
+    ключ должен включать created_at, поэтому ключи перестраиваются. ALTER
+    копирует таблицу целиком - на большой базе запускайте в окно обслуживания.
+    """
+    if partition_names(cursor, PARTITIONED_TABLE):
+        return
+    logger.info("Секционирование user_questions (таблица будет перестроена)...")
+    for name in foreign_keys(cursor, "pending_questions", PARTITIONED_TABLE):
+        cursor.execute(f"ALTER TABLE pending_questions DROP FOREIGN KEY {name}")
+    for name in foreign_keys(cursor, PARTITIONED_TABLE):
+        cursor.execute(f"ALTER TABLE {PARTITIONED_TABLE} DROP FOREIGN KEY {name}")
+
+    cursor.execute(f"SELECT MIN(created_at) FROM {PARTITIONED_TABLE}")
+    first_month = cursor.fetchone()[0] or datetime.now()
+    cursor.execute(f"""
+        ALTER TABLE {PARTITIONED_TABLE}
+            MODIFY embedding BLOB NULL,
+            MODIFY created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)
+    """)
+    cursor.execute(
+        f"ALTER TABLE {PARTITIONED_TABLE} "
+        f"{partition_by_clause(first_month, add_months(datetime.now(), config.PARTITIONS_AHEAD_MONTHS))}"
+    )
+    logger.info("Таблица user_questions секционирована")
+
 def init_database():
     connection = None
     try:
@@ -81,24 +156,27 @@ def init_database():
             """)
             logger.info("Таблица question_variants создана")
             
-            # Таблица вопросов без ответа
-            cursor.execute("""
+            # Таблица вопросов пользователей, секционированная по месяцам created_at.
+            # Внешних ключей нет: секционированные таблицы InnoDB их не поддерживают
+            now = datetime.now()
+            cursor.execute(f"""
                 CREATE TABLE IF NOT EXISTS user_questions (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    id INT AUTO_INCREMENT,
                     session_id VARCHAR(255) NOT NULL,
                     client_id VARCHAR(255),
                     raw_question TEXT NOT NULL,
                     normalized_text TEXT NOT NULL,
-                    embedding BLOB NOT NULL,
+                    embedding BLOB,                       -- float32, int8 или NULL (QUERY_EMBEDDING_STORAGE)
                     standard_question_id INT,
                     answer_id INT,
                     is_found BOOLEAN DEFAULT FALSE,
                     confidence FLOAT,
                     response_time_ms INT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (standard_question_id) REFERENCES standard_questions(id),
-                    FOREIGN KEY (answer_id) REFERENCES answers(id)
+                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (id, created_at),
+                    KEY idx_user_questions_standard_question (standard_question_id)
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+                {partition_by_clause(now, add_months(now, config.PARTITIONS_AHEAD_MONTHS))}
             """)
             logger.info("Таблица user_questions создана")
 
@@ -109,16 +187,75 @@ def init_database():
                     user_question_id INT NOT NULL,
                     processed BOOLEAN DEFAULT FALSE,
                     operator_notes TEXT,
+                    hit_count INT NOT NULL DEFAULT 1,     -- Сколько раз вопрос задали повторно
+                    last_seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_question_id) REFERENCES user_questions(id)
+                    KEY idx_pending_user_question (user_question_id)
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
             """)
             logger.info("Таблица pending_questions создана")
+
+            # Агрегаты статистики по часам и дням (granularity = 'hour' или 'day')
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS stats_rollups (
+                    granularity VARCHAR(8) NOT NULL,
+                    bucket_start DATETIME NOT NULL,
+                    queries INT NOT NULL DEFAULT 0,
+                    found INT NOT NULL DEFAULT 0,
+                    confidence_sum DOUBLE NOT NULL DEFAULT 0,
+                    confidence_count INT NOT NULL DEFAULT 0,
+                    PRIMARY KEY (granularity, bucket_start)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """)
+            # Гистограмма задержек с логарифмическими корзинами - складывается между периодами
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS stats_latency_bins (
+                    granularity VARCHAR(8) NOT NULL,
+                    bucket_start DATETIME NOT NULL,
+                    bin SMALLINT NOT NULL,
+                    count INT NOT NULL DEFAULT 0,
+                    PRIMARY KEY (granularity, bucket_start, bin)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS stats_question_hits (
+                    granularity VARCHAR(8) NOT NULL,
+                    bucket_start DATETIME NOT NULL,
+                    standard_question_id INT NOT NULL,
+                    hits INT NOT NULL DEFAULT 0,
+                    PRIMARY KEY (granularity, bucket_start, standard_question_id)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """)
+            # Служебные значения фоновых задач (например, последний учтенный user_questions.id)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS stats_state (
+                    name VARCHAR(64) PRIMARY KEY,
+                    value BIGINT NOT NULL
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """)
+            cursor.execute("INSERT IGNORE INTO stats_state (name, value) VALUES ('rollup_last_id', 0)")
+            logger.info("Таблицы статистики созданы")
+
+            # Миграции для баз, созданных предыдущими версиями
+            add_column(cursor, "pending_questions", "hit_count", "INT NOT NULL DEFAULT 1")
+            add_column(cursor, "pending_questions", "last_seen_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+            partition_user_questions(cursor)
+            extend = extend_partitions_sql(
+                partition_names(cursor, PARTITIONED_TABLE),
+                add_months(now, config.PARTITIONS_AHEAD_MONTHS)
+            )
+            if extend:
+                cursor.execute(extend)
+                logger.info("Добавлены секции user_questions на будущие месяцы")
                     
             # Создаем индексы для производительности
-            cursor.execute("CREATE INDEX idx_standard_questions_group ON standard_questions(group_id)")
-            cursor.execute("CREATE INDEX idx_variants_standard_question ON question_variants(standard_question_id)")
+            create_index(cursor, "idx_standard_questions_group", "standard_questions", "group_id")
+            create_index(cursor, "idx_variants_standard_question", "question_variants", "standard_question_id")
+            create_index(cursor, "idx_pending_frequency", "pending_questions", "processed, hit_count")
+            # Keyset-пагинация очереди: (processed, created_at) + первичный ключ как tie-breaker
+            create_index(cursor, "idx_pending_recent", "pending_questions", "processed, created_at")
+            create_index(cursor, "idx_user_questions_created", "user_questions", "created_at")
             logger.info("Индексы созданы")
         
         connection.commit()
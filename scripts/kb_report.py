@@ -0,0 +1,224 @@
+# scripts/kb_report.py
+import sys
+import os
+import argparse
+import json
+import logging
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+from storage import open_storage
+from clustering import similar_pairs, tile_size
+from search_index import EMBEDDING_DIM
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class TopPairs:
+    """Считает все найденные пары, но хранит только limit самых похожих"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.total = 0
+        self._chunks = []
+        self._size = 0
+
+    def add(self, i, j, similarity):
+        if not len(i):
+            return
+        self.total += len(i)
+        self._chunks.append((i, j, similarity))
+        self._size += len(i)
+        if self._size > 4 * self.limit:
+            self._compact()
+
+    def _compact(self):
+        i, j, similarity = (np.concatenate(parts) for parts in zip(*self._chunks))
+        if len(similarity) > self.limit:
+            keep = np.argpartition(-similarity, self.limit)[:self.limit]
+            i, j, similarity = i[keep], j[keep], similarity[keep]
+        self._chunks = [(i, j, similarity)]
+        self._size = len(i)
+
+    def result(self):
+        if not self._chunks:
+            return []
+        self._compact()
+        i, j, similarity = self._chunks[0]
+        order = np.argsort(-similarity, kind='stable')
+        return list(zip(i[order].tolist(), j[order].tolist(), similarity[order].tolist()))
+
+
+VARIANTS_QUERY = """
+    SELECT qv.id, qv.standard_question_id AS std_question_id, sq.answer_id, qv.embedding
+    FROM question_variants qv
+    JOIN standard_questions sq ON qv.standard_question_id = sq.id
+"""
+
+
+def load_variants(db):
+    """Потоково собирает эмбеддинги вариантов в заранее выделенную нормированную матрицу.
+
+    Строки с BLOB-ами не накапливаются: в памяти только матрица float32 и номера
+    (вариант, вопрос, ответ). Тексты вариантов читаются потом только для пар отчета.
+    """
+    total = db.execute_query("SELECT COUNT(*) AS n FROM question_variants")
+    capacity = int(total[0]['n']) if total else 0
+    matrix = np.empty((capacity, EMBEDDING_DIM), dtype=np.float32)
+    ids = np.empty((capacity, 3), dtype=np.int64)
+    expected_size = EMBEDDING_DIM * 4
+    count = skipped = 0
+    for row in db.iter_query(VARIANTS_QUERY):
+        if not row['embedding'] or len(row['embedding']) != expected_size:
+            skipped += 1
+            continue
+        if count == capacity:
+            # Варианты добавлены после подсчета - расширяем с запасом
+            capacity = max(2 * capacity, 1024)
+            matrix = np.resize(matrix, (capacity, EMBEDDING_DIM))
+            ids = np.resize(ids, (capacity, 3))
+        vector = np.frombuffer(row['embedding'], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        matrix[count] = vector / norm if norm else vector
+        ids[count] = (row['id'], row['std_question_id'], row['answer_id'])
+        count += 1
+    if skipped:
+        logger.warning(f"⚠️ Пропущено {skipped} вариантов с некорректным эмбеддингом")
+    return ids[:count], matrix[:count]
+
+
+def variant_texts(db, variant_ids):
+    """Тексты вариантов по id - только для пар, попавших в отчет"""
+    texts = {}
+    variant_ids = sorted(set(variant_ids))
+    for start in range(0, len(variant_ids), 1000):
+        chunk = variant_ids[start:start + 1000]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        for row in db.execute_query(
+                f"SELECT id, variant_text FROM question_variants WHERE id IN ({placeholders})", chunk) or []:
+            texts[row['id']] = row['variant_text']
+    return texts
+
+
+def build_report(db, conflict_threshold, redundant_threshold, min_variants, memory_mb, max_pairs):
+    started = time.perf_counter()
+    ids, matrix = load_variants(db)
+    if not len(ids):
+        logger.error("❌ В базе нет вариантов вопросов")
+        return None
+    logger.info(f"📥 Загружено {len(ids)} вариантов за {time.perf_counter() - started:.1f} с")
+
+    variant_ids, question_ids, answer_ids = ids.T
+
+    conflicts = TopPairs(max_pairs)
+    redundant = TopPairs(max_pairs)
+    threshold = min(conflict_threshold, redundant_threshold)
+    side = tile_size(memory_mb, len(ids))
+    logger.info(f"🧮 Поиск пар: блоки {side}x{side}, порог {threshold}")
+
+    scan_started = time.perf_counter()
+    for i, j, similarity in similar_pairs(matrix, threshold, memory_mb):
+        same_question = question_ids[i] == question_ids[j]
+        conflict = (answer_ids[i] != answer_ids[j]) & (similarity >= conflict_threshold)
+        duplicate = same_question & (similarity >= redundant_threshold)
+        conflicts.add(i[conflict], j[conflict], similarity[conflict])
+        redundant.add(i[duplicate], j[duplicate], similarity[duplicate])
+    logger.info(f"⏱️ Попарное сравнение заняло {time.perf_counter() - scan_started:.1f} с")
+
+    # Стандартные вопросы без вариантов в выборку не попадают - добавляем их отдельно
+    counts = {}
+    for row in db.get_all_standard_questions() or []:
+        counts[row['id']] = {'id': row['id'], 'title': row['title'], 'variants': 0}
+    unique_ids, variant_counts = np.unique(question_ids, return_counts=True)
+    for question_id, count in zip(unique_ids.tolist(), variant_counts.tolist()):
+        counts.setdefault(question_id, {'id': question_id, 'title': '', 'variants': 0})
+        counts[question_id]['variants'] = count
+    sparse = sorted(
+        (item for item in counts.values() if item['variants'] < min_variants),
+        key=lambda item: (item['variants'], item['id'])
+    )
+
+    conflict_pairs, redundant_pairs = conflicts.result(), redundant.result()
+    texts = variant_texts(db, [int(variant_ids[k]) for i, j, _ in conflict_pairs + redundant_pairs for k in (i, j)])
+
+    def variant(k):
+        return {'variant_id': int(variant_ids[k]), 'std_question_id': int(question_ids[k]),
+                'answer_id': int(answer_ids[k]), 'text': texts.get(int(variant_ids[k]), '')}
+
+    def pair(i, j, similarity):
+        return {'similarity': round(similarity, 4), 'a': variant(i), 'b': variant(j)}
+
+    return {
+        'variants': len(ids),
+        'thresholds': {'conflict': conflict_threshold, 'redundant': redundant_threshold,
+                       'min_variants': min_variants},
+        'conflicts': {'total': conflicts.total, 'pairs': [pair(*item) for item in conflict_pairs]},
+        'redundant': {'total': redundant.total, 'pairs': [pair(*item) for item in redundant_pairs]},
+        'sparse_questions': sparse,
+        'elapsed_s': round(time.perf_counter() - started, 1),
+    }
+
+
+def print_report(report, examples):
+    print("\n" + "=" * 100)
+    print(f"Конфликты: похожие варианты с разными ответами (порог {report['thresholds']['conflict']}): "
+          f"{report['conflicts']['total']}")
+    print("-" * 100)
+    for item in report['conflicts']['pairs'][:examples]:
+        print(f"{item['similarity']:.3f} | вопрос {item['a']['std_question_id']} (ответ {item['a']['answer_id']}): "
+              f"{item['a']['text']}")
+        print(f"{'':5} | вопрос {item['b']['std_question_id']} (ответ {item['b']['answer_id']}): {item['b']['text']}")
+
+    print("\n" + "=" * 100)
+    print(f"Избыточные варианты внутри одного вопроса (порог {report['thresholds']['redundant']}): "
+          f"{report['redundant']['total']}")
+    print("-" * 100)
+    for item in report['redundant']['pairs'][:examples]:
+        print(f"{item['similarity']:.3f} | вопрос {item['a']['std_question_id']}: "
+              f"{item['a']['text']} <-> {item['b']['text']}")
+
+    print("\n" + "=" * 100)
+    print(f"Вопросы с числом вариантов меньше {report['thresholds']['min_variants']}: "
+          f"{len(report['sparse_questions'])}")
+    print("-" * 100)
+    for item in report['sparse_questions'][:examples]:
+        print(f"{item['id']:<8} | вариантов: {item['variants']:<3} | {item['title']}")
+    print("=" * 100)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Поиск дублей и конфликтов в базе знаний')
+    parser.add_argument('--conflict-threshold', type=float, default=0.9,
+                        help='Близость вариантов с разными ответами, считающаяся конфликтом')
+    parser.add_argument('--redundant-threshold', type=float, default=0.97,
+                        help='Близость вариантов одного вопроса, считающаяся избыточной')
+    parser.add_argument('--min-variants', type=int, default=3, help='Минимум вариантов у вопроса')
+    parser.add_argument('--memory-mb', type=int, default=512,
+                        help='Потолок памяти на блок матрицы близостей, МБ')
+    parser.add_argument('--max-pairs', type=int, default=10000, help='Сколько самых похожих пар хранить')
+    parser.add_argument('--examples', type=int, default=20, help='Сколько находок каждого вида печатать')
+    parser.add_argument('--output', help='Сохранить полный отчет в JSON')
+    args = parser.parse_args()
+
+    db = open_storage(config)
+    report = build_report(db, args.conflict_threshold, args.redundant_threshold,
+                          args.min_variants, args.memory_mb, args.max_pairs)
+    if report is None:
+        sys.exit(1)
+
+    print_report(report, args.examples)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Отчет сохранен в {args.output}")
+    logger.info(f"🎉 Готово за {report['elapsed_s']} с")
@@ -15,7 +15,7 @@ load_dotenv()
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import config
-from database import Database
+from storage import open_storage
 from embedding_model import EmbeddingModel
 from utils import array_to_blob
 
@@ -43,7 +43,7 @@ def is_header_row(row):
 
 def load_data(csv_file, has_header=False):
     """Загружает данные из CSV файла в базу данных"""
-    db = Database(config.DB_HOST, config.DB_USER, config.DB_PASSWORD, config.DB_NAME)
+    db = open_storage(config)
     embedder = EmbeddingModel(config.MODEL_PATH)
     
     # Кэши для избежания дублирования
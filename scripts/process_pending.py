@@ -12,105 +12,97 @@ load_dotenv()
 # Добавляем корневую директорию проекта в путь Python
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from database import Database
+from storage import open_storage
 import config
-from add_question import add_single_question  # Исправленный импорт
+from scripts.view_pending import load_suggestion_index, iter_pending_pages, attach_suggestions
+from scripts.cluster_pending import create_question_from_cluster
+from utils import query_blob_to_array
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def process_questions(question_ids=None, all_flag=False):
-    """Обрабатывает вопросы в интерактивном или пакетном режиме"""
-    db = Database(config.DB_HOST, config.DB_USER, config.DB_PASSWORD, config.DB_NAME)
-    
-    if not db.connect():
-        logger.error("❌ Ошибка подключения к БД")
-        return False
-
-    try:
-        # Выборка вопросов для обработки
-        if all_flag:
-            query = "SELECT pq.id, uq.raw_question FROM pending_questions pq JOIN user_questions uq ON pq.user_question_id = uq.id WHERE pq.processed = FALSE"
-        elif question_ids:
-            ids_str = ",".join(map(str, question_ids))
-            query = f"SELECT pq.id, uq.raw_question FROM pending_questions pq JOIN user_questions uq ON pq.user_question_id = uq.id WHERE pq.id IN ({ids_str})"
-        else:
-            # Интерактивный режим - все необработанные вопросы
-            query = "SELECT pq.id, uq.raw_question FROM pending_questions pq JOIN user_questions uq ON pq.user_question_id = uq.id WHERE pq.processed = FALSE"
-        
-        with db.connection.cursor() as cursor:
-            cursor.execute(query)
-            questions = cursor.fetchall()
-            
-            if not questions:
-                logger.info("ℹ️ Нет вопросов для обработки")
-                return True
+def choose_action(q):
+    """Спрашивает оператора, что делать с вопросом; возвращает ID стандартного вопроса,
+    'new', 'skip' или 'quit'"""
+    suggestions = q['suggestions']
+    print("\nВыберите действие:")
+    for number, suggestion in enumerate(suggestions, 1):
+        print(f"{number} - Привязать к «{suggestion['title']}» "
+              f"(ID {suggestion['std_question_id']}, близость {suggestion['similarity']:.2f})")
+    print("n - Добавить как новый вопрос-ответ")
+    print("i - Ввести ID стандартного вопроса")
+    print("s - Пропустить")
+    print("q - Выйти")
+    choice = input("Ваш выбор: ").strip().lower()
+
+    if choice.isdigit() and 1 <= int(choice) <= len(suggestions):
+        return suggestions[int(choice) - 1]['std_question_id']
+    if choice == "n":
+        return 'new'
+    if choice == "i":
+        std_question_id = input("Введите ID стандартного вопроса: ").strip()
+        if std_question_id.isdigit():
+            return int(std_question_id)
+        logger.error("⚠️ Некорректный ID вопроса")
+        return 'skip'
+    if choice == "q":
+        return 'quit'
+    if choice != "s":
+        logger.error("⚠️ Некорректный выбор")
+    return 'skip'
+
+def process_questions(question_ids=None, page_size=20, order='frequent'):
+    """Обрабатывает вопросы в интерактивном режиме, страница за страницей"""
+    db = open_storage(config)
+    search_index = load_suggestion_index(db)
 
-            logger.info(f"🔧 Начато обновление {len(questions)} вопросов...")
-            
-            for q in questions:
-                question_text = q['raw_question']
-                logger.info(f"\n❓ Вопрос ID {q['id']}: {question_text}")
-                
-                # Интерактивный режим
-                print("\nВыберите действие:")
-                print("1 - Добавить как новый вопрос-ответ")
-                print("2 - Привязать к существующему вопросу")
-                print("3 - Пропустить")
-                choice = input("Ваш выбор (1/2/3): ").strip()
-                
-                if choice == "1":
-                    # Добавление нового вопроса
-                    answer = input("Введите ответ для нового вопроса: ").strip()
-                    intent = input("Введите служебное название вопроса (intent): ").strip()
-                    group_name = input("Введите название группы вопросов (опционально, нажмите Enter чтобы пропустить): ").strip()
-                    
-                    if add_single_question(
-                        group=group_name or "Общие вопросы",
-                        intent=intent,
-                        question=question_text,
-                        answer=answer
-                    ):
-                        logger.info("✅ Вопрос добавлен")
-                    else:
-                        logger.error("❌ Ошибка добавления вопроса")
-                        continue
-                elif choice == "2":
-                    # Привязка к существующему вопросу
-                    std_question_id = input("Введите ID стандартного вопроса: ").strip()
-                    if not std_question_id.isdigit():
-                        logger.error("⚠️ Некорректный ID вопроса")
-                        continue
-                    # Обновляем привязку
-                    update_query = "UPDATE user_questions SET standard_question_id = %s WHERE id = (SELECT user_question_id FROM pending_questions WHERE id = %s)"
-                    cursor.execute(update_query, (int(std_question_id), q['id']))
-                    db.connection.commit()
-                elif choice == "3":
-                    logger.info("⏭️ Вопрос пропущен")
+    processed = 0
+    for page in iter_pending_pages(db, page_size, order, pending_ids=question_ids):
+        # Подсказки для всей страницы считаются одним умножением матриц
+        attach_suggestions(search_index, page)
+        logger.info(f"🔧 Страница из {len(page)} вопросов")
+
+        for q in page:
+            logger.info(f"\n❓ Вопрос ID {q['pending_id']} (задан {q['hit_count']} раз): {q['raw_question']}")
+            action = choose_action(q)
+            if action == 'quit':
+                logger.info(f"🆗 Обработано вопросов: {processed}")
+                return True
+            if action == 'skip':
+                logger.info("⏭️ Вопрос пропущен")
+                continue
+            if action == 'new':
+                embedding = query_blob_to_array(q['embedding'])
+                if embedding is None:
+                    logger.error("⚠️ У вопроса нет сохраненного эмбеддинга - добавьте его через add_question.py")
                     continue
-                else:
-                    logger.error("⚠️ Некорректный выбор")
+                action = create_question_from_cluster(db, [q], embedding.reshape(1, -1), [0], 0)
+                if not action:
+                    logger.error("❌ Ошибка добавления вопроса")
                     continue
-                
-                # Помечаем как обработанный
-                cursor.execute("UPDATE pending_questions SET processed = TRUE WHERE id = %s", (q['id'],))
-                db.connection.commit()
-                logger.info(f"🆗 Вопрос ID {q['id']} обработан")
-            
-            return True
-    except Exception as e:
-        logger.error(f"❌ Критическая ошибка: {str(e)}")
-        return False
-    finally:
-        db.disconnect()
+
+            if db.resolve_pending([q['pending_id']], standard_question_id=action):
+                processed += 1
+                logger.info(f"🆗 Вопрос ID {q['pending_id']} обработан")
+            else:
+                logger.error(f"❌ Не удалось обновить вопрос ID {q['pending_id']}")
+
+    if not processed:
+        logger.info("ℹ️ Нет вопросов для обработки")
+    else:
+        logger.info(f"🆗 Обработано вопросов: {processed}")
+    return True
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Обработка неотвеченных вопросов')
     parser.add_argument('--ids', type=str, help='ID вопросов через запятую (например: 1,2,3)')
-    parser.add_argument('--all', action='store_true', help='Обработать все неотвеченные вопросы')
+    parser.add_argument('--all', action='store_true', help='Обработать все неотвеченные вопросы (по умолчанию)')
+    parser.add_argument('--page-size', type=int, default=20, help='Вопросов на странице')
+    parser.add_argument('--order', choices=['recent', 'frequent'], default='frequent',
+                        help='recent - новые первыми, frequent - частые первыми')
     args = parser.parse_args()
-    
+
     # Преобразование ID
     question_ids = None
     if args.ids:
@@ -119,13 +111,14 @@ if __name__ == '__main__':
         except ValueError:
             logger.error("⚠️ Ошибка формата ID. Используйте числа через запятую (1,2,3)")
             sys.exit(1)
-    
+
     success = process_questions(
         question_ids=question_ids,
-        all_flag=args.all
+        page_size=args.page_size,
+        order=args.order
     )
-    
+
     if not success:
         logger.error("❌ Завершено с ошибками")
         sys.exit(1)
-    logger.info("✅ Все операции успешно завершены")
\ No newline at end of file
+    logger.info("✅ Все операции успешно завершены")
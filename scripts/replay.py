@@ -0,0 +1,275 @@
+# scripts/replay.py
+import sys
+import os
+import argparse
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+from storage import open_storage
+from tenants import parse_mapping
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+OUTCOMES = ('same', 'changed', 'now_answered', 'now_unanswered', 'unknown', 'error')
+
+
+def iter_history(db, start=None, end=None, limit=None, batch_size=1000):
+    """Потоково отдает историю вопросов страницами по id, не загружая таблицу целиком"""
+    after_id = 0
+    served = 0
+    while limit is None or served < limit:
+        size = batch_size if limit is None else min(batch_size, limit - served)
+        rows = db.get_user_questions_page(after_id, size, start, end)
+        if rows is None:
+            raise ConnectionError("Ошибка чтения user_questions")
+        if not rows:
+            return
+        for row in rows:
+            if row['raw_question']:
+                yield row
+                served += 1
+        after_id = rows[-1]['id']
+
+
+class HttpTarget:
+    """Запущенный сервер: POST /api/ask с заголовком X-Replay, чтобы вопросы не логировались повторно"""
+
+    def __init__(self, url, tenant=None, api_key=None, timeout=10):
+        self.url = url.rstrip('/') + '/api/ask'
+        self.headers = {'Content-Type': 'application/json', 'X-Replay': '1'}
+        if config.ADMIN_TOKEN:
+            self.headers['Authorization'] = f"Bearer {config.ADMIN_TOKEN}"
+        else:
+            logger.warning("⚠️ ADMIN_TOKEN не задан: сервер запишет воспроизведенные вопросы в историю")
+        if tenant:
+            self.headers['X-Tenant-ID'] = tenant
+        if api_key:
+            self.headers['X-API-Key'] = api_key
+        self.timeout = timeout
+
+    def ask(self, question):
+        """Возвращает (код ответа, std_question_id или None, уверенность)"""
+        body = json.dumps({'question': question}).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body, headers=self.headers, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = json.loads(response.read().decode('utf-8'))
+                return response.status, data.get('std_question_id'), data.get('confidence')
+        except urllib.error.HTTPError as e:
+            return e.code, None, None
+        except (urllib.error.URLError, TimeoutError):
+            return 0, None, None
+
+
+class InProcessTarget:
+    """Поиск в этом процессе тем же путем, что и у сервера, без HTTP и записи в БД.
+
+    Индекс строится по настройкам сервера (index_from_settings, включая сжатие и
+    сохраненную проекцию PCA фонда), решение принимает тот же AnswerPipeline:
+    порог, каскад кросс-энкодера и повтор с исправленными опечатками.
+    """
+
+    def __init__(self, db, tenant):
+        from answering import pipeline_from_settings, reranker_from_settings
+        from embedding_model import EmbeddingModel
+        from search_index import index_from_settings
+        from spelling import SpellCorrector, vocabulary_texts
+
+        self.embedder = EmbeddingModel(config.MODEL_PATH)
+        self.index = index_from_settings(config, pca_path=os.path.join(config.PCA_DIR, f"{tenant}.npz"))
+        self.index.load(db.get_all_variants() or [])
+        self.spelling = None
+        if config.SPELL_CORRECTION:
+            self.spelling = SpellCorrector(config.SPELL_MAX_DISTANCE, config.SPELL_PREFIX_LENGTH,
+                                           config.SPELL_MIN_WORD_LENGTH)
+            self.spelling.build(vocabulary_texts(db.get_variant_texts()))
+        self.pipeline = pipeline_from_settings(config, reranker_from_settings(config))
+        self._lock = threading.Lock()
+
+    def _encode(self, normalized):
+        with self._lock:
+            return self.embedder.get_embedding(normalized)
+
+    def ask(self, question):
+        normalized = self.embedder.normalize_text(question)
+        result, decision, _, _ = self.pipeline.answer(
+            self.index, self._encode, self._encode(normalized), normalized, spelling=self.spelling
+        )
+        if not decision:
+            return 200, None, result['similarity'] if result else 0
+        return 200, result['std_question_id'], result['similarity']
+
+
+def classify(row, status, std_question_id):
+    """Сравнение нового ответа с записанным в истории"""
+    if status != 200:
+        return 'error'
+    if not row['is_found']:
+        return 'same' if std_question_id is None else 'now_answered'
+    if std_question_id is None:
+        return 'now_unanswered'
+    if row['standard_question_id'] is None:
+        return 'unknown'  # старые записи без id найденного вопроса
+    return 'same' if std_question_id == row['standard_question_id'] else 'changed'
+
+
+def replay(rows, target, speed=0.0, concurrency=8, diff_file=None):
+    """Отправляет вопросы в target.
+
+    speed=1 - с исходными интервалами между вопросами, 10 - в 10 раз быстрее,
+    0 - без пауз с concurrency запросами одновременно.
+    """
+    latencies = []
+    lags = []
+    outcomes = Counter()
+    statuses = Counter()
+    lock = threading.Lock()
+    in_flight = threading.Semaphore(concurrency * 2)
+
+    def run(row):
+        try:
+            started = time.perf_counter()
+            try:
+                status, std_question_id, confidence = target.ask(row['raw_question'])
+            except Exception as e:
+                logger.error(f"❌ Ошибка запроса {row['id']}: {e}")
+                status, std_question_id, confidence = 0, None, None
+            latency = (time.perf_counter() - started) * 1000
+            outcome = classify(row, status, std_question_id)
+            with lock:
+                statuses[status] += 1
+                outcomes[outcome] += 1
+                if status == 200:
+                    latencies.append(latency)
+                if diff_file and outcome in ('changed', 'now_answered', 'now_unanswered'):
+                    diff_file.write(json.dumps({
+                        'id': row['id'], 'question': row['raw_question'], 'outcome': outcome,
+                        'recorded': {'std_question_id': row['standard_question_id'],
+                                     'confidence': float(row['confidence']) if row['confidence'] is not None else None},
+                        'replayed': {'std_question_id': std_question_id, 'confidence': confidence},
+                    }, ensure_ascii=False) + '\n')
+        finally:
+            in_flight.release()
+
+    started = time.perf_counter()
+    first_moment = None
+    sent = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for row in rows:
+            if speed > 0:
+                if first_moment is None:
+                    first_moment = row['created_at']
+                due = started + (row['created_at'] - first_moment).total_seconds() / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -0.01:
+                    lags.append(-delay * 1000)  # не успеваем за исходным темпом
+            in_flight.acquire()
+            executor.submit(run, row)
+            sent += 1
+            if sent % 1000 == 0:
+                logger.info(f"📤 Отправлено {sent} вопросов")
+    elapsed = time.perf_counter() - started
+    return {
+        'sent': sent,
+        'elapsed': elapsed,
+        'latencies': np.array(latencies),
+        'lags': np.array(lags),
+        'outcomes': outcomes,
+        'statuses': statuses,
+    }
+
+
+def print_report(report, speed):
+    print("\n" + "=" * 70)
+    mode = f"x{speed:g} от исходного темпа" if speed > 0 else "максимальная скорость"
+    print(f"Воспроизведено: {report['sent']} вопросов за {report['elapsed']:.1f} с ({mode}), "
+          f"{report['sent'] / report['elapsed'] if report['elapsed'] else 0:.1f} запросов/с")
+    print("Коды ответов: " + ", ".join(f"{status or 'нет ответа'}: {count}"
+                                       for status, count in sorted(report['statuses'].items())))
+    latencies = report['latencies']
+    if len(latencies):
+        p50, p90, p95, p99 = np.percentile(latencies, [50, 90, 95, 99])
+        print(f"Задержка, мс: p50 {p50:.1f} | p90 {p90:.1f} | p95 {p95:.1f} | p99 {p99:.1f} | "
+              f"max {latencies.max():.1f}")
+    if len(report['lags']):
+        print(f"⚠️ Отставание от расписания: {len(report['lags'])} запросов, "
+              f"p95 {np.percentile(report['lags'], 95):.1f} мс - увеличьте --concurrency")
+    print("-" * 70)
+    total = sum(report['outcomes'].values()) or 1
+    labels = {
+        'same': 'Тот же ответ', 'changed': 'Другой вопрос', 'now_answered': 'Теперь отвечено',
+        'now_unanswered': 'Теперь без ответа', 'unknown': 'Нет данных в истории', 'error': 'Ошибка'
+    }
+    for outcome in OUTCOMES:
+        count = report['outcomes'][outcome]
+        print(f"{labels[outcome]:<22} {count:>8} ({count / total:.1%})")
+    print("=" * 70)
+
+
+def parse_moment(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def resolve_tenant(tenant, api_key):
+    """Фонд воспроизведения, как его определит сервер: --tenant, фонд ключа или фонд по умолчанию"""
+    if not tenant and api_key:
+        tenant = parse_mapping(config.TENANT_API_KEYS).get(api_key)
+    return tenant or config.DEFAULT_TENANT or 'default'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Воспроизведение истории вопросов как нагрузки')
+    target_group = parser.add_mutually_exclusive_group(required=True)
+    target_group.add_argument('--url', help='Адрес запущенного сервера, например http://localhost:5050')
+    target_group.add_argument('--in-process', action='store_true', help='Поиск в этом процессе, без HTTP')
+    parser.add_argument('--speed', type=float, default=0.0,
+                        help='Множитель исходного темпа (1 - как в истории), 0 - максимальная скорость')
+    parser.add_argument('--concurrency', type=int, default=8, help='Одновременных запросов')
+    parser.add_argument('--from', dest='start', help='Начало периода истории (ISO)')
+    parser.add_argument('--to', dest='end', help='Конец периода истории (ISO)')
+    parser.add_argument('--limit', type=int, help='Сколько вопросов воспроизвести')
+    parser.add_argument('--tenant', help='Фонд: его история и заголовок X-Tenant-ID')
+    parser.add_argument('--api-key', help='Ключ фонда (заголовок X-API-Key)')
+    parser.add_argument('--diff-out', help='JSONL-файл для вопросов, ответ на которые изменился')
+    args = parser.parse_args()
+
+    # История и ответы сравниваются в базе того же фонда, к которому идут запросы
+    schemas = parse_mapping(config.TENANTS) or {'default': config.DB_NAME}
+    tenant = resolve_tenant(args.tenant, args.api_key)
+    if tenant not in schemas:
+        logger.error(f"❌ Неизвестный фонд: {tenant}")
+        sys.exit(1)
+    db = open_storage(config, schemas[tenant])
+    target = InProcessTarget(db, tenant) if args.in_process else HttpTarget(args.url, tenant, args.api_key)
+    rows = iter_history(db, parse_moment(args.start), parse_moment(args.end), args.limit)
+
+    diff_file = open(args.diff_out, 'w', encoding='utf-8') if args.diff_out else None
+    try:
+        report = replay(rows, target, args.speed, args.concurrency, diff_file)
+    except ConnectionError as e:
+        logger.error(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        if diff_file:
+            diff_file.close()
+    print_report(report, args.speed)
@@ -0,0 +1,150 @@
+# scripts/retention.py
+import sys
+import os
+import argparse
+import base64
+import gzip
+import json
+import logging
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+from database import Database
+from partitioning import (
+    PARTITIONED_TABLE, add_months, month_start, partition_month, extend_partitions_sql
+)
+from stats_rollup import run_rollup
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def json_value(value):
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Неподдерживаемый тип: {type(value).__name__}")
+
+
+def export_rows(db, query, path):
+    """Выгружает результат запроса в gzip JSONL; файл появляется только после успешной записи"""
+    count = 0
+    tmp_path = path + '.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as file:
+        for row in db.iter_query(query):
+            file.write(json.dumps(row, ensure_ascii=False, default=json_value) + '\n')
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+def list_partitions(db):
+    rows = db.execute_query("""
+        SELECT PARTITION_NAME AS name, TABLE_ROWS AS approx_rows
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """, (PARTITIONED_TABLE,))
+    return rows
+
+
+def stats_cover_partition(db, partition):
+    """Учтены ли все строки секции в агрегатах статистики (иначе досчитываем их)"""
+    result = db.execute_query(f"SELECT MAX(id) AS max_id FROM {PARTITIONED_TABLE} PARTITION ({partition})")
+    if result is None:
+        return False
+    max_id = result[0]['max_id']
+    if max_id is None:
+        return True
+    watermark = db.get_stats_watermark()
+    if watermark is not None and watermark < max_id:
+        run_rollup(db, batch_size=config.STATS_ROLLUP_BATCH, lag_seconds=config.STATS_ROLLUP_LAG_SECONDS)
+        watermark = db.get_stats_watermark()
+    return watermark is not None and watermark >= max_id
+
+
+def apply_retention(keep_months, archive_dir, archive, dry_run):
+    db = Database(config.DB_HOST, config.DB_USER, config.DB_PASSWORD, config.DB_NAME)
+    partitions = list_partitions(db)
+    if not partitions:
+        logger.error(f"❌ Таблица {PARTITIONED_TABLE} не секционирована - запустите scripts/init_db.py")
+        return False
+
+    # Секции на будущие месяцы, чтобы новые строки не попадали в pmax
+    now = datetime.now()
+    extend = extend_partitions_sql([p['name'] for p in partitions],
+                                   add_months(now, config.PARTITIONS_AHEAD_MONTHS))
+    if extend and not dry_run:
+        if not db.execute_update(extend):
+            return False
+        logger.info("🗓️ Добавлены секции на будущие месяцы")
+
+    cutoff = add_months(month_start(now), -keep_months)
+    expired = [p for p in partitions if partition_month(p['name']) and partition_month(p['name']) < cutoff]
+    if not expired:
+        logger.info(f"ℹ️ Нет секций старше {cutoff:%Y-%m}")
+        return True
+    if archive:
+        os.makedirs(archive_dir, exist_ok=True)
+
+    for partition in expired:
+        name = partition['name']
+        logger.info(f"📦 Секция {name}: ~{partition['approx_rows']} строк")
+        if dry_run:
+            continue
+        if not stats_cover_partition(db, name):
+            logger.error(f"❌ Секция {name} еще не учтена в статистике, пропускаем")
+            continue
+
+        started = time.perf_counter()
+        pending_join = (
+            f"FROM pending_questions pq "
+            f"JOIN {PARTITIONED_TABLE} PARTITION ({name}) uq ON pq.user_question_id = uq.id"
+        )
+        if archive:
+            try:
+                questions = export_rows(
+                    db, f"SELECT * FROM {PARTITIONED_TABLE} PARTITION ({name}) ORDER BY id",
+                    os.path.join(archive_dir, f"{PARTITIONED_TABLE}_{name}.jsonl.gz")
+                )
+                pending = export_rows(
+                    db, f"SELECT pq.* {pending_join} ORDER BY pq.id",
+                    os.path.join(archive_dir, f"pending_questions_{name}.jsonl.gz")
+                )
+            except Exception as e:
+                logger.error(f"❌ Ошибка архивации секции {name}: {e}")
+                return False
+            logger.info(f"💾 {name}: в архиве {questions} вопросов и {pending} записей очереди")
+
+        # Записи очереди ссылаются на удаляемые вопросы - удаляем их вместе с секцией
+        if not db.execute_update(f"DELETE pq {pending_join}"):
+            return False
+        if not db.execute_update(f"ALTER TABLE {PARTITIONED_TABLE} DROP PARTITION {name}"):
+            return False
+        logger.info(f"🗑️ Секция {name} удалена за {time.perf_counter() - started:.1f} с")
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Хранение и архивация истории вопросов пользователей')
+    parser.add_argument('--keep-months', type=int, default=config.USER_QUESTIONS_RETENTION_MONTHS,
+                        help='Сколько последних месяцев хранить в базе')
+    parser.add_argument('--archive-dir', default=config.ARCHIVE_DIR, help='Каталог для архивов секций')
+    parser.add_argument('--no-archive', action='store_true', help='Удалять секции без выгрузки в архив')
+    parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет удалено')
+    args = parser.parse_args()
+
+    if not apply_retention(args.keep_months, args.archive_dir, not args.no_archive, args.dry_run):
+        logger.error("💥 Обработка секций завершилась с ошибками")
+        sys.exit(1)
+    logger.info("🎉 Готово")
@@ -0,0 +1,55 @@
+# scripts/rollup_stats.py
+import sys
+import os
+import argparse
+import logging
+import time
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+from storage import open_storage
+from stats_rollup import run_rollup
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def rollup_once(db, batch_size, lag_seconds):
+    started = time.perf_counter()
+    processed = run_rollup(db, batch_size=batch_size, lag_seconds=lag_seconds)
+    if processed is None:
+        logger.error("❌ Ошибка обновления агрегатов статистики")
+        return False
+    if processed:
+        logger.info(f"📊 Учтено {processed} вопросов за {time.perf_counter() - started:.2f} с")
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Инкрементальное обновление агрегатов статистики')
+    parser.add_argument('--batch-size', type=int, default=config.STATS_ROLLUP_BATCH,
+                        help='Строк user_questions в одной транзакции')
+    parser.add_argument('--lag', type=int, default=config.STATS_ROLLUP_LAG_SECONDS,
+                        help='Не учитывать строки моложе этого числа секунд')
+    parser.add_argument('--loop', action='store_true', help='Работать постоянно')
+    parser.add_argument('--interval', type=int, default=60, help='Пауза между запусками в режиме --loop, с')
+    args = parser.parse_args()
+
+    db = open_storage(config)
+    if not args.loop:
+        sys.exit(0 if rollup_once(db, args.batch_size, args.lag) else 1)
+
+    logger.info(f"🔁 Обновление агрегатов каждые {args.interval} с")
+    try:
+        while True:
+            rollup_once(db, args.batch_size, args.lag)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        logger.info("👋 Остановлено")
@@ -0,0 +1,78 @@
+# scripts/shard_worker.py
+import sys
+import os
+import argparse
+import logging
+import threading
+import time
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+from storage import open_storage
+from search_index import index_from_settings
+from sharding import ShardServer
+from tenants import parse_mapping
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def exit_with_parent(parent_pid):
+    """Локальный шард завершается вместе с сервером, даже если тот не успел его остановить"""
+    while os.getppid() == parent_pid:
+        time.sleep(1)
+    logger.info("Сервер завершился, шард останавливается")
+    os._exit(0)
+
+
+def run_worker(number, n_shards, host, port, preload):
+    # Те же фонды и схемы, что у сервера; хранилища открываются по первому обращению
+    schemas = parse_mapping(config.TENANTS) or {'default': config.DB_NAME}
+    storages = {}
+
+    def open_db(tenant):
+        if tenant not in schemas:
+            raise KeyError(f"Неизвестный фонд: {tenant}")
+        if tenant not in storages:
+            storages[tenant] = open_storage(config, schemas[tenant])
+        return storages[tenant]
+
+    def create_index(tenant):
+        # Проекция PCA у каждого шарда своя: она рассчитывается по его части вариантов
+        return index_from_settings(
+            config, pca_path=os.path.join(config.PCA_DIR, f"{tenant}.shard{number}of{n_shards}.npz")
+        )
+
+    server = ShardServer(number, n_shards, open_db, create_index)
+    for tenant in preload:
+        server.load(tenant)
+    server.serve((host, port), config.SHARD_AUTHKEY.encode())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Процесс шарда индекса поиска')
+    parser.add_argument('--shard', type=int, required=True, help='Номер шарда, с 0')
+    parser.add_argument('--shards', type=int, required=True, help='Всего шардов (SEARCH_SHARDS сервера)')
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес для входящих соединений')
+    parser.add_argument('--port', type=int, required=True, help='Порт для входящих соединений')
+    parser.add_argument('--preload', default='', help='Фонды через запятую, загружаемые сразу при старте')
+    parser.add_argument('--parent-pid', type=int, help='Завершиться вместе с этим процессом (локальные шарды)')
+    args = parser.parse_args()
+
+    if not 0 <= args.shard < args.shards:
+        logger.error(f"❌ Номер шарда {args.shard} вне диапазона 0..{args.shards - 1}")
+        sys.exit(1)
+    if not config.SHARD_AUTHKEY:
+        logger.error("❌ Не задан SHARD_AUTHKEY")
+        sys.exit(1)
+    if args.parent_pid:
+        threading.Thread(target=exit_with_parent, args=(args.parent_pid,), daemon=True).start()
+    run_worker(args.shard, args.shards, args.host, args.port,
+               [name.strip() for name in args.preload.split(',') if name.strip()])
@@ -0,0 +1,212 @@
+# scripts/snapshot.py
+import sys
+import os
+import argparse
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime
+import numpy as np
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+from storage import open_storage
+from search_index import EMBEDDING_DIM
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 'charity-bot-kb'
+SNAPSHOT_VERSION = 1
+
+# Таблица -> столбцы; строковые столбцы хранятся как UTF-8 буфер + смещения
+TABLES = {
+    'questions_groups': ['id', 'name', 'description'],
+    'answers': ['id', 'answer_text'],
+    'standard_questions': ['id', 'title', 'group_id', 'answer_id', 'intent'],
+    'question_variants': ['id', 'variant_text', 'standard_question_id'],
+}
+STRING_COLUMNS = {'name', 'description', 'answer_text', 'title', 'intent', 'variant_text'}
+
+
+def model_id():
+    """Идентификатор модели эмбеддингов, с которой совместим снимок"""
+    return os.path.basename(os.path.normpath(config.MODEL_PATH))
+
+
+def pack_strings(values):
+    """Столбец строк -> (буфер UTF-8, смещения, маска NULL)"""
+    encoded = [(value or '').encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(item) for item in encoded])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    nulls = np.array([value is None for value in values], dtype=bool)
+    return data, offsets, nulls
+
+
+def unpack_strings(data, offsets, nulls):
+    raw = data.tobytes()
+    return [
+        None if nulls[i] else raw[offsets[i]:offsets[i + 1]].decode('utf-8')
+        for i in range(len(nulls))
+    ]
+
+
+def checksum(array):
+    return hashlib.sha256(np.ascontiguousarray(array).tobytes()).hexdigest()
+
+
+def export_snapshot(output):
+    """Выгружает базу знаний и матрицу эмбеддингов в один npz-файл"""
+    db = open_storage(config)
+    started = time.perf_counter()
+
+    arrays = {}
+    counts = {}
+    for table, columns in TABLES.items():
+        select = ', '.join(columns + (['embedding'] if table == 'question_variants' else []))
+        rows = db.execute_query(f"SELECT {select} FROM {table} ORDER BY id")
+        if rows is None:
+            logger.error(f"❌ Не удалось прочитать таблицу {table}")
+            return False
+        counts[table] = len(rows)
+        for column in columns:
+            values = [row[column] for row in rows]
+            key = f"{table}.{column}"
+            if column in STRING_COLUMNS:
+                arrays[key + '.data'], arrays[key + '.offsets'], arrays[key + '.nulls'] = pack_strings(values)
+            else:
+                arrays[key] = np.array(values, dtype=np.int64)
+
+        if table == 'question_variants':
+            matrix = np.zeros((len(rows), EMBEDDING_DIM), dtype=np.float32)
+            for i, row in enumerate(rows):
+                blob = row['embedding']
+                if not blob or len(blob) != EMBEDDING_DIM * 4:
+                    logger.error(f"❌ Вариант {row['id']}: некорректный эмбеддинг, выгрузка прервана")
+                    return False
+                matrix[i] = np.frombuffer(blob, dtype=np.float32)
+            arrays['question_variants.embedding'] = matrix
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'model_id': model_id(),
+        'embedding_dim': EMBEDDING_DIM,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'counts': counts,
+        'checksums': {key: checksum(array) for key, array in arrays.items()},
+    }
+    arrays['manifest'] = np.frombuffer(json.dumps(manifest).encode('utf-8'), dtype=np.uint8)
+
+    with open(output, 'wb') as file:
+        np.savez_compressed(file, **arrays)
+    size_mb = os.path.getsize(output) / 1024 / 1024
+    logger.info(
+        f"💾 Снимок {output}: {counts['question_variants']} вариантов, {size_mb:.1f} МБ, "
+        f"{time.perf_counter() - started:.1f} с"
+    )
+    return True
+
+
+def read_snapshot(path):
+    """Читает снимок и проверяет формат и контрольные суммы"""
+    with np.load(path, allow_pickle=False) as bundle:
+        arrays = {key: bundle[key] for key in bundle.files}
+    manifest = json.loads(arrays.pop('manifest').tobytes().decode('utf-8'))
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError("Файл не является снимком базы знаний")
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Неподдерживаемая версия снимка: {manifest.get('version')}")
+
+    expected = manifest['checksums']
+    if set(expected) != set(arrays):
+        raise ValueError("Состав массивов снимка не совпадает с манифестом")
+    for key, array in arrays.items():
+        if checksum(array) != expected[key]:
+            raise ValueError(f"Контрольная сумма не совпадает: {key}")
+    return manifest, arrays
+
+
+def import_snapshot(path, replace, chunk_size, force):
+    """Загружает снимок в хранилище без повторного кодирования"""
+    started = time.perf_counter()
+    try:
+        manifest, arrays = read_snapshot(path)
+    except (ValueError, OSError, KeyError) as e:
+        logger.error(f"❌ Снимок поврежден: {e}")
+        return False
+    logger.info(f"🔐 Контрольные суммы совпадают ({len(arrays)} массивов)")
+
+    if manifest['model_id'] != model_id() and not force:
+        logger.error(
+            f"❌ Снимок создан моделью {manifest['model_id']}, а сервер использует {model_id()}. "
+            f"Эмбеддинги несовместимы (--force для загрузки без проверки)"
+        )
+        return False
+
+    db = open_storage(config)
+    if not replace:
+        existing = db.execute_query("SELECT COUNT(*) AS count FROM question_variants")
+        if existing is None:
+            logger.error("❌ Ошибка подключения к базе данных")
+            return False
+        if existing[0]['count']:
+            logger.error("❌ База знаний не пуста - используйте --replace для замены")
+            return False
+
+    tables = []
+    for table, columns in TABLES.items():
+        values = []
+        for column in columns:
+            key = f"{table}.{column}"
+            if column in STRING_COLUMNS:
+                values.append(unpack_strings(arrays[key + '.data'], arrays[key + '.offsets'], arrays[key + '.nulls']))
+            else:
+                values.append(arrays[key].tolist())
+        load_columns = list(columns)
+        if table == 'question_variants':
+            matrix = arrays['question_variants.embedding']
+            values.append([row.tobytes() for row in matrix])
+            load_columns.append('embedding')
+        tables.append((table, load_columns, list(zip(*values))))
+
+    loaded = db.bulk_load(tables, chunk_size=chunk_size, replace=replace)
+    if loaded is None:
+        return False
+    logger.info(f"📦 Снимок загружен за {time.perf_counter() - started:.1f} с: {loaded}")
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Экспорт и импорт снимка базы знаний')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Выгрузить базу знаний в файл')
+    export_parser.add_argument('--output', required=True, help='Путь к файлу снимка (.npz)')
+
+    import_parser = subparsers.add_parser('import', help='Загрузить снимок в базу данных')
+    import_parser.add_argument('--input', required=True, help='Путь к файлу снимка (.npz)')
+    import_parser.add_argument('--replace', action='store_true', help='Заменить существующую базу знаний')
+    import_parser.add_argument('--chunk-size', type=int, default=10000,
+                               help='Строк в одном многострочном INSERT (весь импорт - одна транзакция)')
+    import_parser.add_argument('--force', action='store_true', help='Не проверять совпадение модели')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        success = export_snapshot(args.output)
+    else:
+        success = import_snapshot(args.input, args.replace, args.chunk_size, args.force)
+
+    if not success:
+        logger.error("💥 Операция со снимком завершилась с ошибками")
+        sys.exit(1)
+    logger.info("🎉 Готово")
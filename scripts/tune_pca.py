@@ -0,0 +1,151 @@
+# scripts/tune_pca.py
+import sys
+import os
+import argparse
+import json
+import logging
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Добавляем корневую директорию проекта в путь Python
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+from storage import open_storage
+from embedding_model import EmbeddingModel
+from search_index import SearchIndex
+from tenants import parse_mapping
+from scripts.evaluate import load_csv_dataset, load_log_dataset, encode, evaluate_config
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def measure_curve(dims, kb_rows, kb_matrix, query_matrix, query_texts, labels, batch_size):
+    """Точность, совпадение top-1 с полными векторами и задержка для каждой размерности"""
+    reference = evaluate_config('exact', {}, kb_rows, kb_matrix, query_matrix, query_texts,
+                                labels, 1, batch_size)
+    reference_ids = reference.pop('top1_ids')
+    reference.update(dim=None, top1_agreement=1.0)
+    curve = [reference]
+    for dim in dims:
+        logger.info(f"▶️ Проекция на {dim} измерений")
+        report = evaluate_config(f'pca-{dim}', {'pca_dim': dim}, kb_rows, kb_matrix, query_matrix,
+                                 query_texts, labels, 1, batch_size)
+        report['top1_agreement'] = float((report.pop('top1_ids') == reference_ids).mean())
+        report['dim'] = dim
+        curve.append(report)
+    return curve
+
+
+def recommend(curve, min_agreement, max_accuracy_drop):
+    """Наименьшая размерность, которая держит совпадение top-1 и точность"""
+    reference = curve[0]
+    suitable = [
+        point for point in curve[1:]
+        if point['top1_agreement'] >= min_agreement
+        and reference['top1_accuracy'] - point['top1_accuracy'] <= max_accuracy_drop
+    ]
+    return min(suitable, key=lambda point: point['dim']) if suitable else None
+
+
+def print_curve(curve, best):
+    print("\n" + "=" * 80)
+    print(f"{'Размерность':<12} | {'top-1':>7} | {'Совпад.':>7} | {'мс/запрос':>9} | {'Запросов/с':>11} | {'Ускорение':>9}")
+    print("-" * 80)
+    base_latency = curve[0]['mean_latency_ms']
+    for point in curve:
+        name = str(point['dim']) if point['dim'] else 'полная'
+        speedup = base_latency / point['mean_latency_ms'] if point['mean_latency_ms'] else 0.0
+        marker = '  <- рекомендуется' if point is best else ''
+        print(f"{name:<12} | {point['top1_accuracy']:>7.2%} | {point['top1_agreement']:>7.2%} | "
+              f"{point['mean_latency_ms']:>9.3f} | {point['queries_per_second']:>11.1f} | {speedup:>8.1f}x{marker}")
+    print("=" * 80)
+    if best:
+        print(f"Рекомендуемая размерность: INDEX_PCA_DIM={best['dim']} (PCA_CANDIDATES={config.PCA_CANDIDATES})")
+    else:
+        print("Ни одна размерность не удержала точность - оставьте INDEX_PCA_DIM=0")
+
+
+def save_projection(tenant, dim, kb_rows, kb_matrix):
+    """Рассчитывает проекцию по базе фонда так же, как сервер, и сохраняет ее в PCA_DIR"""
+    path = os.path.join(config.PCA_DIR, f"{tenant}.npz")
+    if os.path.exists(path):
+        os.remove(path)
+    index = SearchIndex(
+        compression=config.INDEX_COMPRESSION,
+        compression_max_error=config.COMPRESSION_MAX_ERROR,
+        compression_max_medoids=config.COMPRESSION_MAX_MEDOIDS,
+        pca_dim=dim,
+        pca_path=path
+    )
+    index.build(kb_rows, kb_matrix)
+    if not os.path.exists(path):
+        logger.error(f"❌ Не удалось сохранить проекцию в {path}")
+        return False
+    logger.info(f"💾 Проекция сохранена в {path}; сервер загрузит ее при старте")
+    return True
+
+
+def run(args):
+    embedder = EmbeddingModel(config.MODEL_PATH)
+    if args.source == 'csv':
+        kb_rows, _, queries = load_csv_dataset(args.file, args.holdout, 0.0, args.seed)
+        kb_matrix, _, _ = encode(embedder, [row['variant_text'] for row in kb_rows], args.batch_size)
+    else:
+        schemas = parse_mapping(config.TENANTS) or {'default': config.DB_NAME}
+        if args.tenant not in schemas:
+            logger.error(f"❌ Неизвестный фонд: {args.tenant}")
+            return False
+        kb_rows, kb_matrix, queries = load_log_dataset(open_storage(config, schemas[args.tenant]), args.limit)
+    if not kb_rows or not queries:
+        logger.error("❌ Недостаточно данных для подбора")
+        return False
+
+    query_matrix, query_texts, _ = encode(embedder, [text for text, _ in queries], args.batch_size)
+    labels = [label for _, label in queries]
+    dims = sorted({int(dim) for dim in args.dims.split(',') if dim.strip()})
+    curve = measure_curve(dims, kb_rows, kb_matrix, query_matrix, query_texts, labels, args.batch_size)
+    best = recommend(curve, args.min_agreement, args.max_accuracy_drop)
+    print_curve(curve, best)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump([{key: value for key, value in point.items() if key != 'curve'} for point in curve],
+                      file, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Кривая сохранена в {args.output}")
+
+    if args.save:
+        if args.source != 'log':
+            logger.error("❌ --save сохраняет проекцию базы фонда: используйте --source log")
+            return False
+        if not best:
+            return False
+        return save_projection(args.tenant, best['dim'], kb_rows, kb_matrix)
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Подбор размерности проекции PCA по кривой точность/задержка')
+    parser.add_argument('--source', choices=['csv', 'log'], default='log',
+                        help='log - база из БД и размеченные user_questions, csv - отложенные варианты из CSV')
+    parser.add_argument('--file', type=str, default='base_qu_an/qu_ans_1.csv', help='CSV файл базы знаний')
+    parser.add_argument('--holdout', type=float, default=0.2, help='Доля вариантов, откладываемая в запросы (csv)')
+    parser.add_argument('--limit', type=int, default=5000, help='Максимум вопросов из user_questions (log)')
+    parser.add_argument('--dims', type=str, default='32,48,64,96,128,192', help='Размерности через запятую')
+    parser.add_argument('--min-agreement', type=float, default=0.99,
+                        help='Минимальная доля совпадений top-1 с поиском по полным векторам')
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.005, help='Допустимое падение точности top-1')
+    parser.add_argument('--batch-size', type=int, default=64, help='Размер пачки кодирования и поиска')
+    parser.add_argument('--seed', type=int, default=42, help='Seed случайного разбиения (csv)')
+    parser.add_argument('--tenant', type=str, default='default', help='Фонд (log): его база, вопросы и файл проекции')
+    parser.add_argument('--save', action='store_true',
+                        help='Сохранить проекцию рекомендуемой размерности в PCA_DIR/<фонд>.npz')
+    parser.add_argument('--output', type=str, help='Сохранить кривую в JSON')
+    args = parser.parse_args()
+
+    if not run(args):
+        sys.exit(1)
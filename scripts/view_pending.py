@@ -13,70 +13,117 @@ load_dotenv()
 # Добавляем корневую директорию проекта в путь Python
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from database import Database
+from storage import open_storage
+from search_index import SearchIndex, EMBEDDING_DIM
+from utils import query_blobs_to_matrix
 import config
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def view_pending_questions(show_all=False):
-    """Показывает список неотвеченных вопросов"""
-    # Используем позиционные аргументы для Database (как в add_question.py)
-    db = Database(config.DB_HOST, config.DB_USER, config.DB_PASSWORD, config.DB_NAME)
-    
-    if not db.connect():
-        logger.error("❌ Ошибка подключения к базе данных")
-        return
-
-    try:
-        # Определяем условие для выборки
-        condition = "" if show_all else "WHERE processed = FALSE"
-        
-        query = f"""
-        SELECT 
-            pq.id AS pending_id,
-            uq.raw_question,
-            uq.created_at,
-            pq.processed,
-            sq.title AS matched_question
-        FROM pending_questions pq
-        JOIN user_questions uq ON pq.user_question_id = uq.id
-        LEFT JOIN standard_questions sq ON uq.standard_question_id = sq.id
-        {condition}
-        ORDER BY uq.created_at DESC
-        """
-        
-        with db.connection.cursor() as cursor:
-            cursor.execute(query)
-            questions = cursor.fetchall()
-            
-            if not questions:
-                logger.info("ℹ️ Нет неотвеченных вопросов")
-                return
-                
-            logger.info(f"📋 Найдено {len(questions)} вопросов:")
-            print("\n" + "=" * 100)
-            print(f"{'ID':<8} | {'Статус':<12} | {'Дата создания':<20} | {'Вопрос'}")
-            print("-" * 100)
-            
-            for row in questions:
-                status = "Обработан" if row['processed'] else "Ожидает"
-                date_str = row['created_at'].strftime("%Y-%m-%d %H:%M")
-                matched = f" [Совпадение: {row['matched_question']}]" if row['matched_question'] else ""
-                
-                print(f"{row['pending_id']:<8} | {status:<12} | {date_str:<20} | {row['raw_question']}{matched}")
-            
-            print("=" * 100)
-            
-    except Exception as e:
-        logger.error(f"❌ Ошибка: {str(e)}")
-    finally:
-        db.disconnect()
+# Сколько вариантов запрашивать у индекса, чтобы набрать top-N разных стандартных вопросов
+SUGGESTION_OVERFETCH = 10
+
+
+def load_suggestion_index(db):
+    """Индекс вариантов базы знаний для подсказок оператору"""
+    search_index = SearchIndex()
+    search_index.load(db.get_all_variants())
+    return search_index
+
+
+def page_cursor(row, order):
+    """Курсор keyset-пагинации по последней строке страницы"""
+    return (row['hit_count'] if order == 'frequent' else row['created_at'], row['pending_id'])
+
+
+def iter_pending_pages(db, page_size=20, order='recent', show_all=False, pending_ids=None):
+    """Обходит очередь страницами; курсор не сдвигается, даже если строки обрабатываются по ходу"""
+    after = None
+    while True:
+        page = db.get_pending_page(after=after, limit=page_size, order=order,
+                                   only_unprocessed=not show_all, pending_ids=pending_ids)
+        if page is None:
+            logger.error("❌ Ошибка получения вопросов из базы данных")
+            return
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        after = page_cursor(page[-1], order)
+
+
+def attach_suggestions(search_index, page, top_k=3):
+    """Добавляет к каждой строке страницы top_k ближайших стандартных вопросов.
+
+    Эмбеддинги всей страницы сравниваются с базой знаний одним умножением матриц.
+    """
+    for row in page:
+        row['suggestions'] = []
+    matrix, valid = query_blobs_to_matrix([row['embedding'] for row in page], EMBEDDING_DIM)
+    if not valid or not search_index.size:
+        return page
+
+    results = search_index.search_batch(matrix, top_k=top_k * SUGGESTION_OVERFETCH, mode='dense')
+    for row, matches in zip((page[i] for i in valid), results):
+        seen = set()
+        for match in matches:
+            if match['std_question_id'] in seen:
+                continue
+            seen.add(match['std_question_id'])
+            row['suggestions'].append({
+                'std_question_id': match['std_question_id'],
+                'title': match['title'] or match['variant_text'],
+                'similarity': match['similarity']
+            })
+            if len(row['suggestions']) == top_k:
+                break
+    return page
+
+
+def print_page(page, number):
+    print("\n" + "=" * 100)
+    print(f"Страница {number}")
+    print(f"{'ID':<8} | {'Повторов':<8} | {'Статус':<12} | {'Последний раз':<20} | {'Вопрос'}")
+    print("-" * 100)
+    for row in page:
+        status = "Обработан" if row['processed'] else "Ожидает"
+        date_str = (row['last_seen_at'] or row['created_at']).strftime("%Y-%m-%d %H:%M")
+        matched = f" [Совпадение: {row['matched_question']}]" if row['matched_question'] else ""
+        print(f"{row['pending_id']:<8} | {row['hit_count']:<8} | {status:<12} | {date_str:<20} | {row['raw_question']}{matched}")
+        for suggestion in row.get('suggestions', []):
+            print(f"{'':>8}   -> {suggestion['std_question_id']:<6} ({suggestion['similarity']:.2f}) {suggestion['title']}")
+    print("=" * 100)
+
+
+def view_pending_questions(show_all=False, page_size=20, order='recent', suggestions=True):
+    """Показывает список неотвеченных вопросов постранично"""
+    db = open_storage(config)
+    search_index = load_suggestion_index(db) if suggestions else None
+
+    shown = 0
+    for number, page in enumerate(iter_pending_pages(db, page_size, order, show_all), 1):
+        if search_index is not None:
+            attach_suggestions(search_index, page)
+        print_page(page, number)
+        shown += len(page)
+        if len(page) == page_size and input("Enter - следующая страница, q - выход: ").strip().lower() == 'q':
+            break
+
+    if not shown:
+        logger.info("ℹ️ Нет неотвеченных вопросов")
+    else:
+        logger.info(f"📋 Показано {shown} вопросов")
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Просмотр неотвеченных вопросов')
     parser.add_argument('--all', action='store_true', help='Показать все вопросы, включая обработанные')
+    parser.add_argument('--page-size', type=int, default=20, help='Вопросов на странице')
+    parser.add_argument('--order', choices=['recent', 'frequent'], default='recent',
+                        help='recent - новые первыми, frequent - частые первыми')
+    parser.add_argument('--no-suggestions', action='store_true', help='Не подбирать похожие стандартные вопросы')
     args = parser.parse_args()
-    
-    view_pending_questions(args.all)
\ No newline at end of file
+
+    view_pending_questions(args.all, args.page_size, args.order, not args.no_suggestions)
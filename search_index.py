@@ -0,0 +1,632 @@
+# Файл search_index.py
+import logging
+import threading
+import numpy as np
+
+from clustering import leader_clustering, cluster_members, representative
+from lexical_index import LexicalIndex
+from projection import PCAProjection
+from utils import blob_to_array
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 384
+
+# Режимы поиска
+SEARCH_MODE_DENSE = 'dense'          # только косинусная близость эмбеддингов
+SEARCH_MODE_PREFILTER = 'prefilter'  # BM25 отбирает кандидатов, эмбеддинги переранжируют
+SEARCH_MODE_FUSED = 'fused'          # взвешенная сумма косинусной близости и BM25
+SEARCH_MODES = (SEARCH_MODE_DENSE, SEARCH_MODE_PREFILTER, SEARCH_MODE_FUSED)
+
+# Хранение матрицы эмбеддингов
+QUANTIZATION_NONE = 'none'  # float32
+QUANTIZATION_INT8 = 'int8'  # int8 с масштабом на строку, в 4 раза меньше памяти
+QUANTIZATIONS = (QUANTIZATION_NONE, QUANTIZATION_INT8)
+
+# Перебор кандидатов
+ANN_EXACT = 'exact'  # полный перебор
+ANN_IVF = 'ivf'      # инвертированные списки по центроидам k-means
+ANN_METHODS = (ANN_EXACT, ANN_IVF)
+
+# Сжатие вариантов стандартного вопроса
+COMPRESSION_NONE = 'none'        # строка на каждый вариант
+COMPRESSION_MEDOIDS = 'medoids'  # центроид вопроса плюс несколько медоидов далеких вариантов
+COMPRESSIONS = (COMPRESSION_NONE, COMPRESSION_MEDOIDS)
+
+
+def normalize_rows(matrix):
+    """Нормирует строки матрицы, чтобы скалярное произведение было косинусом"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize_int8(matrix):
+    """Симметричное квантование строк в int8: строка ≈ codes * scale"""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def kmeans(matrix, n_clusters, iterations=10, seed=0, chunk_size=65536):
+    """Сферический k-means для нормированных строк, возвращает (центроиды, метки)"""
+    rng = np.random.default_rng(seed)
+    centroids = matrix[rng.choice(len(matrix), n_clusters, replace=False)].copy()
+    labels = np.zeros(len(matrix), dtype=np.int32)
+    for _ in range(iterations):
+        for start in range(0, len(matrix), chunk_size):
+            block = matrix[start:start + chunk_size]
+            labels[start:start + chunk_size] = np.argmax(block @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, matrix)
+        counts = np.bincount(labels, minlength=n_clusters)
+        empty = counts == 0
+        if empty.any():
+            # Пустые кластеры заново засеваем случайными строками
+            sums[empty] = matrix[rng.choice(len(matrix), int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids, labels
+
+
+def compress_variants(matrix, std_question_ids, max_error=0.05, max_medoids=3):
+    """Заменяет варианты каждого стандартного вопроса несколькими представителями.
+
+    Первый представитель - нормированный центроид вариантов вопроса. Варианты,
+    у которых косинусная близость к центроиду ниже 1 - max_error, кластеризуются
+    «лидерами» с тем же порогом, и медоиды не более max_medoids самых крупных
+    кластеров добавляются как отдельные строки. Возвращает (номера исходных
+    строк, матрица представителей, статистика): метаданные строки центроида
+    берутся у варианта, ближайшего к нему.
+    """
+    threshold = 1.0 - max_error
+    kept_rows, vectors = [], []
+    stats = {'variants': len(matrix), 'rows': 0, 'medoids': 0, 'outside_bound': 0, 'max_error': 0.0}
+    order = np.argsort(std_question_ids, kind='stable')
+    bounds = np.flatnonzero(np.diff(std_question_ids[order])) + 1
+    for members in (np.split(order, bounds) if len(order) else []):
+        block = matrix[members]
+        centroid = normalize_rows(block.mean(axis=0))
+        coverage = block @ centroid
+        kept_rows.append(int(members[np.argmax(coverage)]))
+        vectors.append(centroid)
+
+        far = np.flatnonzero(coverage < threshold)
+        if len(far) and max_medoids > 0:
+            labels, _ = leader_clustering(block[far], threshold)
+            for cluster in cluster_members(labels)[:max_medoids]:
+                medoid = far[representative(block[far], cluster)]
+                kept_rows.append(int(members[medoid]))
+                vectors.append(block[medoid])
+                coverage = np.maximum(coverage, block @ block[medoid])
+                stats['medoids'] += 1
+        stats['outside_bound'] += int((coverage < threshold).sum())
+        stats['max_error'] = max(stats['max_error'], float(1.0 - coverage.min()))
+
+    stats['rows'] = len(kept_rows)
+    if not vectors:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, matrix.shape[1]), dtype=np.float32), stats
+    return np.array(kept_rows, dtype=np.int64), np.vstack(vectors).astype(np.float32), stats
+
+
+def _rows(selection):
+    """Номера строк для выборки: (start, end) или массив номеров"""
+    if isinstance(selection, tuple):
+        return np.arange(*selection)
+    return selection
+
+
+def _meta_from_rows(rows):
+    """Метаданные строк индекса в виде массивов, которые можно переставлять и склеивать"""
+    return {
+        'variant_ids': np.array([r['id'] for r in rows], dtype=np.int64),
+        'std_question_ids': np.array([r['std_question_id'] for r in rows], dtype=np.int64),
+        'answer_ids': np.array([r['answer_id'] for r in rows], dtype=np.int64),
+        'group_ids': np.array([r.get('group_id') or 0 for r in rows], dtype=np.int64),
+        'intents': np.array([r.get('intent') for r in rows], dtype=object),
+        'variant_texts': np.array([r['variant_text'] for r in rows], dtype=object),
+        'titles': np.array([r.get('title') or '' for r in rows], dtype=object),
+    }
+
+
+def _sort_order(meta):
+    """Порядок строк по (group_id, intent, id): разделы становятся непрерывными блоками"""
+    intent_keys = np.array([intent or '' for intent in meta['intents']], dtype=str)
+    return np.lexsort((meta['variant_ids'], intent_keys, meta['group_ids']))
+
+
+class _IndexData:
+    """Неизменяемый снимок индекса: матрица эмбеддингов и метаданные строк"""
+
+    def __init__(self, matrix, meta, lexical, lexical_order, scales=None, ivf=None,
+                 projection=None, projected=None):
+        self.matrix = matrix  # float32 или int8 (тогда строки умножаются на scales)
+        self.scales = scales
+        self.ivf = ivf        # (центроиды, смещения списков, номера строк, метки строк) или None
+        self.projection = projection  # PCAProjection или None
+        self.projected = projected    # строки матрицы в пространстве проекции, float32
+        self.meta = meta
+        self.variant_ids = meta['variant_ids']
+        self.std_question_ids = meta['std_question_ids']
+        self.answer_ids = meta['answer_ids']
+        self.group_ids = meta['group_ids']
+        self.intents = meta['intents']
+        self.variant_texts = meta['variant_texts']
+        self.titles = meta['titles']
+        self.lexical = lexical
+        self.lexical_order = lexical_order  # строка индекса -> номер документа BM25
+
+        # Строки отсортированы по (group_id, intent), поэтому каждая группа и
+        # каждый intent внутри группы занимают непрерывный блок матрицы
+        self.group_ranges = {}
+        self.intent_ranges = {}
+        n = len(self.group_ids)
+        if n:
+            intent_keys = np.array([intent or '' for intent in self.intents], dtype=str)
+            group_change = self.group_ids[1:] != self.group_ids[:-1]
+            intent_change = group_change | (intent_keys[1:] != intent_keys[:-1])
+            for start, end in _runs(group_change, n):
+                self.group_ranges[int(self.group_ids[start])] = (start, end)
+            for start, end in _runs(intent_change, n):
+                self.intent_ranges.setdefault(self.intents[start], []).append(
+                    (int(self.group_ids[start]), start, end)
+                )
+
+    @property
+    def size(self):
+        return self.matrix.shape[0]
+
+    def scope(self, group_id=None, intent=None):
+        """Возвращает (start, end) или массив номеров строк раздела"""
+        if group_id is None and intent is None:
+            return (0, self.size)
+        if intent is None:
+            return self.group_ranges.get(group_id, (0, 0))
+        ranges = [
+            (start, end) for g, start, end in self.intent_ranges.get(intent, [])
+            if group_id is None or g == group_id
+        ]
+        if len(ranges) == 1:
+            return ranges[0]
+        if not ranges:
+            return (0, 0)
+        return np.concatenate([np.arange(start, end) for start, end in ranges])
+
+    def lexical_scores(self, text):
+        """BM25-оценки запроса в порядке строк индекса"""
+        return self.lexical.score(text)[self.lexical_order]
+
+    def dot(self, selection, query):
+        """Косинусная близость строк выборки с запросом (вектор или матрица d x b)"""
+        if isinstance(selection, tuple):
+            block = self.matrix[selection[0]:selection[1]]  # срез без копирования
+            scales = self.scales[selection[0]:selection[1]] if self.scales is not None else None
+        else:
+            block = self.matrix[selection]
+            scales = self.scales[selection] if self.scales is not None else None
+        scores = block @ query
+        if scales is not None:
+            scores = scores * (scales if scores.ndim == 1 else scales[:, None])
+        return scores
+
+    def float_matrix(self):
+        """Матрица строк в float32 (для int8 - восстановленная по масштабам)"""
+        if self.scales is None:
+            return self.matrix
+        return self.matrix.astype(np.float32) * self.scales[:, None]
+
+    def projected_candidates(self, query, selection, n_candidates):
+        """Первый этап поиска: n_candidates строк выборки, ближайших к запросу в проекции"""
+        rows = _rows(selection)
+        if len(rows) <= n_candidates:
+            return selection
+        if isinstance(selection, tuple):
+            block = self.projected[selection[0]:selection[1]]
+        else:
+            block = self.projected[selection]
+        scores = block @ self.projection.project(query)
+        best = np.argpartition(scores, -n_candidates)[-n_candidates:]
+        return np.sort(rows[best])
+
+    def ivf_candidates(self, query, n_probe, scope):
+        """Строки из n_probe ближайших к запросу списков IVF в пределах scope"""
+        centroids, offsets, list_rows, _ = self.ivf
+        n_probe = min(n_probe, len(centroids))
+        probe = np.argpartition(centroids @ query, -n_probe)[-n_probe:]
+        rows = np.concatenate([list_rows[offsets[i]:offsets[i + 1]] for i in probe])
+        if isinstance(scope, tuple):
+            rows = rows[(rows >= scope[0]) & (rows < scope[1])]
+        else:
+            rows = rows[np.isin(rows, scope)]
+        return np.sort(rows)
+
+
+def _runs(changes, n):
+    """Границы блоков по маске changes[i] = ключ строки i+1 отличается от строки i"""
+    bounds = np.concatenate([[0], np.flatnonzero(changes) + 1, [n]])
+    return zip(bounds[:-1].tolist(), bounds[1:].tolist())
+
+
+def _ivf_lists(centroids, labels):
+    """Инвертированные списки IVF в формате (смещения, номера строк) по меткам строк"""
+    list_rows = np.argsort(labels, kind='stable').astype(np.int64)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=len(centroids)))])
+    return (centroids, offsets, list_rows, labels)
+
+
+class SearchIndex:
+    """Индекс вариантов вопросов в памяти: плотный поиск и BM25.
+
+    Поиск работает с неизменяемым снимком данных, поэтому читающим потокам
+    блокировка не нужна; перестроение подменяет снимок целиком.
+
+    compression='medoids' при построении заменяет варианты каждого вопроса
+    центроидом и медоидами (см. compress_variants); search() и find_closest()
+    работают так же, но variant_id и variant_text результата - у представителя.
+
+    pca_dim > 0 включает проекцию PCA (projection.py): плотный поиск сначала
+    отбирает pca_candidates строк по близости проекций размерности pca_dim, а
+    затем пересчитывает их близость по полным векторам. Проекция сохраняется
+    в pca_path и пересчитывается, когда база заметно изменилась.
+    """
+
+    def __init__(self, mode=SEARCH_MODE_DENSE, lexical_analyzer='char', ngram_size=3,
+                 lexical_candidates=50, fusion_weight=0.3, quantization=QUANTIZATION_NONE,
+                 ann=ANN_EXACT, ivf_lists=256, ivf_probe=16, compression=COMPRESSION_NONE,
+                 compression_max_error=0.05, compression_max_medoids=3, pca_dim=0, pca_candidates=100,
+                 pca_path=None, pca_refit_change=0.2, pca_refit_energy_drop=0.02):
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Неизвестный режим поиска: {mode}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Неизвестный тип квантования: {quantization}")
+        if ann not in ANN_METHODS:
+            raise ValueError(f"Неизвестный метод перебора: {ann}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Неизвестный режим сжатия: {compression}")
+        self.mode = mode
+        self.lexical_analyzer = lexical_analyzer
+        self.ngram_size = ngram_size
+        self.lexical_candidates = lexical_candidates
+        self.fusion_weight = fusion_weight
+        self.quantization = quantization
+        self.ann = ann
+        self.ivf_lists = ivf_lists
+        self.ivf_probe = ivf_probe
+        self.compression = compression
+        self.compression_max_error = compression_max_error
+        self.compression_max_medoids = compression_max_medoids
+        self.compression_stats = None
+        self.pca_dim = pca_dim
+        self.pca_candidates = pca_candidates
+        self.pca_path = pca_path
+        self.pca_refit_change = pca_refit_change
+        self.pca_refit_energy_drop = pca_refit_energy_drop
+        self._lock = threading.RLock()
+        self._data = _IndexData(
+            np.zeros((0, EMBEDDING_DIM), dtype=np.float32), _meta_from_rows([]),
+            LexicalIndex(lexical_analyzer, ngram_size), np.zeros(0, dtype=np.int64)
+        )
+
+    @property
+    def size(self):
+        return self._data.size
+
+    @staticmethod
+    def _lexical_texts(meta):
+        """Тексты документов BM25: формулировка варианта плюс заголовок стандартного вопроса"""
+        return [f"{text} {title}" for text, title in zip(meta['variant_texts'], meta['titles'])]
+
+    def _projection_for(self, matrix, current=None):
+        """Проекция для матрицы: текущая или сохраненная, если база с тех пор
+        заметно не изменилась, иначе рассчитанная заново (и сохраненная)"""
+        if not self.pca_dim or not len(matrix):
+            return None
+        projection = current or PCAProjection.load(self.pca_path)
+        dim = min(self.pca_dim, matrix.shape[1], len(matrix))
+        if projection is not None and projection.dim == dim and not projection.needs_refit(
+                matrix, self.pca_refit_change, self.pca_refit_energy_drop):
+            return projection
+        projection = PCAProjection.fit(matrix, self.pca_dim)
+        logger.info(
+            f"Проекция PCA рассчитана по {projection.fitted_rows} строкам: {projection.dim} измерений, "
+            f"сохранено {projection.energy:.1%} энергии"
+        )
+        if self.pca_path:
+            projection.save(self.pca_path)
+        return projection
+
+    def load(self, rows):
+        """Строит индекс по строкам из Database.get_all_variants()"""
+        valid_rows = []
+        embeddings = []
+        expected_size = EMBEDDING_DIM * 4  # 384 значений * 4 байта (float32)
+        for row in rows:
+            blob_data = row['embedding']
+            if not blob_data or len(blob_data) != expected_size:
+                logger.warning(
+                    f"Некорректный размер эмбеддинга варианта {row['id']}: "
+                    f"{len(blob_data) if blob_data else 0} байт (ожидалось {expected_size})"
+                )
+                continue
+            array = blob_to_array(blob_data)
+            if array is None:
+                continue
+            embeddings.append(array)
+            valid_rows.append(row)
+
+        if embeddings:
+            matrix = np.vstack(embeddings)
+        else:
+            matrix = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        return self.build(valid_rows, matrix)
+
+    def build(self, rows, embeddings):
+        """Строит индекс по метаданным вариантов и матрице их эмбеддингов"""
+        meta = _meta_from_rows(rows)
+        matrix = normalize_rows(np.asarray(embeddings, dtype=np.float32).reshape(-1, EMBEDDING_DIM))
+        compression_stats = None
+        if self.compression == COMPRESSION_MEDOIDS and len(matrix):
+            kept_rows, matrix, compression_stats = compress_variants(
+                matrix, meta['std_question_ids'], self.compression_max_error, self.compression_max_medoids
+            )
+            meta = {key: values[kept_rows] for key, values in meta.items()}
+            logger.info(
+                f"Сжатие индекса: {compression_stats['variants']} вариантов -> {compression_stats['rows']} строк, "
+                f"вне допуска {compression_stats['outside_bound']}, наибольшая ошибка {compression_stats['max_error']:.3f}"
+            )
+        # Группируем строки по разделам для поиска внутри одного раздела
+        order = _sort_order(meta)
+        meta = {key: values[order] for key, values in meta.items()}
+        matrix = matrix[order]
+
+        lexical = LexicalIndex(self.lexical_analyzer, self.ngram_size).build(self._lexical_texts(meta))
+        lexical_order = np.arange(len(order), dtype=np.int64)
+
+        ivf = None
+        if self.ann == ANN_IVF and len(matrix):
+            # Не меньше ~8 строк на список, иначе IVF не экономит перебор
+            n_lists = max(1, min(self.ivf_lists, len(matrix) // 8))
+            ivf = _ivf_lists(*kmeans(matrix, n_lists))
+
+        projection = self._projection_for(matrix)
+        projected = projection.project(matrix) if projection is not None else None
+
+        scales = None
+        if self.quantization == QUANTIZATION_INT8 and len(matrix):
+            matrix, scales = quantize_int8(matrix)
+
+        data = _IndexData(matrix, meta, lexical, lexical_order, scales=scales, ivf=ivf,
+                          projection=projection, projected=projected)
+        with self._lock:
+            self._data = data
+            self.compression_stats = compression_stats
+        logger.info(f"Индекс поиска построен: {data.size} вариантов, режим '{self.mode}'")
+        return data.size
+
+    def add(self, rows, embeddings):
+        """Добавляет варианты в работающий индекс без полной перестройки.
+
+        Новый снимок собирается из текущего: BM25 дописывает только новые
+        документы, IVF относит новые строки к существующим центроидам, матрица
+        переставляется, чтобы разделы остались непрерывными. Читатели видят
+        либо старый, либо новый снимок целиком. В сжатом индексе новые варианты
+        добавляются как есть и сжимаются при следующем полном построении.
+        Проекция PCA пересчитывается, если после добавления база заметно изменилась.
+        """
+        if not rows:
+            return 0
+        with self._lock:
+            old = self._data
+            if not old.size:
+                # Пустой индекс проще построить заново (в т.ч. центроиды IVF)
+                return self.build(rows, embeddings)
+
+            new_meta = _meta_from_rows(rows)
+            new_matrix = normalize_rows(np.asarray(embeddings, dtype=np.float32).reshape(-1, EMBEDDING_DIM))
+            lexical = old.lexical.add_documents(self._lexical_texts(new_meta))
+            new_docs = np.arange(old.lexical.size, lexical.size, dtype=np.int64)
+
+            ivf_labels = None
+            if old.ivf is not None:
+                centroids = old.ivf[0]
+                new_labels = np.argmax(new_matrix @ centroids.T, axis=1).astype(old.ivf[3].dtype)
+                ivf_labels = np.concatenate([old.ivf[3], new_labels])
+
+            projected = None
+            if old.projection is not None:
+                projected = np.concatenate([old.projected, old.projection.project(new_matrix)])
+
+            scales = None
+            if old.scales is not None:
+                new_matrix, new_scales = quantize_int8(new_matrix)
+                scales = np.concatenate([old.scales, new_scales])
+
+            meta = {key: np.concatenate([old.meta[key], new_meta[key]]) for key in old.meta}
+            order = _sort_order(meta)
+            meta = {key: values[order] for key, values in meta.items()}
+            matrix = np.concatenate([old.matrix, new_matrix])[order]
+            lexical_order = np.concatenate([old.lexical_order, new_docs])[order]
+            if scales is not None:
+                scales = scales[order]
+            ivf = _ivf_lists(old.ivf[0], ivf_labels[order]) if ivf_labels is not None else None
+
+            data = _IndexData(matrix, meta, lexical, lexical_order, scales=scales, ivf=ivf)
+            projection = old.projection
+            if projection is not None:
+                float_matrix = data.float_matrix()
+                projection = self._projection_for(float_matrix, current=old.projection)
+                if projection is old.projection:
+                    projected = projected[order]
+                else:
+                    projected = projection.project(float_matrix)
+                data.projection, data.projected = projection, projected
+
+            self._data = data
+            logger.info(f"В индекс добавлено {len(rows)} вариантов, всего {self._data.size}")
+            return len(rows)
+
+    def memory_breakdown(self):
+        """Оценка памяти текущего снимка по частям: матрица, IVF, метаданные и BM25, байты"""
+        data = self._data
+        parts = {
+            'matrix': data.matrix.nbytes + (data.scales.nbytes if data.scales is not None else 0),
+            'ivf': sum(part.nbytes for part in data.ivf) if data.ivf is not None else 0,
+            'projection': (data.projected.nbytes + data.projection.memory_bytes()
+                           if data.projection is not None else 0),
+            'lexical': data.lexical.memory_bytes() + data.lexical_order.nbytes,
+            'meta': 0,
+        }
+        for values in data.meta.values():
+            parts['meta'] += values.nbytes
+            if values.dtype == object:
+                parts['meta'] += sum(len(value) * 2 + 60 for value in values if value)
+        return parts
+
+    def memory_bytes(self):
+        return sum(self.memory_breakdown().values())
+
+    def variant_vectors(self, per_question=False):
+        """Снимок для офлайн-расчетов: (std_question_ids, titles, матрица float32) по строкам индекса.
+
+        per_question=True - одна строка на стандартный вопрос: нормированный центроид его строк.
+        """
+        data = self._data
+        if not per_question or not data.size:
+            return data.std_question_ids, data.titles, data.float_matrix()
+        order = np.argsort(data.std_question_ids, kind='stable')
+        ids, starts = np.unique(data.std_question_ids[order], return_index=True)
+        centroids = normalize_rows(np.add.reduceat(data.float_matrix()[order], starts, axis=0))
+        return ids, data.titles[order][starts], centroids
+
+    def search(self, embedding, text=None, top_k=1, mode=None, group_id=None, intent=None):
+        """Возвращает top_k лучших вариантов для эмбеддинга запроса.
+
+        text нужен для режимов prefilter и fused; без него поиск только плотный.
+        group_id и intent ограничивают поиск блоком строк одного раздела.
+        """
+        data = self._data
+        if not data.size:
+            return []
+
+        mode = mode or self.mode
+        query = normalize_rows(embedding)
+        scope = data.scope(group_id, intent)
+        lexical_scores = None
+        if mode != SEARCH_MODE_DENSE and text:
+            lexical_scores = data.lexical_scores(text)
+
+        selection = scope
+        if mode == SEARCH_MODE_PREFILTER and lexical_scores is not None:
+            scope_rows = _rows(scope)
+            local = data.lexical.top_candidates(lexical_scores[scope_rows], self.lexical_candidates)
+            # Нет общих токенов с базой знаний - остается полный перебор раздела
+            if len(local):
+                selection = scope_rows[local]
+        elif data.ivf is not None:
+            selection = data.ivf_candidates(query, self.ivf_probe, scope)
+        if data.projection is not None and lexical_scores is None:
+            selection = data.projected_candidates(query, selection, max(self.pca_candidates, top_k))
+
+        rows = _rows(selection)
+        if not len(rows):
+            return []
+
+        dense = data.dot(selection, query)
+        if mode == SEARCH_MODE_FUSED and lexical_scores is not None:
+            scoped_lexical = lexical_scores[rows]
+            max_lexical = float(scoped_lexical.max())
+            lexical_norm = scoped_lexical / max_lexical if max_lexical > 0 else scoped_lexical
+            fused = (1 - self.fusion_weight) * dense + self.fusion_weight * lexical_norm
+            return self._top(data, rows, fused, dense, top_k, lexical_scores)
+        return self._top(data, rows, dense, dense, top_k, lexical_scores)
+
+    def search_batch(self, embeddings, texts=None, top_k=1, mode=None):
+        """Поиск для пачки запросов.
+
+        Плотный полный перебор считается одним умножением матриц на всю пачку
+        (с проекцией PCA - умножением проекций и пересчетом кандидатов каждого
+        запроса); остальные режимы выполняются по одному запросу.
+        """
+        mode = mode or self.mode
+        data = self._data
+        if mode != SEARCH_MODE_DENSE or data.ivf is not None or not data.size:
+            texts = texts if texts is not None else [None] * len(embeddings)
+            return [
+                self.search(embedding, text=text, top_k=top_k, mode=mode)
+                for embedding, text in zip(embeddings, texts)
+            ]
+
+        queries = normalize_rows(embeddings)
+        n_candidates = max(self.pca_candidates, top_k)
+        if data.projection is not None and data.size > n_candidates:
+            reduced = data.projected @ data.projection.project(queries).T  # (строки индекса, запросы)
+            results = []
+            for i, query in enumerate(queries):
+                rows = np.sort(np.argpartition(reduced[:, i], -n_candidates)[-n_candidates:])
+                dense = data.dot(rows, query)
+                results.append(self._top(data, rows, dense, dense, top_k, None))
+            return results
+
+        scores = data.dot((0, data.size), queries.T)  # (строки индекса, запросы)
+        rows = np.arange(data.size)
+        return [
+            self._top(data, rows, scores[:, i], scores[:, i], top_k, None)
+            for i in range(scores.shape[1])
+        ]
+
+    def _top(self, data, rows, ranking, dense, top_k, lexical_scores):
+        """Выбирает top_k строк по ranking; similarity всегда косинусная"""
+        top_k = min(top_k, len(rows))
+        if top_k < len(rows):
+            best = np.argpartition(ranking, -top_k)[-top_k:]
+        else:
+            best = np.arange(len(rows))
+        best = best[np.argsort(-ranking[best])]
+
+        results = []
+        for i in best:
+            row = int(rows[i])
+            results.append({
+                'variant_id': int(data.variant_ids[row]),
+                'std_question_id': int(data.std_question_ids[row]),
+                'answer_id': int(data.answer_ids[row]),
+                'intent': data.intents[row],
+                'group_id': int(data.group_ids[row]),
+                'similarity': float(dense[i]),
+                'score': float(ranking[i]),
+                'lexical_score': float(lexical_scores[row]) if lexical_scores is not None else 0.0,
+                'variant_text': data.variant_texts[row],
+                'title': data.titles[row]
+            })
+        return results
+
+    def find_closest(self, embedding, text=None, mode=None, group_id=None, intent=None):
+        """Аналог Database.find_closest_question для индекса в памяти"""
+        results = self.search(embedding, text=text, top_k=1, mode=mode,
+                              group_id=group_id, intent=intent)
+        return results[0] if results else None
+
+
+def index_from_settings(settings, mode=None, quantization=None, ann=None, compression=None, pca_path=None):
+    """Пустой SearchIndex с настройками из модуля config (settings); аргументы переопределяют их.
+    Без pca_path проекция PCA рассчитывается при каждом построении и не сохраняется"""
+    return SearchIndex(
+        mode=mode or settings.SEARCH_MODE,
+        lexical_analyzer=settings.LEXICAL_ANALYZER,
+        ngram_size=settings.LEXICAL_NGRAM_SIZE,
+        lexical_candidates=settings.LEXICAL_CANDIDATES,
+        fusion_weight=settings.FUSION_WEIGHT,
+        quantization=quantization or settings.INDEX_QUANTIZATION,
+        ann=ann or settings.INDEX_ANN,
+        ivf_lists=settings.IVF_LISTS,
+        ivf_probe=settings.IVF_PROBE,
+        compression=compression or settings.INDEX_COMPRESSION,
+        compression_max_error=settings.COMPRESSION_MAX_ERROR,
+        compression_max_medoids=settings.COMPRESSION_MAX_MEDOIDS,
+        pca_dim=settings.INDEX_PCA_DIM,
+        pca_candidates=settings.PCA_CANDIDATES,
+        pca_path=pca_path,
+        pca_refit_change=settings.PCA_REFIT_CHANGE,
+        pca_refit_energy_drop=settings.PCA_REFIT_ENERGY_DROP
+    )
@@ -0,0 +1,205 @@
+# Файл shadow.py
+import os
+import json
+import queue
+import random
+import threading
+import time
+import logging
+from collections import Counter, deque
+from datetime import datetime
+
+from stats_rollup import latency_bin, quantiles
+
+logger = logging.getLogger(__name__)
+
+
+class ShadowEvaluator:
+    """Теневая проверка кандидата (модели, индекса, порога) на живых вопросах.
+
+    Доля sample_rate запросов фонда tenant_name после ответа пользователю
+    ставится в ограниченную очередь; один фоновый поток с пониженным
+    приоритетом прогоняет их через кандидата и сравнивает с основным решением.
+    Модели кандидат вызывает прямо в этом потоке, а не через пулы ответов.
+    Если очередь заполнена, образец отбрасывается - основной путь не ждет.
+
+    build_index(tenant_name, embedder) строит индекс кандидата; embedder - модель
+    кандидата или None, если кандидат использует эмбеддинги основной модели.
+    decide(index, question, embedding, context, encode) принимает решение
+    кандидата тем же путем, что и основной (раздел, каскад, исправление опечаток);
+    context - параметры запроса из submit, encode - модель кандидата или None.
+    Без decide кандидат - ближайший вопрос индекса с порогом threshold.
+    """
+
+    def __init__(self, tenant_name, build_index, threshold, decide=None, embedder=None, sample_rate=0.05,
+                 queue_size=100, log_path=None, recent_size=200):
+        self.tenant_name = tenant_name
+        self.build_index = build_index
+        self.threshold = threshold
+        self.decide = decide
+        self.embedder = embedder
+        self.sample_rate = sample_rate
+        self.log_path = log_path
+        if log_path and os.path.dirname(log_path):
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        self.index = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._building = False
+        self._dirty = False
+        self._recent = deque(maxlen=recent_size)
+        self._latency = {'primary': Counter(), 'candidate': Counter()}
+        self.stats = {
+            'sampled': 0,
+            'dropped': 0,            # очередь заполнена или индекс кандидата еще строится
+            'evaluated': 0,
+            'agree': 0,
+            'answer_changed': 0,     # оба ответили, но разными вопросами
+            'primary_only': 0,       # ответил только основной
+            'candidate_only': 0,     # ответил только кандидат
+            'errors': 0,
+            'confidence_delta_sum': 0.0,
+            'confidence_delta_count': 0,
+        }
+        threading.Thread(target=self._run, name='shadow', daemon=True).start()
+        self.schedule_build()
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def schedule_build(self):
+        """Перестраивает индекс кандидата в фоне (после изменений базы знаний)"""
+        with self._lock:
+            if self._building:
+                self._dirty = True
+                return
+            self._building = True
+        threading.Thread(target=self._build_loop, name='shadow-build', daemon=True).start()
+
+    def _build_loop(self):
+        while True:
+            try:
+                started = time.perf_counter()
+                self.index = self.build_index(self.tenant_name, self.embedder)
+                logger.info(f"Индекс кандидата построен за {time.perf_counter() - started:.1f} с")
+            except Exception as e:
+                logger.error(f"❌ Ошибка построения индекса кандидата: {e}")
+            with self._lock:
+                if not self._dirty:
+                    self._building = False
+                    return
+                self._dirty = False
+
+    def submit(self, question, embedding, primary, primary_answered, primary_ms, context=None):
+        """Ставит запрос в теневую очередь с вероятностью sample_rate, не блокируя вызывающего.
+
+        question и embedding - исходный вопрос до исправления опечаток, context -
+        параметры запроса (раздел, интент, словарь исправления) для decide.
+        """
+        if random.random() >= self.sample_rate:
+            return False
+        self._count('sampled')
+        if self.index is None:
+            self._count('dropped')
+            return False
+        sample = {
+            'question': question,
+            'embedding': embedding,
+            'primary_id': primary['std_question_id'] if primary else None,
+            'primary_similarity': primary['similarity'] if primary else None,
+            'primary_answered': bool(primary_answered),
+            'primary_ms': primary_ms,
+            'context': context or {},
+        }
+        try:
+            self._queue.put_nowait(sample)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        return True
+
+    def _lower_priority(self):
+        # Число потоков torch не меняется: настройка общая для процесса и задела бы пул ответов
+        try:
+            # В Linux приоритет задается отдельно каждому потоку
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+
+    def _run(self):
+        self._lower_priority()
+        while True:
+            sample = self._queue.get()
+            try:
+                self._evaluate(sample)
+            except Exception as e:
+                self._count('errors')
+                logger.error(f"❌ Ошибка теневой проверки: {e}")
+
+    def _evaluate(self, sample):
+        started = time.perf_counter()
+        embedding, encode = sample['embedding'], None
+        if self.embedder is not None:
+            encode = lambda text: self.embedder.get_embeddings([text])[0]
+            embedding = encode(sample['question'])
+        if self.decide is not None:
+            result, candidate_answered = self.decide(self.index, sample['question'], embedding,
+                                                     sample['context'], encode)
+        else:
+            result = self.index.find_closest(embedding, text=sample['question'])
+            candidate_answered = bool(result) and result['similarity'] >= self.threshold
+        candidate_ms = (time.perf_counter() - started) * 1000
+        candidate_id = result['std_question_id'] if result else None
+        candidate_similarity = result['similarity'] if result else None
+
+        if sample['primary_answered'] and candidate_answered:
+            outcome = 'agree' if candidate_id == sample['primary_id'] else 'answer_changed'
+        elif sample['primary_answered']:
+            outcome = 'primary_only'
+        elif candidate_answered:
+            outcome = 'candidate_only'
+        else:
+            outcome = 'agree'
+
+        with self._lock:
+            self.stats['evaluated'] += 1
+            self.stats[outcome] += 1
+            if candidate_similarity is not None and sample['primary_similarity'] is not None:
+                self.stats['confidence_delta_sum'] += candidate_similarity - sample['primary_similarity']
+                self.stats['confidence_delta_count'] += 1
+            self._latency['primary'][latency_bin(sample['primary_ms'])] += 1
+            self._latency['candidate'][latency_bin(candidate_ms)] += 1
+
+        if outcome != 'agree':
+            entry = {
+                'time': datetime.now().isoformat(timespec='seconds'),
+                'outcome': outcome,
+                'question': sample['question'],
+                'primary': {'std_question_id': sample['primary_id'], 'similarity': sample['primary_similarity']},
+                'candidate': {'std_question_id': candidate_id, 'similarity': candidate_similarity},
+            }
+            self._recent.append(entry)
+            if self.log_path:
+                with open(self.log_path, 'a', encoding='utf-8') as file:
+                    file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            latency = {name: quantiles(bins, (0.5, 0.95)) for name, bins in self._latency.items()}
+        evaluated = stats['evaluated']
+        stats['agreement_rate'] = round(stats['agree'] / evaluated, 4) if evaluated else None
+        delta_sum, delta_count = stats.pop('confidence_delta_sum'), stats.pop('confidence_delta_count')
+        stats['avg_confidence_delta'] = round(delta_sum / delta_count, 4) if delta_count else None
+        stats['latency_ms'] = {
+            name: {'p50': values[0.5], 'p95': values[0.95]} for name, values in latency.items()
+        }
+        stats['queue'] = self._queue.qsize()
+        stats['index_ready'] = self.index is not None
+        stats['tenant'] = self.tenant_name
+        return stats
+
+    def recent(self, limit=50):
+        """Последние расхождения кандидата с основным решением"""
+        return list(self._recent)[-limit:][::-1]
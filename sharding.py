@@ -0,0 +1,498 @@
+# Файл sharding.py
+import os
+import sys
+import subprocess
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from multiprocessing.connection import Client, Listener, AuthenticationError
+
+import numpy as np
+
+from circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+HASH_MULTIPLIER = np.uint64(2654435761)  # мультипликативный хеш Кнута
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts', 'shard_worker.py')
+
+
+def shard_of(std_question_ids, n_shards):
+    """Номер шарда стандартного вопроса (числа или массива): все варианты вопроса - в одном шарде"""
+    scalar = np.ndim(std_question_ids) == 0
+    ids = np.atleast_1d(np.asarray(std_question_ids, dtype=np.uint64))
+    shards = ((ids * HASH_MULTIPLIER) % np.uint64(2 ** 32) % np.uint64(n_shards)).astype(np.int64)
+    return int(shards[0]) if scalar else shards
+
+
+def parse_address(value):
+    """'host:port' -> (host, port)"""
+    host, _, port = value.strip().rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f"Ожидался адрес 'host:port', получено '{value}'")
+    return host, int(port)
+
+
+def merge_results(result_lists, top_k):
+    """Общий top_k из результатов шардов (каждый список уже отсортирован по score)"""
+    merged = [result for results in result_lists for result in results]
+    merged.sort(key=lambda result: result['score'], reverse=True)
+    return merged[:top_k]
+
+
+class ShardError(Exception):
+    """Шард не ответил вовремя, недоступен или вернул ошибку"""
+
+
+class ShardsUnavailable(Exception):
+    """Ответило меньше шардов, чем нужно для результата"""
+
+    def __init__(self, answered, total, retry_after=1):
+        super().__init__(f"Ответили {answered} из {total} шардов")
+        self.retry_after = retry_after
+
+
+class ShardClient:
+    """Соединения с одним шардом: переиспользуемые соединения и предохранитель.
+
+    Соединение, на котором истек таймаут, закрывается: ответ на него может
+    прийти позже и перепутаться со следующим запросом.
+    """
+
+    def __init__(self, number, address, authkey, failure_threshold=3, retry_seconds=5):
+        self.number = number
+        self.address = address
+        self.authkey = authkey
+        self.breaker = CircuitBreaker(failure_threshold, retry_seconds,
+                                      name=f"шард {number} ({address[0]}:{address[1]})")
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def call(self, command, payload, timeout):
+        if not self.breaker.allow():
+            raise ShardError(f"Шард {self.number} недоступен")
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        try:
+            if conn is not None:
+                try:
+                    conn.send((command, payload))
+                except OSError:
+                    # Шард перезапускался - сохраненное соединение больше не действует
+                    conn.close()
+                    conn = None
+            if conn is None:
+                conn = Client(self.address, authkey=self.authkey)
+                conn.send((command, payload))
+            if not conn.poll(timeout):
+                raise TimeoutError(f"Шард {self.number} не ответил за {timeout * 1000:.0f} мс")
+            status, value = conn.recv()
+        except (OSError, EOFError, AuthenticationError) as e:
+            self.breaker.record_failure()
+            if conn is not None:
+                conn.close()
+            raise ShardError(str(e) or type(e).__name__) from e
+
+        self.breaker.record_success()
+        with self._lock:
+            self._idle.append(conn)
+        if status != 'ok':
+            raise ShardError(f"Шард {self.number}: {value}")
+        return value
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class ShardPool:
+    """Шарды индекса поиска: рассылка команды всем шардам и сбор ответов.
+
+    Шард - процесс scripts/shard_worker.py на этой или другой машине; протокол -
+    multiprocessing.connection с проверкой authkey. Ответы, не пришедшие за
+    timeout, отбрасываются: результат собирается из ответивших шардов, если их
+    не меньше min_responses, иначе ShardsUnavailable.
+    """
+
+    def __init__(self, addresses, authkey, timeout_ms=300, min_responses=1, load_timeout=600, retry_seconds=5):
+        self.clients = [
+            ShardClient(number, address, authkey, retry_seconds=retry_seconds)
+            for number, address in enumerate(addresses)
+        ]
+        self.timeout = timeout_ms / 1000.0
+        self.min_responses = min(min_responses, len(addresses)) or len(addresses)
+        self.load_timeout = load_timeout
+        self.retry_seconds = retry_seconds
+        self.processes = []  # локальные процессы шардов, запущенные start_local
+        self._executor = ThreadPoolExecutor(max_workers=len(addresses) * 8, thread_name_prefix='shard')
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'partial': 0, 'failed': 0, 'shard_errors': 0}
+
+    @property
+    def size(self):
+        return len(self.clients)
+
+    @classmethod
+    def start_local(cls, n_shards, authkey, host='127.0.0.1', base_port=5600, **kwargs):
+        """Запускает n_shards процессов шардов на этой машине (порты base_port + номер)"""
+        addresses = [(host, base_port + number) for number in range(n_shards)]
+        pool = cls(addresses, authkey, **kwargs)
+        for number, (_, port) in enumerate(addresses):
+            pool.processes.append(subprocess.Popen([
+                sys.executable, WORKER_SCRIPT, '--shard', str(number), '--shards', str(n_shards),
+                '--host', host, '--port', str(port), '--parent-pid', str(os.getpid())
+            ], env=dict(os.environ, SHARD_AUTHKEY=authkey.decode())))
+        logger.info(f"Запущено {n_shards} локальных процессов шардов, порты {base_port}-{base_port + n_shards - 1}")
+        return pool
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def scatter(self, command, payload, timeout=None, shards=None):
+        """Отправляет команду шардам (по умолчанию всем) и ждет ответов не дольше timeout.
+
+        Возвращает {номер шарда: ответ}; не ответившие шарды пропускаются.
+        """
+        timeout = timeout or self.timeout
+        clients = self.clients if shards is None else [self.clients[number] for number in shards]
+        futures = {self._executor.submit(client.call, command, payload, timeout): client for client in clients}
+        # Запас на передачу: таймаут самого соединения закроет зависший вызов
+        done, _ = wait(futures, timeout=timeout + 0.05)
+        answers = {}
+        for future, client in futures.items():
+            if future not in done:
+                error = f"нет ответа за {timeout * 1000:.0f} мс"
+            elif future.exception() is not None:
+                error = future.exception()
+            else:
+                answers[client.number] = future.result()
+                continue
+            self._count('shard_errors')
+            logger.warning(f"⚠️ Шард {client.number}, команда {command}: {error}")
+        return answers
+
+    def gather(self, command, payload, timeout=None):
+        """scatter по всем шардам; ShardsUnavailable, если ответило меньше min_responses"""
+        answers = self.scatter(command, payload, timeout)
+        self._count('requests')
+        if len(answers) < self.min_responses:
+            self._count('failed')
+            raise ShardsUnavailable(len(answers), self.size)
+        if len(answers) < self.size:
+            self._count('partial')
+        return answers
+
+    def wait_ready(self, timeout=120):
+        """Ждет, пока все шарды начнут отвечать; проверяет, что у них то же число шардов"""
+        deadline = time.monotonic() + timeout
+        pending = set(range(self.size))
+        while pending and time.monotonic() < deadline:
+            for number in list(pending):
+                try:
+                    info = Client(self.clients[number].address, authkey=self.clients[number].authkey)
+                except (OSError, AuthenticationError):
+                    continue
+                info.send(('ping', {}))
+                status, value = info.recv()
+                info.close()
+                if status == 'ok' and value != {'shard': number, 'shards': self.size}:
+                    raise ValueError(f"Шард {number} запущен как {value}, ожидался {number} из {self.size}")
+                pending.discard(number)
+            if pending:
+                time.sleep(0.2)
+        if pending:
+            logger.error(f"❌ Шарды {sorted(pending)} не ответили за {timeout} с")
+            return False
+        return True
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['shards'] = {client.number: client.breaker.metrics() for client in self.clients}
+        return stats
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+        for process in self.processes:
+            process.terminate()
+        self._executor.shutdown(wait=False)
+
+
+class ShardedIndex:
+    """Индекс вариантов фонда, разделенный по шардам (shard_of по std_question_id).
+
+    Интерфейс поиска тот же, что у SearchIndex: запрос рассылается всем шардам,
+    каждый возвращает свой top_k, общий top_k собирается по score. Косинусная
+    близость от шардов сравнима напрямую; BM25 в режимах prefilter и fused
+    считается по статистике своего шарда. Матрицы живут в процессах шардов;
+    memory_bytes() - их память по последним ответам шардов на load и add, она
+    входит в бюджет памяти фондов. unload() освобождает индекс фонда в шардах
+    (при вытеснении фонда из TenantRegistry).
+    """
+
+    def __init__(self, tenant, pool):
+        self.tenant = tenant
+        self.pool = pool
+        self.compression_stats = None
+        self._sizes = {}
+        self._memory = {}
+        self._unloaded = False
+        # Шарды, пропустившие добавление вариантов: перезагружаются из базы в фоне
+        self._stale = set()
+        self._reloading = set()
+        self._reload_lock = threading.Lock()
+        self._reload_thread = None
+
+    @property
+    def size(self):
+        return sum(self._sizes.values())
+
+    def load(self, rows=None):
+        """Каждый шард сам загружает из базы варианты своих вопросов; rows не используются"""
+        answers = self.pool.gather('load', {'tenant': self.tenant}, timeout=self.pool.load_timeout)
+        for number, answer in answers.items():
+            self._loaded(number, answer)
+        logger.info(f"Индекс фонда '{self.tenant}' загружен шардами: {self.size} вариантов в {len(answers)} шардах")
+        return self.size
+
+    def search(self, embedding, text=None, top_k=1, mode=None, group_id=None, intent=None):
+        answers = self.pool.gather('search', {
+            'tenant': self.tenant, 'embeddings': np.asarray(embedding, dtype=np.float32).reshape(1, -1),
+            'texts': [text], 'top_k': top_k, 'mode': mode, 'group_id': group_id, 'intent': intent
+        })
+        return merge_results([results[0] for results in answers.values()], top_k)
+
+    def search_batch(self, embeddings, texts=None, top_k=1, mode=None):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        answers = self.pool.gather('search', {
+            'tenant': self.tenant, 'embeddings': embeddings, 'texts': texts, 'top_k': top_k, 'mode': mode
+        })
+        return [
+            merge_results([results[i] for results in answers.values()], top_k)
+            for i in range(len(embeddings))
+        ]
+
+    def find_closest(self, embedding, text=None, mode=None, group_id=None, intent=None):
+        results = self.search(embedding, text=text, top_k=1, mode=mode, group_id=group_id, intent=intent)
+        return results[0] if results else None
+
+    def add(self, rows, embeddings):
+        """Отправляет новые варианты шардам их вопросов.
+
+        Варианты к этому моменту уже записаны в базу, поэтому шард, который их не
+        принял, перезагружается из нее в фоне (как и шард, чья перезагрузка еще не
+        закончилась). После рассылки остальным шардам бросается ShardError.
+        """
+        if not rows:
+            return 0
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        shards = shard_of([row['std_question_id'] for row in rows], self.pool.size)
+        added = 0
+        failed = []
+        for number in np.unique(shards).tolist():
+            with self._reload_lock:
+                reloading = number in self._stale or number in self._reloading
+            if reloading:
+                # Строки могли не попасть в уже прочитанный снимок базы - нужен еще проход
+                self._schedule_reload([number])
+                continue
+            part = np.flatnonzero(shards == number)
+            try:
+                answer = self.pool.clients[number].call('add', {
+                    'tenant': self.tenant, 'rows': [rows[i] for i in part], 'embeddings': embeddings[part]
+                }, self.pool.load_timeout)
+                self._loaded(number, answer)
+            except ShardError as e:
+                logger.warning(f"⚠️ Шард {number} не принял варианты фонда '{self.tenant}': {e}")
+                failed.append(number)
+                continue
+            added += len(part)
+        if failed:
+            self._schedule_reload(failed)
+            raise ShardError(f"Шарды {failed} не приняли варианты; они будут перезагружены из базы")
+        return added
+
+    def _loaded(self, number, answer):
+        """Размер и память части фонда по ответу шарда на load или add"""
+        self._sizes[number] = answer['size']
+        self._memory[number] = answer['memory']
+
+    def unload(self):
+        """Освобождает индекс фонда в шардах; фоновые перезагрузки фонда прекращаются"""
+        self._unloaded = True
+        self.pool.scatter('unload', {'tenant': self.tenant})
+        self._memory.clear()
+
+    @property
+    def stale_shards(self):
+        """Шарды, ожидающие или выполняющие перезагрузку фонда из базы"""
+        with self._reload_lock:
+            return sorted(self._stale | self._reloading)
+
+    def _schedule_reload(self, numbers):
+        with self._reload_lock:
+            self._stale.update(numbers)
+            if self._reload_thread is not None:
+                return
+            self._reload_thread = threading.Thread(target=self._reload_loop, name=f'shard-reload-{self.tenant}',
+                                                   daemon=True)
+            self._reload_thread.start()
+
+    def _reload_loop(self):
+        """Перезагружает отстающие шарды, пока все не загрузятся; неудача - повтор через retry_seconds"""
+        while True:
+            with self._reload_lock:
+                self._reloading, self._stale = self._stale, set()
+                if self._unloaded:
+                    # Фонд вытеснен: шарды загрузят его заново вместе с сервером
+                    self._reloading = set()
+                if not self._reloading:
+                    self._reload_thread = None
+                    return
+                numbers = sorted(self._reloading)
+            retry = False
+            for number in numbers:
+                try:
+                    self._loaded(number, self.pool.clients[number].call(
+                        'load', {'tenant': self.tenant}, self.pool.load_timeout
+                    ))
+                    logger.info(f"Шард {number}: фонд '{self.tenant}' перезагружен из базы")
+                except ShardError as e:
+                    logger.warning(f"⚠️ Шард {number}: перезагрузка фонда '{self.tenant}' не удалась: {e}")
+                    with self._reload_lock:
+                        self._stale.add(number)
+                    retry = True
+            with self._reload_lock:
+                self._reloading = set()
+            if retry:
+                time.sleep(self.pool.retry_seconds)
+
+    def variant_vectors(self, per_question=False):
+        """Строки всех шардов для офлайн-расчетов (см. SearchIndex.variant_vectors)"""
+        answers = self.pool.gather('vectors', {'tenant': self.tenant, 'per_question': per_question},
+                                   timeout=self.pool.load_timeout)
+        parts = [answers[number] for number in sorted(answers)]
+        if not parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=object), np.zeros((0, 0), dtype=np.float32)
+        return (np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts]),
+                np.vstack([part[2] for part in parts]))
+
+    def memory_breakdown(self):
+        """Память индексов фонда в процессах шардов, суммарно по частям"""
+        parts = {}
+        for breakdown in self.pool.scatter('memory', {'tenant': self.tenant}).values():
+            for part, value in breakdown.items():
+                parts[part] = parts.get(part, 0) + value
+        return parts
+
+    def memory_bytes(self):
+        # Память процессов шардов без обращения к ним: вызывается под блокировкой TenantRegistry
+        return sum(self._memory.values())
+
+
+class ShardServer:
+    """Процесс шарда: индексы своей части вариантов каждого фонда и ответы на команды.
+
+    open_db(tenant) возвращает хранилище фонда, create_index(tenant) - пустой
+    SearchIndex. Индекс фонда загружается командой load или первым обращением
+    и освобождается командой unload, когда сервер вытесняет фонд из памяти.
+    """
+
+    def __init__(self, number, n_shards, open_db, create_index):
+        self.number = number
+        self.n_shards = n_shards
+        self.open_db = open_db
+        self.create_index = create_index
+        self.indexes = {}
+        self._lock = threading.Lock()
+
+    def load(self, tenant):
+        rows = self.open_db(tenant).get_all_variants()
+        if rows is None:
+            raise ConnectionError(f"Не удалось прочитать варианты фонда '{tenant}'")
+        own = shard_of([row['std_question_id'] for row in rows], self.n_shards) == self.number
+        index = self.create_index(tenant)
+        index.load([row for row, mine in zip(rows, own) if mine])
+        with self._lock:
+            self.indexes[tenant] = index
+        logger.info(f"Шард {self.number}: фонд '{tenant}' - {index.size} из {len(rows)} вариантов")
+        return self.status(index)
+
+    @staticmethod
+    def status(index):
+        return {'size': index.size, 'memory': index.memory_bytes()}
+
+    def unload(self, tenant):
+        with self._lock:
+            index = self.indexes.pop(tenant, None)
+        if index is not None:
+            logger.info(f"Шард {self.number}: фонд '{tenant}' выгружен из памяти")
+        return index is not None
+
+    def index(self, tenant):
+        with self._lock:
+            index = self.indexes.get(tenant)
+        if index is None:
+            self.load(tenant)
+            index = self.indexes[tenant]
+        return index
+
+    def handle(self, command, payload):
+        if command == 'ping':
+            return {'shard': self.number, 'shards': self.n_shards}
+        if command == 'load':
+            return self.load(payload['tenant'])
+        if command == 'unload':
+            return self.unload(payload['tenant'])
+        index = self.index(payload['tenant'])
+        if command == 'search':
+            embeddings, texts = payload['embeddings'], payload.get('texts')
+            if payload.get('group_id') is None and payload.get('intent') is None:
+                return index.search_batch(embeddings, texts=texts, top_k=payload['top_k'], mode=payload.get('mode'))
+            return [
+                index.search(embedding, text=text, top_k=payload['top_k'], mode=payload.get('mode'),
+                             group_id=payload.get('group_id'), intent=payload.get('intent'))
+                for embedding, text in zip(embeddings, texts or [None] * len(embeddings))
+            ]
+        if command == 'add':
+            index.add(payload['rows'], payload['embeddings'])
+            return self.status(index)
+        if command == 'vectors':
+            return index.variant_vectors(per_question=payload.get('per_question', False))
+        if command == 'memory':
+            return index.memory_breakdown()
+        raise ValueError(f"Неизвестная команда: {command}")
+
+    def serve(self, address, authkey):
+        """Принимает соединения; каждое обслуживается своим потоком до закрытия клиентом"""
+        listener = Listener(address, authkey=authkey)
+        logger.info(f"🚀 Шард {self.number} из {self.n_shards} слушает {address[0]}:{address[1]}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                logger.warning(f"⚠️ Отклонено соединение: {e}")
+                continue
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    command, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    response = ('ok', self.handle(command, payload))
+                except Exception as e:
+                    logger.exception(f"Ошибка команды {command}")
+                    response = ('error', str(e))
+                try:
+                    conn.send(response)
+                except OSError:
+                    return
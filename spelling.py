@@ -0,0 +1,222 @@
+# Файл spelling.py
+import re
+import threading
+import time
+import logging
+from lexical_index import WORD_RE, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Раскладки ЙЦУКЕН и QWERTY: одна и та же клавиша в нижнем регистре
+LATIN_KEYS = "qwertyuiop[]asdfghjkl;'zxcvbnm,.`"
+CYRILLIC_KEYS = "йцукенгшщзхъфывапролджэячсмитьбюё"
+TO_CYRILLIC = str.maketrans(LATIN_KEYS, CYRILLIC_KEYS)
+TO_LATIN = str.maketrans(CYRILLIC_KEYS, LATIN_KEYS)
+
+LATIN_RE = re.compile(r'[a-z]')
+CYRILLIC_RE = re.compile(r'[а-яё]')
+TRAILING_PUNCTUATION_RE = re.compile(r'^(.*?)([.,?!]+)$')
+
+
+def damerau_distance(a, b, limit):
+    """Расстояние Дамерау-Левенштейна (с перестановкой соседних букв).
+
+    Расчет прекращается, как только расстояние заведомо больше limit; в этом
+    случае возвращается limit + 1.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before_previous[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return limit + 1
+        before_previous, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def vocabulary_texts(rows):
+    """Тексты для словаря опечаток: варианты и (по разу) заголовки их вопросов"""
+    titles = {row['title'] for row in rows}
+    return [row['variant_text'] for row in rows] + list(titles)
+
+
+def _deletes(word, max_distance):
+    """Все строки, получаемые из word удалением не более max_distance букв"""
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {item[:i] + item[i + 1:] for item in frontier if len(item) > 1 for i in range(len(item))}
+        result |= frontier
+    return result
+
+
+class SpellCorrector:
+    """Исправление раскладки клавиатуры и опечаток по словарю базы знаний.
+
+    Словарь - слова текстов вариантов и заголовков вопросов с частотами.
+    Опечатки ищутся симметричным удалением (SymSpell): для каждого слова словаря
+    заранее сохранены строки, получаемые удалением до max_distance букв из его
+    первых prefix_length букв, поэтому поиск исправления - несколько десятков
+    обращений к словарю вместо перебора всех слов. Слово, набранное в другой
+    раскладке ("ghbdtn"), заменяется, если после перевода раскладки оно есть в
+    словаре или исправляется в него.
+    """
+
+    def __init__(self, max_distance=2, prefix_length=7, min_word_length=4):
+        self.max_distance = max_distance
+        self.prefix_length = max(prefix_length, max_distance + 1)
+        self.min_word_length = min_word_length
+        self._vocabulary = ({}, {})  # (слово -> частота, удаление -> [слова])
+        self._lock = threading.Lock()
+        self.stats = {'attempts': 0, 'corrected': 0, 'answered': 0}
+
+    @property
+    def size(self):
+        return len(self._vocabulary[0])
+
+    def build(self, texts):
+        """Строит словарь заново; новый словарь подменяет старый целиком"""
+        started = time.perf_counter()
+        words, deletes = {}, {}
+        self._add_texts(words, deletes, texts)
+        with self._lock:
+            self._vocabulary = (words, deletes)
+        logger.info(
+            f"Словарь исправления опечаток построен: {len(words)} слов, {len(deletes)} удалений, "
+            f"{time.perf_counter() - started:.2f} с"
+        )
+        return len(words)
+
+    def add(self, texts):
+        """Дописывает слова новых текстов в текущий словарь.
+
+        Словари только дополняются под блокировкой, поэтому чтение в это время
+        (отдельные get и проход по списку слов) остается корректным.
+        """
+        with self._lock:
+            words, deletes = self._vocabulary
+            self._add_texts(words, deletes, texts)
+
+    def _add_texts(self, words, deletes, texts):
+        for text in texts:
+            for word in tokenize(text or '', analyzer='word'):
+                if not word.isalpha():
+                    continue
+                if word not in words:
+                    words[word] = 0
+                    if len(word) >= self.min_word_length - 1:
+                        for key in _deletes(word[:self.prefix_length], self.max_distance):
+                            deletes.setdefault(key, []).append(word)
+                words[word] += 1
+
+    def memory_bytes(self):
+        words, deletes = self._vocabulary
+        return (sum(len(word) * 2 + 100 for word in words)
+                + sum(len(key) * 2 + 100 + 8 * len(items) for key, items in deletes.items()))
+
+    def known(self, word):
+        return word.replace('ё', 'е') in self._vocabulary[0]
+
+    def lookup(self, word):
+        """Ближайшее слово словаря (при равном расстоянии - самое частое) или None"""
+        words, deletes = self._vocabulary
+        word = word.replace('ё', 'е')
+        if word in words:
+            return word
+        if len(word) < self.min_word_length:
+            return None
+        # В коротких словах две правки меняют слово целиком
+        max_distance = 1 if len(word) <= 5 else self.max_distance
+        prefix = word[:self.prefix_length]
+        best, best_distance, best_count = None, max_distance, 0
+        candidates, seen, checked = [prefix], {prefix}, set()
+        for candidate in candidates:
+            removed = len(prefix) - len(candidate)
+            if removed > best_distance:
+                break
+            for suggestion in deletes.get(candidate, ()):
+                # Слово встречается под многими удалениями - расстояние считается один раз
+                if suggestion in checked:
+                    continue
+                checked.add(suggestion)
+                distance = damerau_distance(word, suggestion, best_distance)
+                if distance > best_distance:
+                    continue
+                if best is None or distance < best_distance or words[suggestion] > best_count:
+                    best, best_distance, best_count = suggestion, distance, words[suggestion]
+            if removed < max_distance and len(candidate) > 1:
+                for i in range(len(candidate)):
+                    shorter = candidate[:i] + candidate[i + 1:]
+                    if shorter not in seen:
+                        seen.add(shorter)
+                        candidates.append(shorter)
+        return best
+
+    def _fix_words(self, text, require_all, typos=True):
+        """Заменяет неизвестные слова исправлениями; None, если require_all и
+        какое-то слово не исправить. typos=False - только известные слова и раскладка"""
+        failed = []
+
+        def replace(match):
+            word = match.group(0)
+            if not word.isalpha() or self.known(word):
+                return word
+            corrected = self.lookup(word) if typos else None
+            if corrected is None:
+                # Латинское слово в кириллическом тексте может быть набрано в другой раскладке
+                switched = word.translate(TO_CYRILLIC) if LATIN_RE.search(word) else word.translate(TO_LATIN)
+                corrected = switched if self.known(switched) else None
+            if corrected is None:
+                failed.append(word)
+                return word
+            return corrected
+
+        fixed = WORD_RE.sub(replace, text)
+        return None if failed and require_all else fixed
+
+    def _correct_chunk(self, chunk):
+        words = WORD_RE.findall(chunk)
+        if all(not word.isalpha() or self.known(word) for word in words):
+            return chunk
+        has_latin, has_cyrillic = LATIN_RE.search(chunk), CYRILLIC_RE.search(chunk)
+        if has_latin and not has_cyrillic:
+            # Весь фрагмент набран в латинской раскладке; знаки препинания в конце
+            # могут быть и буквами (б, ю), и настоящей пунктуацией
+            variants = [(chunk, '')]
+            match = TRAILING_PUNCTUATION_RE.match(chunk)
+            if match and match.group(1):
+                variants.append((match.group(1), match.group(2)))
+            # Сначала ищется вариант из одних известных слов, затем - с исправлением опечаток
+            for typos in (False, True):
+                for core, tail in variants:
+                    fixed = self._fix_words(core.translate(TO_CYRILLIC), require_all=True, typos=typos)
+                    if fixed is not None:
+                        return fixed + tail
+        elif has_cyrillic and not has_latin:
+            # Латинское слово базы (название сервиса), набранное в русской раскладке
+            switched = chunk.translate(TO_LATIN)
+            switched_words = WORD_RE.findall(switched)
+            if switched_words and all(self.known(word) for word in switched_words):
+                return switched
+        return self._fix_words(chunk, require_all=False)
+
+    def correct(self, text, record=True):
+        """Текст с исправленными раскладкой и опечатками (тот же текст, если исправлять нечего).
+        record=False - без счетчиков (теневая проверка)"""
+        if record:
+            self.stats['attempts'] += 1
+        if not self._vocabulary[0]:
+            return text
+        corrected = re.sub(r'\S+', lambda match: self._correct_chunk(match.group(0)), text)
+        if record and corrected != text:
+            self.stats['corrected'] += 1
+        return corrected
@@ -0,0 +1,635 @@
+# Файл sqlite_storage.py
+import os
+import queue
+import sqlite3
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from datetime import datetime
+
+import numpy as np
+
+from profiling import record_stage
+from storage import Storage, STORAGE_SQLITE, ready_prefix
+
+logger = logging.getLogger(__name__)
+
+# Время хранится текстом 'YYYY-MM-DD HH:MM:SS' в местном времени, как TIMESTAMP в MySQL
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+for _decltype in ('TIMESTAMP', 'DATETIME'):
+    sqlite3.register_converter(_decltype, lambda value: datetime.fromisoformat(value.decode()))
+# Числа numpy из индекса поиска
+for _type in (np.int32, np.int64):
+    sqlite3.register_adapter(_type, int)
+for _type in (np.float32, np.float64):
+    sqlite3.register_adapter(_type, float)
+
+NOW = "(datetime('now', 'localtime'))"
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS questions_groups (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        description TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS answers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        answer_text TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS standard_questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        group_id INTEGER NOT NULL REFERENCES questions_groups(id) ON DELETE CASCADE,
+        answer_id INTEGER NOT NULL REFERENCES answers(id) ON DELETE CASCADE,
+        intent TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS question_variants (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        variant_text TEXT NOT NULL,
+        embedding BLOB NOT NULL,
+        standard_question_id INTEGER NOT NULL REFERENCES standard_questions(id) ON DELETE CASCADE
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS user_questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL,
+        client_id TEXT,
+        raw_question TEXT NOT NULL,
+        normalized_text TEXT NOT NULL,
+        embedding BLOB,
+        standard_question_id INTEGER,
+        answer_id INTEGER,
+        is_found BOOLEAN DEFAULT FALSE,
+        confidence REAL,
+        response_time_ms INTEGER,
+        created_at TIMESTAMP NOT NULL DEFAULT {NOW}
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS pending_questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_question_id INTEGER NOT NULL,
+        processed BOOLEAN DEFAULT FALSE,
+        operator_notes TEXT,
+        hit_count INTEGER NOT NULL DEFAULT 1,
+        last_seen_at TIMESTAMP DEFAULT {NOW},
+        created_at TIMESTAMP DEFAULT {NOW},
+        updated_at TIMESTAMP DEFAULT {NOW}
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stats_rollups (
+        granularity TEXT NOT NULL,
+        bucket_start DATETIME NOT NULL,
+        queries INTEGER NOT NULL DEFAULT 0,
+        found INTEGER NOT NULL DEFAULT 0,
+        confidence_sum REAL NOT NULL DEFAULT 0,
+        confidence_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (granularity, bucket_start)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stats_latency_bins (
+        granularity TEXT NOT NULL,
+        bucket_start DATETIME NOT NULL,
+        bin INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (granularity, bucket_start, bin)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stats_question_hits (
+        granularity TEXT NOT NULL,
+        bucket_start DATETIME NOT NULL,
+        standard_question_id INTEGER NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (granularity, bucket_start, standard_question_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stats_state (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    """,
+    "INSERT OR IGNORE INTO stats_state (name, value) VALUES ('rollup_last_id', 0)",
+    "CREATE INDEX IF NOT EXISTS idx_standard_questions_group ON standard_questions(group_id)",
+    "CREATE INDEX IF NOT EXISTS idx_variants_standard_question ON question_variants(standard_question_id)",
+    "CREATE INDEX IF NOT EXISTS idx_user_questions_standard_question ON user_questions(standard_question_id)",
+    "CREATE INDEX IF NOT EXISTS idx_user_questions_created ON user_questions(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_pending_user_question ON pending_questions(user_question_id)",
+    "CREATE INDEX IF NOT EXISTS idx_pending_frequency ON pending_questions(processed, hit_count)",
+    "CREATE INDEX IF NOT EXISTS idx_pending_recent ON pending_questions(processed, created_at)",
+]
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+def _sql(query):
+    """Запрос с параметрами в стиле MySQL (%s) для sqlite3 (?)"""
+    return query.replace('%s', '?')
+
+
+class SQLiteDatabase(Storage):
+    """Хранилище во встроенной SQLite: один файл на фонд, журнал WAL.
+
+    Чтение идет через соединение своего потока и не ждет записи. Все записи
+    выполняет один поток-писатель: накопившиеся за время предыдущей фиксации
+    (и за batch_window_ms) записи фиксируются одной транзакцией, каждая внутри
+    своей точки сохранения - ошибка одной записи не откатывает соседние.
+    Вызывающий поток ждет фиксации своей записи, поэтому ID и результаты
+    возвращаются так же, как у MySQL.
+    """
+
+    backend = STORAGE_SQLITE
+
+    def __init__(self, path, batch_window_ms=0, batch_size=256, busy_timeout_ms=5000):
+        self.path = path
+        self.batch_window = batch_window_ms / 1000.0
+        self.batch_size = batch_size
+        self.busy_timeout_ms = busy_timeout_ms
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        self._writes = queue.Queue()
+        self._closed = False
+        self.stats = {'writes': 0, 'batches': 0, 'failed_batches': 0}
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.close()
+        self._writer = threading.Thread(target=self._write_loop, name='sqlite-writer', daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000.0,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            isolation_level=None,  # транзакции открываются явно
+            check_same_thread=False
+        )
+        conn.row_factory = _dict_row
+        conn.execute("PRAGMA foreign_keys=ON")
+        # В режиме WAL фиксация без fsync журнала не рискует целостностью базы
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        """Соединение для чтения текущего потока"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            started = time.perf_counter()
+            conn = self._connect()
+            self._local.conn = conn
+            record_stage('db_connect', (time.perf_counter() - started) * 1000)
+        return conn
+
+    def close(self):
+        """Дожидается записей из очереди и останавливает поток-писатель"""
+        if self._closed:
+            return
+        self._closed = True
+        self._writes.put(None)
+        self._writer.join()
+
+    # -------------------- Поток-писатель --------------------
+    def _write_loop(self):
+        conn = self._connect()
+        stop = False
+        while not stop:
+            job = self._writes.get()
+            if job is None:
+                break
+            batch = [job]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    timeout = deadline - time.monotonic()
+                    job = self._writes.get(timeout=timeout) if timeout > 0 else self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+            self._commit_batch(conn, batch)
+        conn.close()
+
+    def _commit_batch(self, conn, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, future in batch:
+                conn.execute("SAVEPOINT write")
+                try:
+                    results.append((future, fn(conn), None))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write")
+                    results.append((future, None, e))
+                conn.execute("RELEASE write")
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            self.stats['failed_batches'] += 1
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.stats['batches'] += 1
+        self.stats['writes'] += len(batch)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _write(self, fn, error_message, failure=None):
+        """Выполняет fn(conn) в потоке-писателе и ждет фиксации"""
+        if self._closed:
+            logger.error(f"❌ {error_message}: хранилище закрыто")
+            return failure
+        future = Future()
+        self._writes.put((fn, future))
+        try:
+            return future.result()
+        except Exception as e:
+            logger.error(f"❌ {error_message}: {e}")
+            return failure
+
+    # -------------------- Сырые запросы --------------------
+    def execute_query(self, query, params=None):
+        try:
+            return self._reader().execute(_sql(query), params or ()).fetchall()
+        except Exception as e:
+            logger.error(f"❌ Ошибка выполнения запроса: {e}")
+            return None
+
+    def iter_query(self, query, params=None, batch_size=1000):
+        """Потоково отдает строки большого SELECT отдельным соединением"""
+        try:
+            conn = self._connect()
+        except sqlite3.Error as e:
+            raise ConnectionError(f"Нет подключения к базе данных: {e}")
+        try:
+            cursor = conn.execute(_sql(query), params or ())
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+    def execute_update(self, query, params=None):
+        def run(conn):
+            conn.execute(_sql(query), params or ())
+            return True
+        return self._write(run, "Ошибка выполнения запроса", failure=False)
+
+    def _insert(self, query, params, error_message):
+        return self._write(lambda conn: conn.execute(_sql(query), params).lastrowid, error_message)
+
+    # -------------------- База знаний --------------------
+    def get_question_groups(self):
+        return self.execute_query("SELECT id, name FROM questions_groups")
+
+    def get_all_standard_questions(self):
+        return self.execute_query("SELECT id, group_id, title, answer_id, intent FROM standard_questions")
+
+    def get_all_answers(self):
+        results = self.execute_query("SELECT id, answer_text FROM answers")
+        if not results:
+            return []
+        return [{'id': row['id'], 'text': row['answer_text']} for row in results]
+
+    def get_all_variants(self):
+        results = self.execute_query("""
+            SELECT qv.id, qv.variant_text, qv.embedding,
+                   sq.id AS std_question_id, sq.answer_id, sq.intent, sq.title, sq.group_id
+            FROM question_variants qv
+            JOIN standard_questions sq ON qv.standard_question_id = sq.id
+        """)
+        return results or []
+
+    def get_variant_texts(self):
+        results = self.execute_query("""
+            SELECT qv.variant_text, sq.title
+            FROM question_variants qv
+            JOIN standard_questions sq ON qv.standard_question_id = sq.id
+        """)
+        return results or []
+
+    def get_answer_text(self, answer_id):
+        results = self.execute_query("SELECT answer_text FROM answers WHERE id = ?", (answer_id,))
+        return results[0]['answer_text'] if results else None
+
+    def get_standard_questions_by_ids(self, ids):
+        if not ids:
+            return []
+        results = self.execute_query(f"""
+            SELECT id, group_id, title, answer_id, intent
+            FROM standard_questions
+            WHERE id IN ({', '.join(['?'] * len(ids))})
+        """, tuple(ids))
+        return results or []
+
+    def insert_group(self, name):
+        return self._insert("INSERT INTO questions_groups (name) VALUES (?)", (name,),
+                            "Ошибка создания группы")
+
+    def insert_answer(self, answer_text):
+        return self._insert("INSERT INTO answers (answer_text) VALUES (?)", (answer_text,),
+                            "Ошибка создания ответа")
+
+    def insert_standard_question(self, title, group_id, answer_id, intent):
+        return self._insert("""
+            INSERT INTO standard_questions (title, group_id, answer_id, intent) VALUES (?, ?, ?, ?)
+        """, (title, group_id, answer_id, intent), "Ошибка создания стандартного вопроса")
+
+    def insert_question_variant(self, variant_text, embedding, standard_question_id):
+        created = self._insert("""
+            INSERT INTO question_variants (variant_text, embedding, standard_question_id) VALUES (?, ?, ?)
+        """, (variant_text, embedding, standard_question_id), "Ошибка создания варианта вопроса")
+        return created is not None
+
+    def _insert_many(self, query, rows, what):
+        """Вставляет строки в одной транзакции и возвращает список их ID"""
+        def run(conn):
+            return [conn.execute(query, params).lastrowid for params in rows]
+        return self._write(run, f"Ошибка пакетного создания ({what})")
+
+    def insert_groups(self, groups):
+        return self._insert_many(
+            "INSERT INTO questions_groups (name, description) VALUES (?, ?)", groups, "группы"
+        )
+
+    def insert_answers(self, answer_texts):
+        return self._insert_many(
+            "INSERT INTO answers (answer_text) VALUES (?)", [(text,) for text in answer_texts], "ответы"
+        )
+
+    def insert_question_variants(self, variants):
+        return self._insert_many(
+            "INSERT INTO question_variants (variant_text, embedding, standard_question_id) VALUES (?, ?, ?)",
+            variants, "варианты вопросов"
+        )
+
+    def insert_standard_questions(self, questions):
+        def run(conn):
+            created = []
+            for question in questions:
+                std_question_id = conn.execute("""
+                    INSERT INTO standard_questions (title, group_id, answer_id, intent) VALUES (?, ?, ?, ?)
+                """, (question['title'], question['group_id'], question['answer_id'], question['intent'])).lastrowid
+                variant_ids = [
+                    conn.execute("""
+                        INSERT INTO question_variants (variant_text, embedding, standard_question_id)
+                        VALUES (?, ?, ?)
+                    """, (variant_text, embedding, std_question_id)).lastrowid
+                    for variant_text, embedding in question['variants']
+                ]
+                created.append((std_question_id, variant_ids))
+            return created
+        return self._write(run, "Ошибка пакетного создания стандартных вопросов")
+
+    def bulk_load(self, tables, chunk_size=10000, replace=False):
+        """Массово загружает таблицы с явными ID одной транзакцией.
+
+        Таблицы перечисляются от родительских к дочерним, поэтому внешние ключи
+        не отключаются; replace=True сначала очищает их в обратном порядке.
+        """
+        def run(conn):
+            if replace:
+                for table, _, _ in reversed(tables):
+                    conn.execute(f"DELETE FROM {table}")
+            loaded = {}
+            for table, columns, rows in tables:
+                query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+                for start in range(0, len(rows), chunk_size):
+                    conn.executemany(query, rows[start:start + chunk_size])
+                loaded[table] = len(rows)
+                logger.info(f"✅ {table}: загружено {len(rows)} строк")
+            return loaded
+        return self._write(run, "Ошибка массовой загрузки")
+
+    # -------------------- Журнал вопросов пользователей --------------------
+    def log_user_question(self, session_id, client_id, raw_question, normalized_text,
+                          embedding, is_found, response_time_ms, standard_question_id=None,
+                          answer_id=None, confidence=None, created_at=None):
+        return self._insert(f"""
+            INSERT INTO user_questions
+            (session_id, client_id, raw_question, normalized_text, embedding,
+             standard_question_id, answer_id, is_found, confidence, response_time_ms, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, {NOW}))
+        """, (
+            session_id, client_id, raw_question, normalized_text, embedding,
+            standard_question_id, answer_id, is_found, confidence, response_time_ms, created_at
+        ), "Ошибка логирования вопроса пользователя")
+
+    def get_labeled_user_questions(self, limit):
+        results = self.execute_query("""
+            SELECT DISTINCT uq.id, uq.raw_question, uq.normalized_text, uq.standard_question_id
+            FROM pending_questions pq
+            JOIN user_questions uq ON pq.user_question_id = uq.id
+            WHERE pq.processed = TRUE AND uq.standard_question_id IS NOT NULL
+            ORDER BY uq.id DESC
+            LIMIT ?
+        """, (limit,))
+        return results or []
+
+    def get_user_questions_page(self, after_id, limit, start=None, end=None):
+        conditions = ["id > ?"]
+        params = [after_id]
+        if start is not None:
+            conditions.append("created_at >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("created_at < ?")
+            params.append(end)
+        params.append(limit)
+        return self.execute_query(f"""
+            SELECT id, created_at, raw_question, is_found, standard_question_id, confidence, response_time_ms
+            FROM user_questions
+            WHERE {' AND '.join(conditions)}
+            ORDER BY id
+            LIMIT ?
+        """, tuple(params))
+
+    def get_user_questions_after(self, last_id, limit, lag_seconds=10):
+        return ready_prefix(self.execute_query("""
+            SELECT id, created_at, is_found, confidence, response_time_ms, standard_question_id,
+                   created_at < datetime('now', 'localtime', ?) AS ready
+            FROM user_questions
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        """, (f"{-int(lag_seconds)} seconds", last_id, limit)))
+
+    # -------------------- Очередь неотвеченных вопросов --------------------
+    def log_pending_question(self, question_id):
+        return self._insert("INSERT INTO pending_questions (user_question_id) VALUES (?)", (question_id,),
+                            "Ошибка добавления вопроса в ожидание")
+
+    def get_pending_with_embeddings(self, limit=None, newest_first=False):
+        order = "pq.last_seen_at DESC" if newest_first else "pq.id"
+        query = f"""
+            SELECT pq.id AS pending_id, uq.id AS user_question_id,
+                   uq.raw_question, uq.embedding, uq.created_at,
+                   pq.hit_count, pq.last_seen_at
+            FROM pending_questions pq
+            JOIN user_questions uq ON pq.user_question_id = uq.id
+            WHERE pq.processed = FALSE
+            ORDER BY {order}
+        """
+        params = ()
+        if limit:
+            query += " LIMIT ?"
+            params = (limit,)
+        return self.execute_query(query, params) or []
+
+    def get_pending_page(self, after=None, limit=20, order='recent', only_unprocessed=True, pending_ids=None):
+        sort_column = 'pq.hit_count' if order == 'frequent' else 'pq.created_at'
+        conditions, params = [], []
+        if only_unprocessed:
+            conditions.append("pq.processed = FALSE")
+        if pending_ids:
+            conditions.append(f"pq.id IN ({', '.join(['?'] * len(pending_ids))})")
+            params.extend(pending_ids)
+        if after is not None:
+            conditions.append(f"({sort_column} < ? OR ({sort_column} = ? AND pq.id < ?))")
+            params.extend([after[0], after[0], after[1]])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(limit)
+        return self.execute_query(f"""
+            SELECT pq.id AS pending_id, pq.processed, pq.hit_count, pq.last_seen_at,
+                   pq.created_at, uq.id AS user_question_id, uq.raw_question, uq.embedding,
+                   sq.title AS matched_question
+            FROM pending_questions pq
+            JOIN user_questions uq ON pq.user_question_id = uq.id
+            LEFT JOIN standard_questions sq ON uq.standard_question_id = sq.id
+            {where}
+            ORDER BY {sort_column} DESC, pq.id DESC
+            LIMIT ?
+        """, tuple(params))
+
+    def touch_pending(self, pending_id):
+        def run(conn):
+            cursor = conn.execute(f"""
+                UPDATE pending_questions
+                SET hit_count = hit_count + 1, last_seen_at = {NOW}, updated_at = {NOW}
+                WHERE id = ? AND processed = FALSE
+            """, (pending_id,))
+            return cursor.rowcount > 0
+        return self._write(run, f"Ошибка обновления счетчика вопроса {pending_id}")
+
+    def resolve_pending(self, pending_ids, standard_question_id=None, operator_notes=None):
+        """Помечает группу неотвеченных вопросов обработанными одной транзакцией"""
+        if not pending_ids:
+            return True
+        placeholders = ", ".join(["?"] * len(pending_ids))
+
+        def run(conn):
+            if standard_question_id is not None:
+                conn.execute(f"""
+                    UPDATE user_questions SET standard_question_id = ?
+                    WHERE id IN (SELECT user_question_id FROM pending_questions WHERE id IN ({placeholders}))
+                """, (standard_question_id, *pending_ids))
+            conn.execute(f"""
+                UPDATE pending_questions
+                SET processed = TRUE, operator_notes = COALESCE(?, operator_notes), updated_at = {NOW}
+                WHERE id IN ({placeholders})
+            """, (operator_notes, *pending_ids))
+            return True
+        return self._write(run, "Ошибка выполнения запроса", failure=False)
+
+    # -------------------- Агрегаты статистики --------------------
+    def get_stats_watermark(self, name='rollup_last_id'):
+        results = self.execute_query("SELECT value FROM stats_state WHERE name = ?", (name,))
+        if results is None:
+            return None
+        return int(results[0]['value']) if results else 0
+
+    def apply_stats_rollup(self, previous_id, last_id, rollups, latency_bins, question_hits,
+                           name='rollup_last_id'):
+        """Прибавляет пачку к агрегатам и сдвигает водяной знак одной транзакцией"""
+        def run(conn):
+            cursor = conn.execute(
+                "UPDATE stats_state SET value = ? WHERE name = ? AND value = ?", (last_id, name, previous_id)
+            )
+            if cursor.rowcount == 0:
+                return False
+            conn.executemany("""
+                INSERT INTO stats_rollups
+                (granularity, bucket_start, queries, found, confidence_sum, confidence_count)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (granularity, bucket_start) DO UPDATE SET
+                    queries = queries + excluded.queries,
+                    found = found + excluded.found,
+                    confidence_sum = confidence_sum + excluded.confidence_sum,
+                    confidence_count = confidence_count + excluded.confidence_count
+            """, rollups)
+            conn.executemany("""
+                INSERT INTO stats_latency_bins (granularity, bucket_start, bin, count)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (granularity, bucket_start, bin) DO UPDATE SET count = count + excluded.count
+            """, latency_bins)
+            conn.executemany("""
+                INSERT INTO stats_question_hits (granularity, bucket_start, standard_question_id, hits)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (granularity, bucket_start, standard_question_id) DO UPDATE SET
+                    hits = hits + excluded.hits
+            """, question_hits)
+            return True
+        return self._write(run, "Ошибка обновления агрегатов статистики")
+
+    def get_stats_rollups(self, granularity, start, end):
+        return self.execute_query("""
+            SELECT bucket_start, queries, found, confidence_sum, confidence_count
+            FROM stats_rollups
+            WHERE granularity = ? AND bucket_start >= ? AND bucket_start < ?
+            ORDER BY bucket_start
+        """, (granularity, start, end))
+
+    def get_stats_latency_bins(self, granularity, start, end):
+        return self.execute_query("""
+            SELECT bucket_start, bin, count
+            FROM stats_latency_bins
+            WHERE granularity = ? AND bucket_start >= ? AND bucket_start < ?
+        """, (granularity, start, end))
+
+    def get_stats_top_questions(self, granularity, start, end, limit):
+        return self.execute_query("""
+            SELECT h.standard_question_id, sq.title, sq.intent, SUM(h.hits) AS hits
+            FROM stats_question_hits h
+            LEFT JOIN standard_questions sq ON sq.id = h.standard_question_id
+            WHERE h.granularity = ? AND h.bucket_start >= ? AND h.bucket_start < ?
+            GROUP BY h.standard_question_id, sq.title, sq.intent
+            ORDER BY hits DESC
+            LIMIT ?
+        """, (granularity, start, end, limit))
+
+    def get_stats_top_intents(self, granularity, start, end, limit):
+        return self.execute_query("""
+            SELECT sq.intent, SUM(h.hits) AS hits
+            FROM stats_question_hits h
+            JOIN standard_questions sq ON sq.id = h.standard_question_id
+            WHERE h.granularity = ? AND h.bucket_start >= ? AND h.bucket_start < ?
+              AND sq.intent IS NOT NULL AND sq.intent <> ''
+            GROUP BY sq.intent
+            ORDER BY hits DESC
+            LIMIT ?
+        """, (granularity, start, end, limit))
@@ -0,0 +1,193 @@
+# Файл stats_rollup.py
+import math
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+GRANULARITY_HOUR = 'hour'
+GRANULARITY_DAY = 'day'
+GRANULARITIES = (GRANULARITY_HOUR, GRANULARITY_DAY)
+
+# Логарифмические корзины задержки: соседние границы отличаются в LATENCY_GAMMA раз,
+# поэтому любой перцентиль восстанавливается с относительной ошибкой ~2.5%,
+# а гистограммы разных периодов складываются простым сложением счетчиков
+LATENCY_GAMMA = 1.05
+_LOG_GAMMA = math.log(LATENCY_GAMMA)
+
+
+def latency_bin(ms):
+    """Номер корзины для задержки в миллисекундах (0 - до 1 мс включительно)"""
+    if ms is None or ms <= 1:
+        return 0
+    return int(math.ceil(math.log(ms) / _LOG_GAMMA))
+
+
+def bin_value(bin_number):
+    """Представитель корзины - середина между ее границами"""
+    if bin_number <= 0:
+        return 1.0
+    return 2 * LATENCY_GAMMA ** bin_number / (LATENCY_GAMMA + 1)
+
+
+def quantiles(bins, qs):
+    """Перцентили по гистограмме {корзина: счетчик}"""
+    total = sum(bins.values())
+    if not total:
+        return {q: None for q in qs}
+    ordered = sorted(bins.items())
+    result = {}
+    for q in qs:
+        rank = q * (total - 1)
+        seen = 0
+        for bin_number, count in ordered:
+            seen += count
+            if seen > rank:
+                result[q] = round(bin_value(bin_number), 1)
+                break
+    return result
+
+
+def bucket_start(moment, granularity):
+    if granularity == GRANULARITY_DAY:
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def aggregate(rows):
+    """Сворачивает строки user_questions в приращения агрегатов для apply_stats_rollup"""
+    totals = defaultdict(lambda: [0, 0, 0.0, 0])
+    latency = Counter()
+    hits = Counter()
+    for row in rows:
+        for granularity in GRANULARITIES:
+            key = (granularity, bucket_start(row['created_at'], granularity))
+            total = totals[key]
+            total[0] += 1
+            if row['is_found']:
+                total[1] += 1
+                if row['standard_question_id']:
+                    hits[key + (row['standard_question_id'],)] += 1
+            if row['confidence'] is not None:
+                total[2] += float(row['confidence'])
+                total[3] += 1
+            if row['response_time_ms'] is not None:
+                latency[key + (latency_bin(row['response_time_ms']),)] += 1
+
+    rollups = [key + tuple(values) for key, values in totals.items()]
+    latency_bins = [key + (count,) for key, count in latency.items()]
+    question_hits = [key + (count,) for key, count in hits.items()]
+    return rollups, latency_bins, question_hits
+
+
+def run_rollup(db, batch_size=5000, lag_seconds=10, max_batches=None):
+    """Учитывает в агрегатах все новые строки user_questions после водяного знака.
+
+    Строки читаются пачками по первичному ключу, каждая пачка применяется одной
+    транзакцией вместе со сдвигом водяного знака. Возвращает число учтенных строк
+    или None при ошибке.
+    """
+    processed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        previous_id = db.get_stats_watermark()
+        if previous_id is None:
+            return None
+        rows = db.get_user_questions_after(previous_id, batch_size, lag_seconds)
+        if rows is None:
+            return None
+        if not rows:
+            break
+
+        last_id = rows[-1]['id']
+        applied = db.apply_stats_rollup(previous_id, last_id, *aggregate(rows))
+        if applied is None:
+            return None
+        if applied:
+            processed += len(rows)
+        else:
+            logger.info("Пачка уже учтена параллельным запуском, продолжаем с нового водяного знака")
+        batches += 1
+        if len(rows) < batch_size:
+            break
+    return processed
+
+
+def _parse_moment(value, default):
+    """Момент ISO 8601; с часовым поясом (например, '...Z') - в местное время без пояса,
+    как в таблицах агрегатов"""
+    if not value:
+        return default
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def read_stats(db, granularity=GRANULARITY_HOUR, start=None, end=None, top=10, now=None):
+    """Статистика за период только по таблицам агрегатов.
+
+    По умолчанию - последние 24 часа для hour и последние 30 дней для day.
+    Бросает ValueError при неверных параметрах.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    now = now or datetime.now()
+    default_span = timedelta(days=30) if granularity == GRANULARITY_DAY else timedelta(hours=24)
+    end = _parse_moment(end, bucket_start(now, granularity) + (
+        timedelta(days=1) if granularity == GRANULARITY_DAY else timedelta(hours=1)))
+    start = _parse_moment(start, end - default_span)
+    if start >= end:
+        raise ValueError("'from' must be earlier than 'to'")
+
+    rollups = db.get_stats_rollups(granularity, start, end)
+    bins_rows = db.get_stats_latency_bins(granularity, start, end)
+    top_questions = db.get_stats_top_questions(granularity, start, end, top)
+    top_intents = db.get_stats_top_intents(granularity, start, end, top)
+    if None in (rollups, bins_rows, top_questions, top_intents):
+        return None
+
+    per_bucket = defaultdict(Counter)
+    overall = Counter()
+    for row in bins_rows:
+        per_bucket[row['bucket_start']][row['bin']] += row['count']
+        overall[row['bin']] += row['count']
+
+    series = []
+    for row in rollups:
+        latency = quantiles(per_bucket[row['bucket_start']], (0.5, 0.95))
+        series.append({
+            'bucket': row['bucket_start'].isoformat(),
+            'queries': row['queries'],
+            'found': row['found'],
+            'hit_rate': round(row['found'] / row['queries'], 4) if row['queries'] else None,
+            'latency_p50_ms': latency[0.5],
+            'latency_p95_ms': latency[0.95],
+        })
+
+    queries = sum(row['queries'] for row in rollups)
+    found = sum(row['found'] for row in rollups)
+    confidence_count = sum(row['confidence_count'] for row in rollups)
+    latency = quantiles(overall, (0.5, 0.9, 0.95, 0.99))
+    return {
+        'granularity': granularity,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'totals': {
+            'queries': queries,
+            'found': found,
+            'unanswered': queries - found,
+            'hit_rate': round(found / queries, 4) if queries else None,
+            'avg_confidence': round(sum(row['confidence_sum'] for row in rollups) / confidence_count, 4)
+            if confidence_count else None,
+            'latency_ms': {f"p{int(q * 100)}": value for q, value in latency.items()},
+        },
+        'series': series,
+        'top_questions': [
+            {'std_question_id': row['standard_question_id'], 'title': row['title'],
+             'intent': row['intent'], 'hits': int(row['hits'])}
+            for row in top_questions
+        ],
+        'top_intents': [{'intent': row['intent'], 'hits': int(row['hits'])} for row in top_intents],
+    }
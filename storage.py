@@ -0,0 +1,200 @@
+# Файл storage.py
+import os
+
+STORAGE_MYSQL = 'mysql'    # сервер MySQL, схема на фонд
+STORAGE_SQLITE = 'sqlite'  # встроенная SQLite в режиме WAL, файл на фонд
+STORAGE_BACKENDS = (STORAGE_MYSQL, STORAGE_SQLITE)
+
+
+class Storage:
+    """Интерфейс хранилища: база знаний, журнал вопросов, очередь операторов и статистика.
+
+    Общие соглашения всех реализаций:
+    - строки возвращаются словарями с именами столбцов, время - datetime;
+    - чтение при ошибке возвращает None, вставка - None (или False для
+      методов, возвращающих флаг), ошибка пишется в журнал через logger.error;
+    - в сырых запросах execute_query/execute_update параметры задаются как %s,
+      а SQL должен быть общим для MySQL и SQLite.
+    """
+
+    backend = None
+
+    def close(self):
+        """Освобождает ресурсы хранилища (соединения, фоновые потоки)"""
+
+    def available(self):
+        """False, пока хранилище считается недоступным и вызовы к нему сразу завершаются ошибкой"""
+        return True
+
+    # -------------------- Сырые запросы --------------------
+    def execute_query(self, query, params=None):
+        """Строки SELECT или None при ошибке"""
+        raise NotImplementedError
+
+    def execute_update(self, query, params=None):
+        """True, если изменение зафиксировано"""
+        raise NotImplementedError
+
+    def iter_query(self, query, params=None, batch_size=1000):
+        """Потоковый SELECT; ConnectionError, если хранилище недоступно"""
+        raise NotImplementedError
+
+    # -------------------- База знаний: чтение --------------------
+    def get_question_groups(self):
+        raise NotImplementedError
+
+    def get_all_standard_questions(self):
+        raise NotImplementedError
+
+    def get_all_answers(self):
+        """[{'id', 'text'}]"""
+        raise NotImplementedError
+
+    def get_all_variants(self):
+        """Варианты с эмбеддингами и полями стандартного вопроса для индекса поиска"""
+        raise NotImplementedError
+
+    def get_variant_texts(self):
+        """[{'variant_text', 'title'}] без эмбеддингов - словарь исправления опечаток"""
+        raise NotImplementedError
+
+    def get_answer_text(self, answer_id):
+        raise NotImplementedError
+
+    def get_standard_questions_by_ids(self, ids):
+        raise NotImplementedError
+
+    # -------------------- База знаний: вставка --------------------
+    def insert_group(self, name):
+        """ID новой группы"""
+        raise NotImplementedError
+
+    def insert_answer(self, answer_text):
+        raise NotImplementedError
+
+    def insert_standard_question(self, title, group_id, answer_id, intent):
+        raise NotImplementedError
+
+    def insert_question_variant(self, variant_text, embedding, standard_question_id):
+        """True/False"""
+        raise NotImplementedError
+
+    def insert_groups(self, groups):
+        """[(name, description)] одной транзакцией, список ID"""
+        raise NotImplementedError
+
+    def insert_answers(self, answer_texts):
+        raise NotImplementedError
+
+    def insert_question_variants(self, variants):
+        """[(variant_text, embedding, standard_question_id)] одной транзакцией, список ID"""
+        raise NotImplementedError
+
+    def insert_standard_questions(self, questions):
+        """Вопросы с вариантами одной транзакцией: [(id вопроса, [id вариантов])]"""
+        raise NotImplementedError
+
+    def bulk_load(self, tables, chunk_size=10000, replace=False):
+        """Массовая загрузка [(table, columns, rows)] с явными ID, число строк по таблицам"""
+        raise NotImplementedError
+
+    # -------------------- Журнал вопросов пользователей --------------------
+    def log_user_question(self, session_id, client_id, raw_question, normalized_text,
+                          embedding, is_found, response_time_ms, standard_question_id=None,
+                          answer_id=None, confidence=None, created_at=None):
+        """ID записи в user_questions; created_at - время вопроса, если запись отложенная"""
+        raise NotImplementedError
+
+    def get_labeled_user_questions(self, limit):
+        """Последние вопросы, привязанные оператором к стандартному вопросу
+        (resolve_pending с standard_question_id); ответы бота разметкой не считаются"""
+        raise NotImplementedError
+
+    def get_user_questions_page(self, after_id, limit, start=None, end=None):
+        raise NotImplementedError
+
+    def get_user_questions_after(self, last_id, limit, lag_seconds=10):
+        """Вопросы с id > last_id по первичному ключу - только префикс до первой строки
+        моложе lag_seconds (ready_prefix)"""
+        raise NotImplementedError
+
+    # -------------------- Очередь неотвеченных вопросов --------------------
+    def log_pending_question(self, question_id):
+        """ID записи в pending_questions"""
+        raise NotImplementedError
+
+    def get_pending_with_embeddings(self, limit=None, newest_first=False):
+        raise NotImplementedError
+
+    def get_pending_page(self, after=None, limit=20, order='recent', only_unprocessed=True, pending_ids=None):
+        raise NotImplementedError
+
+    def touch_pending(self, pending_id):
+        """True - счетчик увеличен, False - вопрос уже обработан, None - ошибка"""
+        raise NotImplementedError
+
+    def resolve_pending(self, pending_ids, standard_question_id=None, operator_notes=None):
+        raise NotImplementedError
+
+    # -------------------- Агрегаты статистики --------------------
+    def get_stats_watermark(self, name='rollup_last_id'):
+        raise NotImplementedError
+
+    def apply_stats_rollup(self, previous_id, last_id, rollups, latency_bins, question_hits,
+                           name='rollup_last_id'):
+        """True - пачка учтена, False - ее уже учли, None - ошибка"""
+        raise NotImplementedError
+
+    def get_stats_rollups(self, granularity, start, end):
+        raise NotImplementedError
+
+    def get_stats_latency_bins(self, granularity, start, end):
+        raise NotImplementedError
+
+    def get_stats_top_questions(self, granularity, start, end, limit):
+        raise NotImplementedError
+
+    def get_stats_top_intents(self, granularity, start, end, limit):
+        raise NotImplementedError
+
+
+def ready_prefix(rows):
+    """Строки по возрастанию id до первой неготовой (ready = 0).
+
+    Отложенная запись из спула сохраняет исходное время вопроса, поэтому порядок
+    id не совпадает с порядком created_at. Водяной знак статистики сдвигается до
+    id последней строки пачки и не должен перешагнуть строку, которая еще не
+    прочитана из-за задержки.
+    """
+    if rows is None:
+        return None
+    for position, row in enumerate(rows):
+        if not row['ready']:
+            return rows[:position]
+    return rows
+
+
+def open_storage(settings, database=None):
+    """Хранилище по настройкам (модуль config): STORAGE_BACKEND выбирает реализацию.
+
+    database - схема MySQL или имя файла SQLite в SQLITE_DIR (по умолчанию DB_NAME).
+    """
+    database = database or settings.DB_NAME
+    if settings.STORAGE_BACKEND == STORAGE_MYSQL:
+        from database import Database
+        from circuit_breaker import CircuitBreaker
+        return Database(
+            settings.DB_HOST, settings.DB_USER, settings.DB_PASSWORD, database,
+            connect_timeout=settings.DB_CONNECT_TIMEOUT,
+            read_timeout=settings.DB_READ_TIMEOUT,
+            write_timeout=settings.DB_WRITE_TIMEOUT,
+            breaker=CircuitBreaker(settings.DB_BREAKER_FAILURES, settings.DB_BREAKER_RESET_SECONDS, name=database)
+        )
+    if settings.STORAGE_BACKEND == STORAGE_SQLITE:
+        from sqlite_storage import SQLiteDatabase
+        return SQLiteDatabase(
+            os.path.join(settings.SQLITE_DIR, f"{database}.db"),
+            batch_window_ms=settings.SQLITE_BATCH_WINDOW_MS,
+            batch_size=settings.SQLITE_BATCH_SIZE
+        )
+    raise ValueError(f"Неизвестное хранилище: {settings.STORAGE_BACKEND} (ожидалось одно из {STORAGE_BACKENDS})")
@@ -0,0 +1,142 @@
+# Файл tenants.py
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def parse_mapping(value):
+    """Разбирает строку вида 'ключ:значение,ключ2:значение2' в словарь"""
+    mapping = {}
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, target = item.partition(':')
+        if not target:
+            raise ValueError(f"Ожидалось 'ключ:значение', получено '{item}'")
+        mapping[key.strip()] = target.strip()
+    return mapping
+
+
+class Tenant:
+    """Данные одного фонда: своя схема MySQL (или файл SQLite) и построенные по ней структуры в памяти"""
+
+    def __init__(self, name, db, search_index, related_questions, pending_dedup, answers=None,
+                 question_log=None, spelling=None):
+        self.name = name
+        self.db = db
+        self.search_index = search_index
+        self.related_questions = related_questions
+        self.pending_dedup = pending_dedup
+        self.answers = answers if answers is not None else {}
+        self.question_log = question_log
+        self.spelling = spelling
+
+    def answer_text(self, answer_id):
+        """Текст ответа из памяти; отсутствующий ответ читается из базы, если она доступна"""
+        text = self.answers.get(answer_id)
+        if text is None and self.db.available():
+            text = self.db.get_answer_text(answer_id)
+            if text:
+                self.answers[answer_id] = text
+        return text
+
+    def memory_bytes(self):
+        return (self.search_index.memory_bytes() + self.related_questions.memory_bytes()
+                + self.pending_dedup.memory_bytes()
+                + (self.spelling.memory_bytes() if self.spelling is not None else 0)
+                + sum(len(text) * 2 + 100 for text in self.answers.values()))
+
+
+class TenantRegistry:
+    """Фонды, загружаемые по первому запросу и вытесняемые LRU в пределах бюджета памяти.
+
+    factory(name) создает и загружает Tenant. Загрузка одного фонда не блокирует
+    запросы к остальным; вытесненный фонд дослуживает уже начатые запросы и
+    будет загружен заново при следующем обращении. on_evict(tenant) вызывается
+    для вытесненного фонда вне блокировки (освобождение памяти вне процесса).
+    """
+
+    def __init__(self, factory, names, memory_budget_mb=1024, on_evict=None):
+        self.factory = factory
+        self.on_evict = on_evict
+        self.names = set(names)
+        self.memory_budget = memory_budget_mb * 2 ** 20
+        self._tenants = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in self.names}
+        self.stats = {'hits': 0, 'loads': 0, 'evictions': 0, 'load_ms_total': 0.0}
+
+    def get(self, name):
+        """Фонд по имени; KeyError для неизвестного фонда"""
+        if name not in self.names:
+            raise KeyError(name)
+        with self._lock:
+            tenant = self._tenants.get(name)
+            if tenant is not None:
+                self._tenants.move_to_end(name)
+                self.stats['hits'] += 1
+                return tenant
+
+        with self._load_locks[name]:
+            # Пока ждали, фонд мог загрузить параллельный запрос
+            with self._lock:
+                tenant = self._tenants.get(name)
+                if tenant is not None:
+                    self._tenants.move_to_end(name)
+                    self.stats['hits'] += 1
+                    return tenant
+
+            started = time.perf_counter()
+            tenant = self.factory(name)
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._tenants[name] = tenant
+                self.stats['loads'] += 1
+                self.stats['load_ms_total'] += elapsed
+            logger.info(f"Фонд '{name}' загружен за {elapsed:.0f} мс")
+            self.enforce_budget()
+            return tenant
+
+    def peek(self, name):
+        """Фонд, если он сейчас в памяти, иначе None; не загружает фонд и не меняет порядок LRU"""
+        with self._lock:
+            return self._tenants.get(name)
+
+    def enforce_budget(self):
+        """Вытесняет давно не использованные фонды, пока память не уложится в бюджет"""
+        evicted = []
+        with self._lock:
+            usage = {name: tenant.memory_bytes() for name, tenant in self._tenants.items()}
+            total = sum(usage.values())
+            # Последний использованный фонд остается, даже если один не помещается в бюджет
+            while total > self.memory_budget and len(self._tenants) > 1:
+                name, tenant = self._tenants.popitem(last=False)
+                evicted.append(tenant)
+                total -= usage[name]
+                self.stats['evictions'] += 1
+                logger.info(f"Фонд '{name}' выгружен из памяти (освобождено ~{usage[name] / 2 ** 20:.1f} МБ)")
+        if self.on_evict is not None:
+            for tenant in evicted:
+                try:
+                    self.on_evict(tenant)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка освобождения фонда '{tenant.name}': {e}")
+        return total
+
+    def loaded(self):
+        """Фонды, которые сейчас в памяти, от давно не использованного к последнему"""
+        with self._lock:
+            return OrderedDict(self._tenants)
+
+    def metrics(self):
+        with self._lock:
+            loaded = {name: round(tenant.memory_bytes() / 2 ** 20, 2) for name, tenant in self._tenants.items()}
+            stats = dict(self.stats)
+        stats['loaded_mb'] = loaded
+        stats['memory_mb'] = round(sum(loaded.values()), 2)
+        stats['budget_mb'] = round(self.memory_budget / 2 ** 20, 2)
+        return stats
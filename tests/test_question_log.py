@@ -0,0 +1,47 @@
+# tests/test_question_log.py
+"""Спул записей вопросов: повторная запись не теряет то, что уже на диске"""
+from datetime import datetime
+
+from question_log import QuestionLog, Spool
+
+
+class FlakyDatabase:
+    """База, которая отвечает, но принимает только первые accept записей"""
+
+    def __init__(self, accept):
+        self.accept = accept
+        self.written = []
+
+    def available(self):
+        return True
+
+    def log_user_question(self, raw_question, **fields):
+        if len(self.written) >= self.accept:
+            return None
+        self.written.append(raw_question)
+        return len(self.written)
+
+
+def question(number):
+    return {'kind': 'question', 'session_id': 's1', 'client_id': 'c1', 'raw_question': f'вопрос {number}',
+            'normalized_text': f'вопрос {number}', 'embedding': None, 'embedding_blob': None,
+            'is_found': True, 'response_time_ms': 10, 'created_at': datetime(2026, 10, 19, 14)}
+
+
+def test_replay_keeps_unwritten_records(tmp_path):
+    spool = Spool(str(tmp_path / 'spool.jsonl'), max_mb=1)
+    for number in range(5):
+        assert spool.append(question(number))
+    # Спул почти заполнен: заново дописать в него записи было бы нельзя
+    spool.max_bytes = spool.size_bytes() + 10
+
+    db = FlakyDatabase(accept=2)
+    log = QuestionLog(db, lambda: None, spool, replay_interval=3600)
+    assert log.replay_spool() == 2
+    assert db.written == ['вопрос 0', 'вопрос 1']
+    assert log.stats['dropped'] == 0
+
+    db.accept = 5
+    assert log.replay_spool() == 3
+    assert db.written == [f'вопрос {number}' for number in range(5)]
+    assert spool.size_bytes() == 0
@@ -0,0 +1,57 @@
+# tests/test_search.py
+"""Ранжирование BM25 и смешанного поиска (fused) на маленькой базе"""
+import numpy as np
+
+from lexical_index import LexicalIndex
+from search_index import EMBEDDING_DIM, SEARCH_MODE_DENSE, SEARCH_MODE_FUSED, SearchIndex
+
+TEXTS = [
+    'как пожертвовать деньги фонду',
+    'как стать волонтером',
+    'пожертвовать вещи',
+    'контакты фонда и адрес офиса фонда в москве',
+]
+
+
+def unit(*components):
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    vector[:len(components)] = components
+    return vector
+
+
+def test_bm25_ranking():
+    index = LexicalIndex(analyzer='word').build(TEXTS)
+    scores = index.score('пожертвовать деньги')
+    # Оба слова запроса выше одного, документы без общих слов не получают оценки
+    assert scores[0] > scores[2] > 0
+    assert scores[1] == scores[3] == 0
+    assert sorted(index.top_candidates(scores, 5)) == [0, 2]
+
+    # Редкое слово весит больше частого, длинный документ - меньше короткого
+    assert index.score('деньги')[0] > index.score('пожертвовать')[0]
+    assert index.score('как')[1] > index.score('как')[0]
+
+
+def test_fused_ranking():
+    rows = [
+        {'id': i + 1, 'std_question_id': i + 1, 'answer_id': i + 1, 'variant_text': text}
+        for i, text in enumerate(TEXTS)
+    ]
+    # Варианты 0 и 2 одинаково близки к запросу по эмбеддингу, вариант 1 - ближе всех
+    embeddings = np.vstack([unit(1, 1), unit(1, 2), unit(1, 1), unit(0, 0, 1)])
+    query = unit(1, 1.5)
+
+    dense = SearchIndex(mode=SEARCH_MODE_DENSE)
+    dense.build(rows, embeddings)
+    assert dense.find_closest(query, text='пожертвовать деньги')['std_question_id'] == 2
+
+    fused = SearchIndex(mode=SEARCH_MODE_FUSED, lexical_analyzer='word', fusion_weight=0.5)
+    fused.build(rows, embeddings)
+    results = fused.search(query, text='пожертвовать деньги', top_k=3)
+    assert [result['std_question_id'] for result in results] == [1, 3, 2]
+    assert [result['score'] for result in results] == sorted((r['score'] for r in results), reverse=True)
+    # similarity остается косинусной, порог ответа от смешивания не зависит
+    expected = float(unit(1, 1) @ query / np.linalg.norm(unit(1, 1)) / np.linalg.norm(query))
+    assert np.isclose(results[0]['similarity'], expected, atol=1e-5)
+    # Без текста запроса смешанный режим - обычный плотный поиск
+    assert fused.find_closest(query)['std_question_id'] == 2
@@ -0,0 +1,74 @@
+# tests/test_sharding.py
+"""Сбор результатов шардов: общий top_k и ответ при недоступных шардах.
+
+Процессы шардов не запускаются: ответы шардов подставляются вместо ShardClient.call.
+"""
+import numpy as np
+import pytest
+
+from search_index import EMBEDDING_DIM, SearchIndex
+from sharding import ShardError, ShardPool, ShardServer, ShardsUnavailable, merge_results
+
+
+def result(std_question_id, score):
+    return {'std_question_id': std_question_id, 'score': score, 'similarity': score}
+
+
+def fake_pool(answers, min_responses=1):
+    """Пул из len(answers) шардов; None - шард не отвечает"""
+    pool = ShardPool([('127.0.0.1', 1)] * len(answers), b'test', min_responses=min_responses)
+
+    def responder(answer):
+        def call(command, payload, timeout):
+            if answer is None:
+                raise ShardError("нет соединения")
+            return answer
+        return call
+
+    for client, answer in zip(pool.clients, answers):
+        client.call = responder(answer)
+    return pool
+
+
+def test_merge_results_top_k():
+    shards = [[result(1, 0.9), result(4, 0.5)], [], [result(2, 0.95), result(3, 0.7)]]
+    assert [r['std_question_id'] for r in merge_results(shards, 3)] == [2, 1, 3]
+    assert [r['std_question_id'] for r in merge_results(shards, 10)] == [2, 1, 3, 4]
+    assert merge_results([[], []], 3) == []
+
+
+def test_gather_with_missing_shard():
+    pool = fake_pool([[result(1, 0.9)], None, [result(2, 0.8), result(3, 0.6)]])
+    try:
+        answers = pool.gather('search', {})
+        assert sorted(answers) == [0, 2]
+        assert [r['std_question_id'] for r in merge_results(answers.values(), 2)] == [1, 2]
+        assert pool.stats['partial'] == 1 and pool.stats['shard_errors'] == 1
+    finally:
+        pool.close()
+
+
+def test_gather_below_min_responses():
+    pool = fake_pool([[result(1, 0.9)], None, None], min_responses=2)
+    try:
+        with pytest.raises(ShardsUnavailable):
+            pool.gather('search', {})
+        assert pool.stats['failed'] == 1
+    finally:
+        pool.close()
+
+
+def test_shard_server_unload():
+    rows = [{'id': i, 'std_question_id': i, 'answer_id': 1, 'variant_text': f'вариант {i}',
+             'embedding': np.ones(EMBEDDING_DIM, dtype=np.float32).tobytes()} for i in range(1, 7)]
+
+    class Storage:
+        def get_all_variants(self):
+            return rows
+
+    server = ShardServer(0, 2, lambda tenant: Storage(), lambda tenant: SearchIndex())
+    status = server.handle('load', {'tenant': 'default'})
+    assert 0 < status['size'] < len(rows) and status['memory'] > 0
+    assert server.handle('unload', {'tenant': 'default'}) is True
+    assert 'default' not in server.indexes
+    assert server.handle('unload', {'tenant': 'default'}) is False
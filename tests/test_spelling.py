@@ -0,0 +1,33 @@
+# tests/test_spelling.py
+"""Исправление раскладки клавиатуры и опечаток по словарю базы знаний"""
+import pytest
+
+from spelling import SpellCorrector, damerau_distance
+
+
+@pytest.fixture
+def corrector():
+    corrector = SpellCorrector()
+    corrector.build(['привет', 'как пожертвовать деньги фонду', 'как стать волонтером'])
+    return corrector
+
+
+def test_damerau_distance():
+    assert damerau_distance('деньги', 'денгьи', 2) == 1  # перестановка соседних букв
+    assert damerau_distance('деньги', 'день', 2) == 2
+    assert damerau_distance('деньги', 'волонтером', 2) == 3  # больше limit - limit + 1
+
+
+def test_keyboard_layout(corrector):
+    assert corrector.correct('ghbdtn') == 'привет'
+    assert corrector.correct('rfr cnfnm djkjynthjv?') == 'как стать волонтером?'
+
+
+def test_one_edit_typo(corrector):
+    assert corrector.correct('как пожертвавать деньги') == 'как пожертвовать деньги'
+    assert corrector.correct('как стать волонтером') == 'как стать волонтером'
+    assert corrector.stats == {'attempts': 2, 'corrected': 1, 'answered': 0}
+
+    # Теневая проверка не меняет счетчики
+    assert corrector.correct('ghbdtn', record=False) == 'привет'
+    assert corrector.stats['attempts'] == 2
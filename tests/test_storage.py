@@ -0,0 +1,240 @@
+# tests/test_storage.py
+"""Общие проверки реализаций хранилища.
+
+SQLite проверяется всегда (временный файл). MySQL - только если задана
+TEST_MYSQL_DATABASE: отдельная схема, созданная init_db.py, которую тесты
+очищают перед каждой проверкой. Подключение - DB_HOST, DB_USER, DB_PASSWORD.
+"""
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from stats_rollup import read_stats
+from storage import STORAGE_MYSQL, STORAGE_SQLITE
+
+TABLES = (
+    'stats_question_hits', 'stats_latency_bins', 'stats_rollups', 'pending_questions', 'user_questions',
+    'question_variants', 'standard_questions', 'answers', 'questions_groups',
+)
+
+
+def open_mysql():
+    from database import Database
+    db = Database(
+        os.getenv('DB_HOST', 'localhost'), os.getenv('DB_USER', ''),
+        os.getenv('DB_PASSWORD', ''), os.environ['TEST_MYSQL_DATABASE']
+    )
+    for table in TABLES:
+        assert db.execute_update(f"DELETE FROM {table}")
+    assert db.execute_update("UPDATE stats_state SET value = 0 WHERE name = 'rollup_last_id'")
+    return db
+
+
+@pytest.fixture(params=[
+    STORAGE_SQLITE,
+    pytest.param(STORAGE_MYSQL, marks=pytest.mark.skipif(
+        not os.getenv('TEST_MYSQL_DATABASE'), reason="TEST_MYSQL_DATABASE не задана")),
+])
+def db(request, tmp_path):
+    if request.param == STORAGE_SQLITE:
+        from sqlite_storage import SQLiteDatabase
+        storage = SQLiteDatabase(str(tmp_path / 'test.db'))
+    else:
+        storage = open_mysql()
+    yield storage
+    storage.close()
+
+
+def embedding(seed):
+    return np.random.default_rng(seed).standard_normal(384).astype(np.float32).tobytes()
+
+
+@pytest.fixture
+def knowledge_base(db):
+    group_id = db.insert_group('Помощь')
+    answer_id = db.insert_answer('Заполните анкету на сайте')
+    created = db.insert_standard_questions([
+        {'title': 'Как получить помощь?', 'group_id': group_id, 'answer_id': answer_id, 'intent': 'get_help',
+         'variants': [('как получить помощь', embedding(1)), ('нужна помощь', embedding(2))]},
+        {'title': 'Как стать волонтером?', 'group_id': group_id, 'answer_id': answer_id, 'intent': 'volunteer',
+         'variants': [('хочу стать волонтером', embedding(3))]},
+    ])
+    return {'group_id': group_id, 'answer_id': answer_id, 'questions': created}
+
+
+def log_question(db, text, standard_question_id=None, is_found=False):
+    return db.log_user_question(
+        session_id='s1', client_id='c1', raw_question=text, normalized_text=text.lower(),
+        embedding=embedding(len(text)), is_found=is_found, response_time_ms=12,
+        standard_question_id=standard_question_id, confidence=0.5
+    )
+
+
+def test_knowledge_base_round_trip(db, knowledge_base):
+    assert [row['name'] for row in db.get_question_groups()] == ['Помощь']
+    assert db.get_answer_text(knowledge_base['answer_id']) == 'Заполните анкету на сайте'
+    assert db.get_answer_text(knowledge_base['answer_id'] + 100) is None
+    assert db.get_all_answers() == [{'id': knowledge_base['answer_id'], 'text': 'Заполните анкету на сайте'}]
+
+    (help_id, help_variants), (volunteer_id, _) = knowledge_base['questions']
+    assert len(help_variants) == 2
+    variants = sorted(db.get_all_variants(), key=lambda row: row['id'])
+    assert [row['std_question_id'] for row in variants] == [help_id, help_id, volunteer_id]
+    assert variants[0]['intent'] == 'get_help' and variants[0]['title'] == 'Как получить помощь?'
+    assert bytes(variants[2]['embedding']) == embedding(3)
+    texts = sorted((row['variant_text'], row['title']) for row in db.get_variant_texts())
+    assert texts == [('как получить помощь', 'Как получить помощь?'), ('нужна помощь', 'Как получить помощь?'),
+                     ('хочу стать волонтером', 'Как стать волонтером?')]
+
+    questions = db.get_standard_questions_by_ids([volunteer_id])
+    assert [row['title'] for row in questions] == ['Как стать волонтером?']
+    assert db.get_standard_questions_by_ids([]) == []
+    assert len(db.get_all_standard_questions()) == 2
+
+
+def test_single_and_batch_inserts(db):
+    assert db.insert_group('Один') is not None
+    assert db.insert_group('Один') is None  # имя группы уникально
+    group_ids = db.insert_groups([('Два', 'описание'), ('Три', None)])
+    assert len(group_ids) == 2 and group_ids[0] < group_ids[1]
+    answer_ids = db.insert_answers(['а', 'б'])
+    std_question_id = db.insert_standard_question('Вопрос', group_ids[0], answer_ids[0], None)
+    assert db.insert_question_variant('вариант', embedding(5), std_question_id) is True
+    assert len(db.insert_question_variants([('ещё', embedding(6), std_question_id)])) == 1
+    assert len(db.get_all_variants()) == 2
+
+
+def test_failed_batch_insert_is_atomic(db):
+    assert db.insert_groups([('Новая', None), ('Новая', None)]) is None
+    assert not db.get_question_groups()
+
+
+def test_user_questions_history(db, knowledge_base):
+    help_id = knowledge_base['questions'][0][0]
+    ids = [log_question(db, f'вопрос {i}', help_id if i % 2 else None, is_found=bool(i % 2)) for i in range(5)]
+    assert ids == sorted(ids) and len(set(ids)) == 5
+
+    # Ответы бота - не разметка: размечены только вопросы, обработанные оператором
+    assert db.get_labeled_user_questions(10) == []
+
+    page = db.get_user_questions_page(ids[1], 2)
+    assert [row['id'] for row in page] == ids[2:4]
+    assert isinstance(page[0]['created_at'], datetime)
+    future = datetime.now() + timedelta(days=1)
+    assert not db.get_user_questions_page(0, 10, start=future)
+    assert len(db.get_user_questions_page(0, 10, end=future)) == 5
+
+    # Свежие строки не обгоняют водяной знак статистики
+    assert not db.get_user_questions_after(0, 10, lag_seconds=3600)
+    assert [row['id'] for row in db.get_user_questions_after(ids[2], 10, lag_seconds=-60)] == ids[3:]
+
+    # Отложенная запись (из спула) сохраняет исходное время вопроса
+    asked_at = datetime(2026, 1, 5, 10, 30)
+    late_id = db.log_user_question('s1', 'c1', 'поздний', 'поздний', None, False, 5, created_at=asked_at)
+    assert [(row['id'], row['created_at']) for row in db.get_user_questions_page(ids[-1], 10)] == [(late_id, asked_at)]
+    # Старая строка с большим id не уводит водяной знак за еще не готовые свежие
+    assert not db.get_user_questions_after(ids[2], 10, lag_seconds=3600)
+    assert [row['id'] for row in db.get_user_questions_after(ids[-1], 10, lag_seconds=3600)] == [late_id]
+
+
+def test_pending_queue(db):
+    first = db.log_pending_question(log_question(db, 'где отчет'))
+    second = db.log_pending_question(log_question(db, 'как сделать пожертвование'))
+
+    pending = db.get_pending_with_embeddings()
+    assert [row['pending_id'] for row in pending] == [first, second]
+    assert pending[0]['hit_count'] == 1 and isinstance(pending[0]['last_seen_at'], datetime)
+    assert [row['pending_id'] for row in db.get_pending_with_embeddings(limit=1)] == [first]
+
+    assert db.touch_pending(second) is True
+    assert db.touch_pending(second) is True
+    frequent = db.get_pending_page(order='frequent')
+    assert [(row['pending_id'], row['hit_count']) for row in frequent] == [(second, 3), (first, 1)]
+    last = frequent[0]
+    assert [row['pending_id'] for row in db.get_pending_page(after=(last['hit_count'], last['pending_id']),
+                                                           order='frequent')] == [first]
+    assert [row['pending_id'] for row in db.get_pending_page(order='recent', pending_ids=[first])] == [first]
+
+
+def test_resolve_pending(db, knowledge_base):
+    help_id = knowledge_base['questions'][0][0]
+    question_id = log_question(db, 'нужна срочная помощь')
+    pending_id = db.log_pending_question(question_id)
+    other_id = db.log_pending_question(log_question(db, 'другое'))
+    log_question(db, 'как получить помощь', standard_question_id=help_id, is_found=True)  # ответ бота
+
+    assert db.resolve_pending([pending_id], standard_question_id=help_id, operator_notes='добавлен вариант')
+    assert db.touch_pending(pending_id) is False  # уже обработан
+    assert [row['pending_id'] for row in db.get_pending_with_embeddings()] == [other_id]
+    resolved = db.get_pending_page(only_unprocessed=False, pending_ids=[pending_id])
+    assert resolved[0]['processed'] and resolved[0]['matched_question'] == 'Как получить помощь?'
+    assert [row['id'] for row in db.get_labeled_user_questions(10)] == [question_id]
+    assert db.resolve_pending([]) is True
+
+
+def test_stats_rollup_accumulates(db, knowledge_base):
+    help_id = knowledge_base['questions'][0][0]
+    hour = datetime(2026, 10, 19, 14)
+    assert db.get_stats_watermark() == 0
+
+    batch = ([('hour', hour, 3, 2, 1.5, 2)], [('hour', hour, 5, 3)], [('hour', hour, help_id, 2)])
+    assert db.apply_stats_rollup(0, 10, *batch) is True
+    assert db.apply_stats_rollup(0, 10, *batch) is False  # та же пачка второй раз не учитывается
+    assert db.apply_stats_rollup(10, 20, *batch) is True
+    assert db.get_stats_watermark() == 20
+
+    rollups = db.get_stats_rollups('hour', hour, hour + timedelta(hours=1))
+    assert len(rollups) == 1 and rollups[0]['bucket_start'] == hour
+    assert (rollups[0]['queries'], rollups[0]['found'], rollups[0]['confidence_count']) == (6, 4, 4)
+    bins = db.get_stats_latency_bins('hour', hour, hour + timedelta(hours=1))
+    assert [(row['bin'], row['count']) for row in bins] == [(5, 6)]
+    assert not db.get_stats_rollups('hour', hour + timedelta(hours=1), hour + timedelta(hours=2))
+
+    top = db.get_stats_top_questions('hour', hour, hour + timedelta(days=1), 5)
+    assert top[0]['standard_question_id'] == help_id and int(top[0]['hits']) == 4
+    intents = db.get_stats_top_intents('hour', hour, hour + timedelta(days=1), 5)
+    assert [(row['intent'], int(row['hits'])) for row in intents] == [('get_help', 4)]
+
+    # Границы с часовым поясом переводятся в местное время агрегатов
+    utc_hour = hour.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    stats = read_stats(db, 'hour', start=utc_hour, end=(hour + timedelta(hours=1)).isoformat())
+    assert [row['queries'] for row in stats['series']] == [6]
+
+
+def test_bulk_load_replace(db, knowledge_base):
+    loaded = db.bulk_load([
+        ('questions_groups', ['id', 'name', 'description'], [(7, 'Снимок', None)]),
+        ('answers', ['id', 'answer_text'], [(8, 'ответ')]),
+        ('standard_questions', ['id', 'title', 'group_id', 'answer_id', 'intent'], [(9, 'Вопрос', 7, 8, 'x')]),
+        ('question_variants', ['id', 'variant_text', 'standard_question_id', 'embedding'],
+         [(10, 'вариант', 9, embedding(7))]),
+    ], replace=True)
+    assert loaded == {'questions_groups': 1, 'answers': 1, 'standard_questions': 1, 'question_variants': 1}
+    assert [(row['id'], row['std_question_id']) for row in db.get_all_variants()] == [(10, 9)]
+    assert db.execute_query("SELECT COUNT(*) AS count FROM question_variants")[0]['count'] == 1
+
+
+def test_concurrent_writes(db):
+    ids = []
+    lock = threading.Lock()
+
+    def worker(n):
+        for i in range(25):
+            question_id = log_question(db, f'поток {n} вопрос {i}')
+            pending_id = db.log_pending_question(question_id)
+            db.touch_pending(pending_id)
+            with lock:
+                ids.append(question_id)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(ids)) == 200 and None not in ids
+    pending = db.get_pending_with_embeddings()
+    assert len(pending) == 200 and {row['hit_count'] for row in pending} == {2}
+    assert sum(1 for _ in db.iter_query("SELECT id FROM user_questions", batch_size=7)) == 200
@@ -18,4 +18,40 @@ def blob_to_array(blob):
         return np.frombuffer(blob, dtype=np.float32)
     except Exception as e:
         logger.error(f"Ошибка конвертации BLOB в массив: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+# Форматы хранения эмбеддинга запроса в user_questions.embedding
+QUERY_EMBEDDING_FLOAT32 = 'float32'
+QUERY_EMBEDDING_INT8 = 'int8'    # 4 байта масштаба + int8 коды: в 4 раза меньше float32
+QUERY_EMBEDDING_NONE = 'none'    # эмбеддинг не сохраняется
+QUERY_EMBEDDING_STORAGES = (QUERY_EMBEDDING_FLOAT32, QUERY_EMBEDDING_INT8, QUERY_EMBEDDING_NONE)
+
+def query_embedding_to_blob(embedding, storage=QUERY_EMBEDDING_FLOAT32):
+    """Упаковывает эмбеддинг запроса в выбранном формате (None для 'none')"""
+    if storage == QUERY_EMBEDDING_NONE:
+        return None
+    vector = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+    if storage == QUERY_EMBEDDING_INT8:
+        from search_index import quantize_int8  # отложенный импорт: search_index импортирует utils
+        codes, scales = quantize_int8(vector)
+        return scales.tobytes() + codes.tobytes()
+    return array_to_blob(vector[0])
+
+def query_blob_to_array(blob, dim=384):
+    """Распаковывает эмбеддинг запроса любого формата; None, если его нет или он поврежден"""
+    if not blob:
+        return None
+    if len(blob) == dim * 4:
+        return np.frombuffer(blob, dtype=np.float32)
+    if len(blob) == dim + 4:
+        scale = np.frombuffer(blob[:4], dtype=np.float32)[0]
+        return np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * scale
+    return None
+
+def query_blobs_to_matrix(blobs, dim=384):
+    """Собирает эмбеддинги запросов в матрицу; возвращает (матрица, номера пригодных строк)"""
+    arrays = [query_blob_to_array(blob, dim) for blob in blobs]
+    valid = [i for i, array in enumerate(arrays) if array is not None]
+    if not valid:
+        return np.zeros((0, dim), dtype=np.float32), valid
+    return np.vstack([arrays[i] for i in valid]).astype(np.float32, copy=False), valid